@@ -0,0 +1,253 @@
+"""Synthetic monorepo generator used by the benchmarks."""
+
+import os
+import subprocess
+
+CHART_YAML = """\
+apiVersion: v2
+name: {name}
+version: 1.0.{patch}
+"""
+
+VALUES_YAML = """\
+replicaCount: {replicas}
+image:
+  repository: example/{name}
+  tag: latest
+"""
+
+DEPLOYMENT_YAML = """\
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: {{{{ .Release.Name }}}}
+spec:
+  replicas: {{{{ .Values.replicaCount }}}}
+"""
+
+DEPLOYMENT_TEST_YAML = """\
+suite: test deployment
+templates:
+  - deployment.yaml
+tests:
+  - it: should be a Deployment
+    asserts:
+      - isKind:
+          of: Deployment
+"""
+
+SCRIPT_SH = """\
+#!/bin/sh
+echo "{name} {revision}"
+"""
+
+SCRIPT_BATS = """\
+@test "{name}" {{
+    [ 1 -eq 1 ]
+}}
+"""
+
+# Conventional Commits types used for the generated commit messages.
+COMMIT_TYPES = ("fix", "feat", "chore", "docs", "perf", "refactor")
+
+
+class MonorepoSpec:
+    """Size of the generated repository."""
+
+    def __init__(
+        self,
+        charts=10,
+        version_dirs=10,
+        scripts=10,
+        main_commits=50,
+        branch_commits=10,
+        refs=0,
+    ):
+        self.charts = charts
+        self.version_dirs = version_dirs
+        self.scripts = scripts
+        self.main_commits = main_commits
+        self.branch_commits = branch_commits
+        self.refs = refs
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _git(path, *args):
+    subprocess.run(
+        ("git", "-C", path) + args,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        env=_git_env(),
+    )
+
+
+def _git_env():
+    # Don't let the outer repository (e.g. when running from a git hook) or
+    # the user config leak into the generated repository.
+    env = {k: v for k, v in os.environ.items() if not k.startswith("GIT_")}
+    env.update(
+        {
+            "GIT_AUTHOR_NAME": "Benchmark",
+            "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+            "GIT_COMMITTER_NAME": "Benchmark",
+            "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+            "GIT_CONFIG_NOSYSTEM": "1",
+        }
+    )
+
+    return env
+
+
+def _create_refs(path, count):
+    """Create ``count`` packed refs (tags and branches of the `origin`
+    remote) pointing to the main branch."""
+    _git(path, "remote", "add", "origin", path)
+
+    lines = ["create refs/remotes/origin/main main\n"]
+
+    for i in range(count):
+        if i % 2:
+            lines.append("create refs/tags/tag-%06d main\n" % i)
+        else:
+            lines.append("create refs/remotes/origin/branch-%06d main\n" % i)
+
+    subprocess.run(
+        ("git", "-C", path, "update-ref", "--stdin"),
+        input="".join(lines).encode(),
+        check=True,
+        env=_git_env(),
+    )
+    _git(path, "pack-refs", "--all")
+
+
+def _write(root, rel_path, content):
+    path = os.path.join(root, rel_path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        f.write(content)
+
+    return rel_path
+
+
+def chart_name(i):
+    return "chart-%04d" % i
+
+
+def version_dir_name(i):
+    return "component-%04d" % i
+
+
+def script_name(i):
+    return "script-%04d" % i
+
+
+def _touch_file(spec, n):
+    """Return the path and content of the file modified by the n-th commit.
+    The files are picked round-robin from charts, version dirs and scripts."""
+    kinds = []
+
+    if spec.charts:
+        kinds.append("chart")
+
+    if spec.version_dirs:
+        kinds.append("version")
+
+    if spec.scripts:
+        kinds.append("script")
+
+    kind = kinds[n % len(kinds)]
+    i = (n // len(kinds)) % getattr(
+        spec, {"chart": "charts", "version": "version_dirs", "script": "scripts"}[kind]
+    )
+
+    if kind == "chart":
+        name = chart_name(i)
+
+        return (
+            "charts/%s/values.yaml" % name,
+            VALUES_YAML.format(name=name, replicas=n),
+        )
+
+    if kind == "version":
+        return ("%s/data.txt" % version_dir_name(i), "revision %d\n" % n)
+
+    name = script_name(i)
+
+    return ("scripts/%s.sh" % name, SCRIPT_SH.format(name=name, revision=n))
+
+
+def generate(path, spec):
+    """Generate a git repository at ``path``.
+
+    The `main` branch holds the initial layout plus ``spec.main_commits``
+    commits. ``spec.refs`` extra packed refs are created if requested. The
+    checked out `feature` branch adds ``spec.branch_commits`` Conventional
+    Commits on top of it. Returns the list of paths (relative to the repo
+    root) changed on the feature branch.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    _git(path, "init", "-q", "--initial-branch=main")
+    _git(path, "config", "commit.gpgsign", "false")
+
+    for i in range(spec.charts):
+        name = chart_name(i)
+        _write(
+            path, "charts/%s/Chart.yaml" % name, CHART_YAML.format(name=name, patch=0)
+        )
+        _write(
+            path,
+            "charts/%s/values.yaml" % name,
+            VALUES_YAML.format(name=name, replicas=1),
+        )
+        _write(path, "charts/%s/templates/deployment.yaml" % name, DEPLOYMENT_YAML)
+        _write(
+            path,
+            "charts/%s/tests/unittest/deployment_test.yaml" % name,
+            DEPLOYMENT_TEST_YAML,
+        )
+
+    for i in range(spec.version_dirs):
+        name = version_dir_name(i)
+        _write(path, "%s/.version" % name, "1.0.0\n")
+        _write(path, "%s/data.txt" % name, "revision 0\n")
+
+    for i in range(spec.scripts):
+        name = script_name(i)
+        _write(path, "scripts/%s.sh" % name, SCRIPT_SH.format(name=name, revision=0))
+        _write(path, "scripts/%s.bats" % name, SCRIPT_BATS.format(name=name))
+
+    _write(path, "README.md", "# Benchmark monorepo\n")
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "chore: initial layout")
+
+    for n in range(spec.main_commits):
+        rel_path, content = _touch_file(spec, n)
+        _write(path, rel_path, content)
+        _git(path, "commit", "-q", "-a", "-m", "chore: main commit %d" % n)
+
+    if spec.refs:
+        _create_refs(path, spec.refs)
+
+    _git(path, "checkout", "-q", "-b", "feature")
+
+    changed = set()
+
+    for n in range(spec.branch_commits):
+        rel_path, content = _touch_file(spec, spec.main_commits + n)
+        _write(path, rel_path, content)
+        _git(
+            path,
+            "commit",
+            "-q",
+            "-a",
+            "-m",
+            "%s: branch commit %d" % (COMMIT_TYPES[n % len(COMMIT_TYPES)], n),
+        )
+        changed.add(rel_path)
+
+    return sorted(changed)
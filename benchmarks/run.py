@@ -0,0 +1,325 @@
+"""Time the hook entry points against a synthetic monorepo.
+
+Usage::
+
+    python -m benchmarks.run --charts 200 --branch-commits 100 \
+        --output results.json --compare previous.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import MonorepoSpec, generate
+from hooks.common.cache import CACHE_DIR_NAME
+from hooks.common.results import BUMP_REQUIRED_STATUS
+
+# Root of this repository (used to make the `hooks` package importable by the
+# benchmarked processes).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stub binaries put first on the PATH so that helm-unittest and bats-run can
+# be timed without the real tools.
+STUB_BINARIES = ("helm", "bats")
+
+STUB_SCRIPT = "#!/bin/sh\nexit 0\n"
+
+# In-flight commit message used for the commit-msg stage cases.
+IN_FLIGHT_MESSAGE = "feat: in-flight change\n"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hooks against a synthetic monorepo."
+    )
+
+    defaults = MonorepoSpec()
+
+    parser.add_argument(
+        "--charts",
+        metavar="N",
+        type=int,
+        help="number of Helm charts (default: %(default)s)",
+        default=defaults.charts,
+    )
+    parser.add_argument(
+        "--version-dirs",
+        metavar="N",
+        type=int,
+        help="number of directories with a version file (default: %(default)s)",
+        default=defaults.version_dirs,
+    )
+    parser.add_argument(
+        "--scripts",
+        metavar="N",
+        type=int,
+        help="number of shell scripts with a bats file (default: %(default)s)",
+        default=defaults.scripts,
+    )
+    parser.add_argument(
+        "--main-commits",
+        metavar="N",
+        type=int,
+        help="number of commits on the main branch (default: %(default)s)",
+        default=defaults.main_commits,
+    )
+    parser.add_argument(
+        "--branch-commits",
+        metavar="N",
+        type=int,
+        help="number of commits on the feature branch (default: %(default)s)",
+        default=defaults.branch_commits,
+    )
+    parser.add_argument(
+        "--refs",
+        metavar="N",
+        type=int,
+        help="number of extra tags and remote branches (default: %(default)s)",
+        default=defaults.refs,
+    )
+    parser.add_argument(
+        "--repeat",
+        metavar="N",
+        type=int,
+        help="number of timed runs per case (default: %(default)s)",
+        default=3,
+    )
+    parser.add_argument(
+        "--case",
+        metavar="NAME",
+        help="run only the given case (can be repeated)",
+        action="append",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="write the results into a JSON file",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        help="compare the results with a previously written JSON file",
+    )
+    parser.add_argument(
+        "--keep",
+        help="don't remove the generated repository",
+        action="store_true",
+    )
+
+    return parser.parse_args()
+
+
+class CaseFailedError(Exception):
+    """The benchmarked entry point exited with an unexpected code."""
+
+
+def get_cases(changed):
+    """Return ``{name: (argv, returncode)}`` of the benchmarked entry points
+    with their expected exit codes. The versions are not incremented on the
+    generated branch so the version checks require a bump."""
+    commit_msg = os.path.join(".git", "COMMIT_EDITMSG")
+    conventional = ["--autofix-strategy=conventional", commit_msg]
+    bump = BUMP_REQUIRED_STATUS
+
+    return {
+        "check-version[fixed]": (["hooks.check_version"] + changed, bump),
+        "check-version[conventional]": (["hooks.check_version"] + conventional, bump),
+        "check-helm-version[fixed]": (["hooks.check_helm_version"] + changed, bump),
+        "check-helm-version[conventional]": (
+            ["hooks.check_helm_version"] + conventional,
+            bump,
+        ),
+        "helm-unittest": (["hooks.helm_unittest"] + changed, 0),
+        "bats-run": (["hooks.bats"] + changed, 0),
+    }
+
+
+def make_stub_bin(path):
+    """Create the stub binaries in ``path``."""
+    os.makedirs(path, exist_ok=True)
+
+    for name in STUB_BINARIES:
+        stub = os.path.join(path, name)
+
+        with open(stub, "w") as f:
+            f.write(STUB_SCRIPT)
+
+        os.chmod(stub, 0o755)
+
+
+def time_case(repo_dir, argv, env, repeat, cold, returncode=0):
+    """Run the entry point ``repeat`` times and return the timings.
+
+    In the cold mode, the hooks' cache directory is removed before each run.
+    Raises `CaseFailedError` if a run doesn't exit with ``returncode``.
+    """
+    runs = []
+
+    for _ in range(repeat):
+        if cold:
+            shutil.rmtree(
+                os.path.join(repo_dir, ".git", CACHE_DIR_NAME), ignore_errors=True
+            )
+
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-m"] + argv,
+            cwd=repo_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        runs.append(time.perf_counter() - start)
+
+        if result.returncode != returncode:
+            lines = result.stderr.decode(errors="replace").strip().splitlines()
+
+            raise CaseFailedError(
+                "exit code %d (expected %d)%s"
+                % (result.returncode, returncode, ": " + lines[-1] if lines else "")
+            )
+
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "runs": runs,
+        "returncode": returncode,
+    }
+
+
+def run_benchmarks(repo_dir, changed, repeat, only=None):
+    """Time all (or ``only`` the given) cases in the generated repository."""
+    stub_bin = os.path.join(os.path.dirname(repo_dir), "bin")
+    make_stub_bin(stub_bin)
+
+    env = {k: v for k, v in os.environ.items() if not k.startswith("GIT_")}
+    env["PATH"] = os.pathsep.join([stub_bin, env.get("PATH", "")])
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [ROOT, env.get("PYTHONPATH")] if p)
+    # Keep the tool probes and the job slots out of the user cache directory
+    env["XDG_CACHE_HOME"] = os.path.join(os.path.dirname(repo_dir), "cache")
+
+    with open(os.path.join(repo_dir, ".git", "COMMIT_EDITMSG"), "w") as f:
+        f.write(IN_FLIGHT_MESSAGE)
+
+    results = {}
+
+    for name, (argv, returncode) in get_cases(changed).items():
+        if only and name not in only:
+            continue
+
+        try:
+            results[name] = {
+                "cold": time_case(repo_dir, argv, env, repeat, True, returncode),
+                "warm": time_case(repo_dir, argv, env, repeat, False, returncode),
+            }
+        except CaseFailedError as e:
+            # Timings of a crashed or failed run are not valid samples
+            results[name] = {"error": str(e)}
+
+    return results
+
+
+def get_revision():
+    """Return the commit of this checkout (or None)."""
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def format_table(results, previous=None):
+    """Format the results (and the change against the previous ones)."""
+    lines = ["%-34s %10s %10s %10s" % ("case", "cold", "warm", "change")]
+
+    for name, result in results.items():
+        if "error" in result:
+            lines.append("%-34s FAILED: %s" % (name, result["error"]))
+
+            continue
+
+        cold = result["cold"]["median"]
+        warm = result["warm"]["median"]
+        change = ""
+
+        if previous and "cold" in previous.get(name, {}):
+            prev = previous[name]["cold"]["median"]
+
+            if prev:
+                change = "%+.1f%%" % ((cold - prev) / prev * 100)
+
+        lines.append("%-34s %9.3fs %9.3fs %10s" % (name, cold, warm, change))
+
+    return "\n".join(lines)
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+
+    spec = MonorepoSpec(
+        charts=args.charts,
+        version_dirs=args.version_dirs,
+        scripts=args.scripts,
+        main_commits=args.main_commits,
+        branch_commits=args.branch_commits,
+        refs=args.refs,
+    )
+
+    tmp_dir = tempfile.mkdtemp(prefix="hooks-benchmark-")
+    repo_dir = os.path.join(tmp_dir, "repo")
+
+    try:
+        start = time.perf_counter()
+        changed = generate(repo_dir, spec)
+        print(
+            "Generated %s in %.1fs" % (repo_dir, time.perf_counter() - start),
+            file=sys.stderr,
+        )
+
+        results = run_benchmarks(repo_dir, changed, args.repeat, args.case)
+    finally:
+        if not args.keep:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    previous = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    print(format_table(results, previous))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "timestamp": time.time(),
+                    "revision": get_revision(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "spec": spec.as_dict(),
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 1 if any("error" in result for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import logging
+import os
+
+from git import Repo
+
+from hooks import check_helm_version, check_version
+from hooks.common.conventional import ParsedCommitCache
+from hooks.common.errors import (
+    CommitMessageError,
+    FileReadError,
+    HookError,
+    MainBranchNotFoundError,
+    VersionError,
+)
+from hooks.common.git_helpers import (
+    deepen_to_merge_base,
+    find_main_branch,
+    unmerged_commit_shas,
+)
+from hooks.common.results import (
+    ACTION_AUTOFIX_FAILED,
+    ACTION_AUTOFIXED,
+    ACTION_BUMP_REQUIRED,
+    ACTION_NONE,
+    CheckResult,
+)
+from hooks.common.session_cache import SessionCache
+
+__all__ = [
+    "ACTION_AUTOFIX_FAILED",
+    "ACTION_AUTOFIXED",
+    "ACTION_BUMP_REQUIRED",
+    "ACTION_NONE",
+    "CheckResult",
+    "CommitMessageError",
+    "FileReadError",
+    "HookError",
+    "MainBranchNotFoundError",
+    "VersionChecker",
+    "VersionError",
+]
+
+# Kinds of the checked files: plain text version files (check-version) and
+# Chart.yaml files (check-helm-version).
+KINDS = ("version", "chart")
+
+
+class VersionChecker:
+    """Checker of the version files of a repository against its main branch
+    for the use in long-lived processes (IDE plugins, CI bots, ...).
+
+    The repo is opened once and the main branch versions are read once for
+    all checked files. HEAD and the main branch are resolved again on every
+    check and the cached data are replaced once any of them moves. The checks
+    return `CheckResult` objects and raise `HookError` instead of exiting the
+    process.
+    """
+
+    def __init__(
+        self,
+        path=".",
+        kind="version",
+        branch="main",
+        remote="origin",
+        version_file=".version",
+        deepen=True,
+        cache=True,
+        log=None,
+    ):
+        if kind not in KINDS:
+            raise ValueError(
+                "Unknown kind '%s' (choose from %s)" % (kind, ", ".join(KINDS))
+            )
+
+        self.kind = kind
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.repo = Repo(path, search_parent_directories=True)
+        self.branch = branch
+        self.remote = remote
+        self.version_file = version_file
+        self.deepen = deepen
+        self.cache = cache
+        self.state = None
+        self.deepened = False
+        self.session = None
+        self.snapshot = None
+        self.commit_cache = None
+
+        if kind == "chart":
+            self.file_name = "Chart.yaml"
+            self.yaml = check_helm_version.get_yaml()
+        else:
+            self.file_name = version_file
+            self.yaml = None
+
+        if cache:
+            self.commit_cache = ParsedCommitCache.open(self.repo.common_dir, self.log)
+
+        self._refresh()
+
+        if self.commit_cache is not None:
+            self.commit_cache.prune_if_due(
+                lambda: unmerged_commit_shas(self.repo, self.main_branch)
+            )
+
+    def _refresh(self):
+        """Resolve HEAD and the main branch and replace the session cache and
+        the snapshot if any of them moved since the last check."""
+        main_branch = find_main_branch(self.repo, self.branch, self.remote, self.log)
+
+        try:
+            head_sha = self.repo.head.commit.hexsha
+        except ValueError:
+            head_sha = None
+
+        state = (head_sha, main_branch.commit.hexsha)
+
+        if state == self.state:
+            return
+
+        self.state = state
+        self.main_branch = main_branch
+        self.deepened = False
+
+        current_branch = self.repo.head
+
+        if self.session is not None:
+            self.session.save()
+
+        self.session = SessionCache(
+            self.repo, main_branch, current_branch, self.log, enabled=self.cache
+        )
+
+        if not self.cache:
+            return
+
+        if self.kind == "chart":
+            self.snapshot = check_helm_version.open_snapshot(
+                self.repo, main_branch, self.log
+            )
+        else:
+            self.snapshot = check_version.open_snapshot(
+                self.repo, main_branch, self.version_file, self.log
+            )
+
+    def _rel_path(self, path):
+        """Return the path of the version file relative to the working tree.
+        The path is either the file or its directory, relative to the working
+        tree or absolute."""
+        path = os.path.join(self.repo.working_tree_dir, path)
+
+        if os.path.isdir(path):
+            path = os.path.join(path, self.file_name)
+
+        return os.path.relpath(path, start=self.repo.working_tree_dir)
+
+    def check_fixed(self, path, autofix=False, autofix_portion="patch"):
+        """Check that the version was incremented. With ``autofix``, the
+        ``autofix_portion`` of the main branch version is incremented."""
+        self._refresh()
+
+        path = self._rel_path(path)
+
+        if self.kind == "chart":
+            return check_helm_version.check_fixed(
+                self.yaml,
+                self.session,
+                self.snapshot,
+                path,
+                autofix,
+                autofix_portion,
+                self.log,
+            )
+
+        return check_version.check_fixed(
+            self.session, self.snapshot, path, autofix, autofix_portion, self.log
+        )
+
+    def check_conventional(self, path, message=None, autofix=False, strict=False):
+        """Check that the version was incremented as the Conventional Commits
+        messages since the main branch (and the in-flight ``message``)
+        require."""
+        self._refresh()
+
+        # Shallow clones (e.g. in CI) need the history down to the merge base
+        # for the commit walk
+        if self.deepen and not self.deepened:
+            deepen_to_merge_base(
+                self.repo, self.main_branch, self.repo.head, self.remote, self.log
+            )
+
+            self.deepened = True
+
+        path = self._rel_path(path)
+        args = (
+            self.session,
+            self.snapshot,
+            path,
+            os.path.dirname(path),
+            message,
+            self.commit_cache,
+            autofix,
+            strict,
+            self.log,
+        )
+
+        if self.kind == "chart":
+            return check_helm_version.check_conventional(self.yaml, *args)
+
+        return check_version.check_conventional(*args)
+
+    def close(self):
+        """Store the session cache and close the commit cache."""
+        self.session.save()
+
+        if self.commit_cache is not None:
+            self.commit_cache.close()
+            self.commit_cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
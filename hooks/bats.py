@@ -1,9 +1,25 @@
 import argparse
 import logging
+import re
 import subprocess
 import sys
+import time
 from pathlib import Path
 
+from hooks.common.history import DurationHistory, get_common_dir
+from hooks.common.jobserver import job_slot
+from hooks.common.metrics import enable_metrics, inc, metered
+from hooks.common.probes import probe
+from hooks.common.profiling import enable_profiling, phase, profiled
+from hooks.common.shell_graph import ShellIndex, find_affected_files
+from hooks.common.sharding import (
+    add_shard_arguments,
+    load_durations,
+    select_shard,
+    write_shard_report,
+)
+from hooks.common.watch import iter_changes, open_watcher
+
 
 def parse_args():
     """Parse command line arguments."""
@@ -25,6 +41,52 @@ def parse_args():
         ),
         default="{name}.bats",
     )
+    parser.add_argument(
+        "--no-dependents",
+        help=(
+            "run only the companion bats files of the changed scripts, not the "
+            "bats files of the scripts sourcing them"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-history",
+        help=(
+            "don't record the test durations and outcomes and don't order the "
+            "tests by them"
+        ),
+        action="store_true",
+    )
+    add_shard_arguments(parser)
+    parser.add_argument(
+        "--watch",
+        help=(
+            "watch the scripts and re-run the bats files affected by every "
+            "change until interrupted"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "add the run metrics into a Prometheus textfile collector file "
+            "(OpenMetrics if FILE ends with .om)"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the wall and CPU time spent in each phase of the run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help=(
+            "write the profile into FILE (JSON with the phases if FILE ends "
+            "with .json, cProfile stats otherwise)"
+        ),
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -71,33 +133,134 @@ def resolve_pattern(pattern, sh_path, root):
     return candidate.resolve()
 
 
+def find_bats_files(files, pattern, root, log):
+    """
+    Find the companion bats files of the changed shell scripts.
+
+    Args:
+        files: list of changed file paths
+        pattern: template for the companion bats file location
+        root: absolute Path of the config root
+        log: Logger instance
+
+    Returns:
+        List of existing bats file Paths in the order of the files,
+        without duplicates.
+    """
+    seen = set()
+    bats_files = []
+
+    for file_path in files:
+        sh_path = Path(file_path)
+        if sh_path.suffix != ".sh":
+            log.debug(f"Skipping non-.sh file: {sh_path}")
+            continue
+
+        bats_path = resolve_pattern(pattern, sh_path, root)
+        log.debug(f"Resolved {sh_path} -> {bats_path}")
+
+        if not bats_path.is_file():
+            log.debug(f"No companion bats file at: {bats_path}")
+            continue
+
+        if bats_path in seen:
+            log.debug(f"Already queued: {bats_path}")
+            continue
+
+        seen.add(bats_path)
+        bats_files.append(bats_path)
+
+    return bats_files
+
+
 def check_bats_available():
-    """Check if the bats binary is available on PATH."""
+    """
+    Check if the bats binary is available on PATH.
+
+    Returns:
+        The output of `bats --help` (which starts with the version) or None
+        if bats is not available.
+    """
     try:
-        subprocess.run(
-            ["bats", "--version"],
+        result = subprocess.run(
+            ["bats", "--help"],
             capture_output=True,
             text=True,
             check=True,
         )
-        return True
     except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+        return None
+    return result.stdout
+
 
+def parse_bats_help(output):
+    """
+    Parse the version and the capabilities of bats from `bats --help`.
+
+    Args:
+        output: Output of `bats --help`
 
-def run_bats(bats_file, log):
+    Returns:
+        Dict with the `version`, the supported `formatters` and whether the
+        `--timing` option is supported.
+    """
+    m = re.search(r"Bats (\d+(?:\.\d+)+)", output)
+    # The list of the formatters continues up to the next option
+    formatters = re.search(r"formatters?:(.*(?:\n(?!\s*-).*)*)", output)
+    return {
+        "version": m.group(1) if m else None,
+        "formatters": (
+            re.findall(r"(?:^|,)\s*(\w+)", formatters.group(1)) if formatters else []
+        ),
+        "timing": "--timing" in output,
+    }
+
+
+def probe_bats():
+    """Return the info about bats or None if it's not available."""
+    output = check_bats_available()
+    if output is None:
+        return None
+    return parse_bats_help(output)
+
+
+def get_bats_info():
+    """Return the info about bats (`version`, `formatters` and `timing`) or
+    None if it's not available. The result is cached until the bats binary
+    changes."""
+    return probe("bats", "bats", probe_bats)
+
+
+def run_bats(bats_file, log, timing=True, history=None):
     """
     Run bats on a single bats file.
 
     Args:
         bats_file: Path to the .bats file to run
         log: Logger instance
+        timing: Whether to print the duration of each test (`--timing` is
+            not supported by old bats versions)
+        history: DurationHistory recording the outcome (and the duration of
+            a completed run) of the bats file
 
     Returns:
         True if the tests passed, False otherwise.
     """
     log.info(f"Running bats: {bats_file}")
-    result = subprocess.run(["bats", "--pretty", "--timing", str(bats_file)])
+    cmd = ["bats", "--pretty"]
+    if timing:
+        cmd.append("--timing")
+    start = time.perf_counter()
+    with job_slot(), phase("subprocess"):
+        result = subprocess.run(cmd + [str(bats_file)])
+    if history is not None:
+        # bats exits with 1 if a test failed, other codes (e.g. a signal)
+        # mean that not all tests ran
+        history.record(
+            bats_file,
+            time.perf_counter() - start if result.returncode in (0, 1) else None,
+            result.returncode == 0,
+        )
     if result.returncode == 0:
         log.debug(f"✓ bats passed for: {bats_file}")
         return True
@@ -105,58 +268,218 @@ def run_bats(bats_file, log):
     return False
 
 
+def select_bats_files(files, pattern, root, index, log):
+    """
+    Select the bats files to run for the changed files.
+
+    Args:
+        files: list of changed file paths
+        pattern: template for the companion bats file location
+        root: absolute Path of the config root
+        index: ShellIndex of the scripts sourcing the changed files or None
+            to run only the companion bats files of the changed scripts
+        log: Logger instance
+
+    Returns:
+        List of existing bats file Paths without duplicates.
+    """
+    # Scripts and bats files sourcing (loading) the changed files are affected
+    # by the change as well
+    if index is not None:
+        with phase("dependency graph"):
+            files = sorted(find_affected_files(files, root, log, index=index))
+
+    with phase("path discovery"):
+        bats_files = find_bats_files(files, pattern, root, log)
+
+        if index is not None:
+            bats_files += [
+                path
+                for path in (Path(f).resolve() for f in files if f.endswith(".bats"))
+                if path not in bats_files and path.is_file()
+            ]
+
+    return bats_files
+
+
+def get_watch_roots(root, index):
+    """
+    Return the directories to watch for the changes of the shell scripts and
+    bats files and of the files they source.
+
+    Args:
+        root: absolute Path of the config root
+        index: updated ShellIndex of the scripts
+
+    Returns:
+        Tuple of the sorted top directories (relative to the root) watched
+        with their subdirectories and of the sorted directories watched
+        without them (the root for the files directly in it and the
+        directories of the sourced files outside of the root)
+    """
+    paths = [root / rel_path for rel_path in index.files]
+    paths += [Path(p) for p in index.get_dependents()]
+    roots = set()
+    shallow_roots = set()
+
+    for path in paths:
+        try:
+            parts = path.relative_to(root).parts
+        except ValueError:
+            shallow_roots.add(str(path.parent))
+
+            continue
+
+        if len(parts) > 1:
+            roots.add(parts[0])
+        else:
+            shallow_roots.add(".")
+
+    if not roots and not shallow_roots:
+        shallow_roots.add(".")
+
+    return sorted(roots), sorted(shallow_roots)
+
+
+def watch(args, root, index, log, timing=True):
+    """
+    Re-run the bats files affected by the changed files on every change until
+    interrupted. The shell index is kept in memory between the runs. Only the
+    directories of the indexed files are watched (see `get_watch_roots`).
+
+    Args:
+        args: Parsed command line arguments
+        root: absolute Path of the config root
+        index: ShellIndex of the scripts or None
+        log: Logger instance
+        timing: Whether bats supports the `--timing` option
+
+    Returns:
+        Exit code (0 once interrupted)
+    """
+    with phase("dependency graph"):
+        roots_index = index if index is not None else ShellIndex(root, log)
+        roots_index.update()
+
+    roots, shallow_roots = get_watch_roots(root, roots_index)
+    watcher = open_watcher(roots, log, shallow_roots)
+
+    log.info(
+        f"Watching {', '.join(roots + shallow_roots)} for changes "
+        "(press Ctrl+C to stop)"
+    )
+
+    try:
+        for changed in iter_changes(watcher):
+            bats_files = select_bats_files(
+                sorted(changed), args.pattern, root, index, log
+            )
+
+            if not bats_files:
+                continue
+
+            failed = [f for f in bats_files if not run_bats(f, log, timing)]
+
+            if failed:
+                log.error(f"{len(failed)} of {len(bats_files)} bats file(s) failed:")
+                for bats_file in failed:
+                    log.error(f"  - {bats_file}")
+            else:
+                log.info(f"All {len(bats_files)} bats file(s) passed")
+
+            log.info("Waiting for changes...")
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
+    finally:
+        watcher.close()
+
+    return 0
+
+
+@metered("bats-run")
+@profiled
 def main():
     """Main function."""
-    args = parse_args()
+    with phase("parse args"):
+        args = parse_args()
+
+    enable_profiling(args.profile, args.profile_output)
+    enable_metrics(args.metrics_file)
     log = get_logger(args.debug)
 
     log.debug(f"Arguments: {args}")
 
     # If no files are provided, exit successfully.
-    if not args.files:
+    if not args.files and not args.watch:
         log.info("No files provided, nothing to check")
         return 0
 
-    if not check_bats_available():
+    with phase("tool probe"):
+        info = get_bats_info()
+
+    if info is None:
         log.error("bats is not available on PATH")
         log.error("Please install bats-core: https://github.com/bats-core/bats-core")
         return 1
 
+    log.debug(f"bats version: {info['version']}")
+    log.debug(f"bats formatters: {', '.join(info.get('formatters', []))}")
+    timing = info.get("timing", True)
+
     root = Path.cwd()
     log.debug(f"Root: {root}")
 
-    seen = set()
-    bats_files = []
-
-    for file_path in args.files:
-        sh_path = Path(file_path)
-        if sh_path.suffix != ".sh":
-            log.debug(f"Skipping non-.sh file: {sh_path}")
-            continue
-
-        bats_path = resolve_pattern(args.pattern, sh_path, root)
-        log.debug(f"Resolved {sh_path} -> {bats_path}")
+    with phase("repo open"):
+        common_dir = get_common_dir()
 
-        if not bats_path.is_file():
-            log.debug(f"No companion bats file at: {bats_path}")
-            continue
+    index = None if args.no_dependents else ShellIndex(root, log, common_dir)
 
-        if bats_path in seen:
-            log.debug(f"Already queued: {bats_path}")
-            continue
+    if args.watch:
+        return watch(args, root, index, log, timing)
 
-        seen.add(bats_path)
-        bats_files.append(bats_path)
+    bats_files = select_bats_files(args.files, args.pattern, root, index, log)
 
     if not bats_files:
         log.info("No bats companion files found for the given scripts")
         return 0
 
+    if args.shard:
+        bats_files = select_shard(
+            bats_files,
+            args.shard,
+            root,
+            load_durations(args.shard_durations, log),
+            log,
+        )
+
+    # Previously failed items first
+    with phase("history"):
+        history = DurationHistory(
+            "bats-run", root, log, None if args.no_history else common_dir
+        )
+
+    bats_files = history.order(bats_files)
+
+    inc("items_total", len(bats_files), kind="bats_file")
+
     failed = []
     for bats_file in bats_files:
-        if not run_bats(bats_file, log):
+        success = run_bats(bats_file, log, timing, history)
+        inc("tests_total", kind="bats_file", result="passed" if success else "failed")
+        if not success:
             failed.append(bats_file)
 
+    with phase("history"):
+        history.save()
+
+    if args.shard_report:
+        write_shard_report(
+            args.shard_report,
+            args.shard,
+            {f: history.durations.get(f) for f in bats_files},
+            root,
+        )
+
     if failed:
         log.error(f"{len(failed)} of {len(bats_files)} bats file(s) failed:")
         for bats_file in failed:
@@ -0,0 +1,227 @@
+import argparse
+import logging
+import re
+import sys
+import time
+
+from identify.identify import tags_from_path
+
+from hooks import bats, check_helm_version, check_version, helm_unittest
+from hooks.common.shared import shared_scope
+
+# Hooks run by check-all (in this order) with the file filters of their
+# definitions in `.pre-commit-hooks.yaml`. The file isn't installed with the
+# package so the filters are kept in sync by the check_all tests.
+HOOKS = {
+    "check-helm-version": {
+        "module": check_helm_version,
+        "files": (
+            r"^((helper-|)charts/[^/]+/(\.kubeconform|\.helmignore|"
+            r"templates/NOTES.txt|.*\.(ya?ml|json|tpl))|"
+            r"\.git/(COMMIT_EDITMSG|MERGE_MSG|SQUASH_MSG))$"
+        ),
+        "always_run": True,
+    },
+    "helm-unittest": {
+        "module": helm_unittest,
+        "files": (
+            r"^(helper-|)charts/[^/]+/(Chart\.ya?ml|values.*\.ya?ml|"
+            r"templates/.*\.(ya?ml|tpl)|tests/.*\.ya?ml)$"
+        ),
+    },
+    "check-version": {
+        "module": check_version,
+        "files": r"^.*$",
+    },
+    "bats": {
+        "module": bats,
+        "types": ["shell"],
+    },
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run the check-version, check-helm-version, helm-unittest and bats "
+            "hooks in a single process."
+        )
+    )
+
+    parser.add_argument(
+        "--hooks",
+        metavar="LIST",
+        help="comma-separated list of the hooks to run (default: %(default)s)",
+        default=",".join(HOOKS),
+    )
+
+    for hook_id in HOOKS:
+        parser.add_argument(
+            "--%s-arg" % hook_id,
+            metavar="ARG",
+            help=(
+                "argument passed to the %s hook (can be used multiple times, "
+                "use the --%s-arg=--option form for options)" % (hook_id, hook_id)
+            ),
+            dest="hook_args_%s" % hook_id.replace("-", "_"),
+            action="append",
+            default=[],
+        )
+
+    parser.add_argument(
+        "-d",
+        "--debug",
+        help="enable debug output in all hooks",
+        action="store_true",
+    )
+    parser.add_argument(
+        "PATH",
+        help="paths to check (provided by pre-commit)",
+        nargs="*",
+    )
+
+    # Parse args
+    args = parser.parse_args()
+
+    args.hooks = [h.strip() for h in args.hooks.split(",") if h.strip()]
+
+    for hook_id in args.hooks:
+        if hook_id not in HOOKS:
+            parser.error(
+                "unknown hook '%s' (choose from %s)" % (hook_id, ", ".join(HOOKS))
+            )
+
+    return args
+
+
+def get_logger(debug):
+    if debug:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    format = "[%(asctime)s] %(levelname)s: %(message)s"
+
+    logging.basicConfig(level=level, format=format)
+
+    log = logging.getLogger(__name__)
+
+    return log
+
+
+def get_tags(path):
+    """Return the identify tags of the file (empty for missing files)."""
+    try:
+        return tags_from_path(path)
+    except ValueError:
+        return set()
+
+
+def filter_files(hook, paths):
+    """Return the paths the hook would be run with by pre-commit."""
+    files_re = re.compile(hook.get("files", ""))
+    types = set(hook.get("types", []))
+
+    return [p for p in paths if files_re.search(p) and types <= get_tags(p)]
+
+
+def run_hook(hook_id, hook, args, log):
+    """Run the entry point of the hook with the given arguments and return its
+    exit code."""
+    argv = sys.argv
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    level = root.level
+
+    # The hooks parse their arguments from sys.argv
+    sys.argv = [hook_id] + args
+
+    # The hooks configure the root logger from their own arguments (e.g.
+    # --debug) which is a no-op once it has handlers
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    try:
+        status = hook["module"].main()
+    except SystemExit as e:
+        status = e.code
+    except Exception:
+        log.exception("Hook %s failed" % hook_id)
+
+        status = 1
+    finally:
+        sys.argv = argv
+
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+
+        for handler in handlers:
+            root.addHandler(handler)
+
+        root.setLevel(level)
+
+    if status is None:
+        return 0
+
+    if not isinstance(status, int):
+        log.error(status)
+
+        return 1
+
+    return status
+
+
+def main():
+    # Parse args
+    args = parse_args()
+
+    # Get logger
+    log = get_logger(args.debug)
+
+    results = []
+
+    # The hooks share the repo, the main branch and the session cache
+    with shared_scope():
+        for hook_id in args.hooks:
+            hook = HOOKS[hook_id]
+            files = filter_files(hook, args.PATH)
+
+            if not files and not hook.get("always_run", False):
+                results.append((hook_id, None, 0))
+
+                continue
+
+            hook_args = getattr(args, "hook_args_%s" % hook_id.replace("-", "_"))
+
+            if args.debug:
+                hook_args = hook_args + ["--debug"]
+
+            log.info("Running %s" % hook_id)
+
+            start = time.perf_counter()
+            status = run_hook(hook_id, hook, hook_args + files, log)
+
+            results.append((hook_id, status, time.perf_counter() - start))
+
+    final_status = 0
+
+    log.info("Summary:")
+
+    for hook_id, status, duration in results:
+        if status is None:
+            log.info("  %s: Skipped (no files to check)" % hook_id)
+        elif status == 0:
+            log.info("  %s: Passed (%.2fs)" % (hook_id, duration))
+        else:
+            log.error(
+                "  %s: Failed with exit code %d (%.2fs)" % (hook_id, status, duration)
+            )
+
+        if final_status == 0 and status:
+            final_status = status
+
+    sys.exit(final_status)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import argparse
+import itertools
 import logging
 import os
 import semver
@@ -7,17 +8,31 @@ from ruamel.yaml import YAML
 
 from git import Repo
 
-from hooks.common.conventional import bump_from_messages
-from hooks.common.get_file_content import (
-    get_file_content,
-    get_local_file_content,
+from hooks.common.baseline import BaselineSnapshot
+from hooks.common.conventional import ParsedCommitCache, bump_from_commits
+from hooks.common.errors import (
+    CommitMessageError,
+    HookError,
+    MainBranchNotFoundError,
+    VersionError,
 )
+from hooks.common.get_file_content import get_local_file_content
 from hooks.common.git_helpers import (
-    changed_paths_since_main,
+    deepen_to_merge_base,
     find_main_branch,
     is_commit_msg_invocation,
-    iter_commit_messages,
+    unmerged_commit_shas,
 )
+from hooks.common.metrics import enable_metrics, inc, metered
+from hooks.common.profiling import enable_profiling, phase, profiled
+from hooks.common.results import (
+    ACTION_AUTOFIX_FAILED,
+    ACTION_AUTOFIXED,
+    ACTION_BUMP_REQUIRED,
+    CheckResult,
+)
+from hooks.common.session_cache import SessionCache
+from hooks.common.shared import get_shared
 
 
 def parse_args():
@@ -84,6 +99,59 @@ def parse_args():
         ),
         action="store_true",
     )
+    parser.add_argument(
+        "--no-deepen",
+        help=(
+            "don't fetch the missing history down to the merge base with the "
+            "main branch in shallow clones"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-session-cache",
+        help=(
+            "don't share the changed paths, commit messages and main branch "
+            "file contents with the other hooks via the session cache"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-baseline-cache",
+        help=(
+            "don't read the main branch versions from the persistent snapshot "
+            "of all Chart.yaml files of the main branch"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-commit-cache",
+        help=(
+            "with --autofix-strategy=conventional, don't use the persistent "
+            "cache of parsed commit messages"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "add the run metrics into a Prometheus textfile collector file "
+            "(OpenMetrics if FILE ends with .om)"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the wall and CPU time spent in each phase of the run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help=(
+            "write the profile into FILE (JSON with the phases if FILE ends "
+            "with .json, cProfile stats otherwise)"
+        ),
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -157,139 +225,175 @@ def process_paths(paths):
     return charts
 
 
-def check_fixed(yaml, repo, main_branch, path, autofix, autofix_portion, log):
-    current_content = get_local_file_content(path, log)
-    main_content = get_file_content(repo, main_branch, path)
+def parse_chart_version(content, yaml):
+    """Return the version from the Chart.yaml content or None if it has no
+    string version."""
+    chart = yaml.load(content)
+    version = chart.get("version") if isinstance(chart, dict) else None
+
+    return version if isinstance(version, str) else None
+
+
+def get_main_version(yaml, snapshot, session, path):
+    """Return the version of the Chart.yaml on the main branch or None if the
+    chart doesn't exist there. Raises `VersionError` if the version can't be
+    read."""
+    if snapshot is not None:
+        with phase("baseline lookup"):
+            version = snapshot.get(path)
+
+        if version is not None:
+            return version
+
+    # The file is read from the main branch if the snapshot doesn't have it
+    # (or couldn't parse it) so a mismatch of the snapshot paths can't be
+    # taken for a new chart
+
+    with phase("blob fetch"):
+        main_content = session.file_content(path)
 
     if main_content is None:
-        log.info("It's a new chart")
+        return None
 
-        return
+    try:
+        with phase("yaml parse"):
+            main_yaml = yaml.load(main_content)
+    except Exception as e:
+        raise VersionError(
+            "Failed to parse YAML file from the main branch: %s" % e, path
+        ) from e
+
+    if "version" not in main_yaml:
+        raise VersionError("File in the main branch has no version", path)
 
+    return main_yaml["version"]
+
+
+def parse_current_chart(yaml, path, current_content):
+    """Return the parsed Chart.yaml from the working tree. Raises
+    `VersionError` if it can't be parsed or has no version."""
     try:
-        main_yaml = yaml.load(main_content)
+        with phase("yaml parse"):
+            current_yaml = yaml.load(current_content)
     except Exception as e:
-        log.error("Failed to parse YAML file from the main branch: %s" % e)
+        raise VersionError(
+            "Failed to parse YAML file from the current branch: %s" % e, path
+        ) from e
+
+    if "version" not in current_yaml:
+        raise VersionError("File in the current branch has no version", path)
+
+    return current_yaml
 
-        return 1
 
+def write_chart(yaml, path, chart, log):
+    """Write the chart into the file and return the action taken."""
     try:
-        current_yaml = yaml.load(current_content)
+        with open(path, "w") as f:
+            yaml.dump(chart, f)
     except Exception as e:
-        log.error("Failed to parse YAML file from the current branch: %s" % e)
+        log.error("Failed to write YAML file: %s" % e)
 
-        return 1
+        return ACTION_AUTOFIX_FAILED
 
-    if "version" not in main_yaml:
-        log.error("File in the main branch has no version")
+    return ACTION_AUTOFIXED
 
-        return 1
 
-    if "version" not in current_yaml:
-        log.error("File in the current branch has no version")
+def check_fixed(yaml, session, snapshot, path, autofix, autofix_portion, log):
+    """Check that the version of the ``path`` Chart.yaml (relative to the
+    working tree) was incremented. Returns the `CheckResult` and raises
+    `HookError` if the versions can't be read or compared."""
+    local_path = os.path.join(session.repo.working_tree_dir, path)
+    current_content = get_local_file_content(local_path)
+    main_version = get_main_version(yaml, snapshot, session, path)
 
-        return 1
+    if main_version is None:
+        log.info("It's a new chart")
+
+        # The current chart isn't parsed as there is nothing to compare with
+        return CheckResult(path, None, None)
+
+    current_yaml = parse_current_chart(yaml, path, current_content)
+    current_version = current_yaml["version"]
 
     try:
-        comparison_result = semver.compare(
-            main_yaml["version"], current_yaml["version"]
-        )
+        comparison_result = semver.compare(main_version, current_version)
     except Exception as e:
-        log.error("Failed to compare versions: %s" % e)
-
-        return 1
+        raise VersionError("Failed to compare versions: %s" % e, path) from e
 
     # Check if the main version is smaller than the current version
     if comparison_result == -1:
-        log.info(
-            "Version was incremented (%s > %s)"
-            % (current_yaml["version"], main_yaml["version"])
-        )
-    else:
-        log.warning(
-            "Version wasn't incremented (%s <= %s)"
-            % (current_yaml["version"], main_yaml["version"])
-        )
+        log.info("Version was incremented (%s > %s)" % (current_version, main_version))
 
-        if autofix:
-            log.info("Autofixing the %s portion of the version" % autofix_portion)
+        return CheckResult(path, main_version, current_version)
 
-            if autofix_portion == "major":
-                current_yaml["version"] = semver.bump_major(main_yaml["version"])
-            elif autofix_portion == "minor":
-                current_yaml["version"] = semver.bump_minor(main_yaml["version"])
-            elif autofix_portion == "patch":
-                current_yaml["version"] = semver.bump_patch(main_yaml["version"])
-            elif autofix_portion == "prerelease":
-                current_yaml["version"] = semver.bump_prerelease(main_yaml["version"])
-            elif autofix_portion == "build":
-                current_yaml["version"] = semver.bump_build(main_yaml["version"])
+    log.warning(
+        "Version wasn't incremented (%s <= %s)" % (current_version, main_version)
+    )
 
-            log.info("Autofixed version: %s" % current_yaml["version"])
+    if autofix_portion == "major":
+        expected = semver.bump_major(main_version)
+    elif autofix_portion == "minor":
+        expected = semver.bump_minor(main_version)
+    elif autofix_portion == "patch":
+        expected = semver.bump_patch(main_version)
+    elif autofix_portion == "prerelease":
+        expected = semver.bump_prerelease(main_version)
+    elif autofix_portion == "build":
+        expected = semver.bump_build(main_version)
 
-            try:
-                with open(path, "w") as f:
-                    yaml.dump(current_yaml, f)
-            except Exception as e:
-                log.error("Failed to write YAML file: %s" % e)
+    action = ACTION_BUMP_REQUIRED
 
-        return 127
+    if autofix:
+        log.info("Autofixing the %s portion of the version" % autofix_portion)
+        log.info("Autofixed version: %s" % expected)
+
+        current_yaml["version"] = expected
+        action = write_chart(yaml, local_path, current_yaml, log)
+
+    return CheckResult(path, main_version, current_version, expected, action)
 
 
 def check_conventional(
     yaml,
-    repo,
-    main_branch,
-    current_branch,
+    session,
+    snapshot,
     path,
     dir_path,
     in_flight_message,
+    commit_cache,
     autofix,
     conventional_strict,
     log,
 ):
-    current_content = get_local_file_content(path, log)
-    main_content = get_file_content(repo, main_branch, path)
-
-    if main_content is None:
+    """Check that the version of the ``path`` Chart.yaml (relative to the
+    working tree) was incremented at least as the Conventional Commits
+    messages require. Returns the `CheckResult` and raises `HookError` if the
+    versions can't be read or compared or the messages don't determine the
+    bump."""
+    local_path = os.path.join(session.repo.working_tree_dir, path)
+    current_content = get_local_file_content(local_path)
+    baseline = get_main_version(yaml, snapshot, session, path)
+
+    if baseline is None:
         baseline = "0.0.0"
 
         log.info("Chart does not exist on main; using 0.0.0 as baseline")
-    else:
-        try:
-            main_yaml = yaml.load(main_content)
-        except Exception as e:
-            log.error("Failed to parse YAML file from the main branch: %s" % e)
-
-            return 1
 
-        if "version" not in main_yaml:
-            log.error("File in the main branch has no version")
+    current_yaml = parse_current_chart(yaml, path, current_content)
+    current_version = current_yaml["version"]
 
-            return 1
-
-        baseline = main_yaml["version"]
-
-    try:
-        current_yaml = yaml.load(current_content)
-    except Exception as e:
-        log.error("Failed to parse YAML file from the current branch: %s" % e)
-
-        return 1
-
-    if "version" not in current_yaml:
-        log.error("File in the current branch has no version")
-
-        return 1
-
-    messages = list(
-        iter_commit_messages(repo, main_branch, current_branch, dir_path=dir_path)
-    )
+    # Commits are streamed lazily and the evaluation stops at the first
+    # breaking change. The in-flight message goes first as it's at hand.
+    commits = session.commit_subjects(dir_path)
 
     if in_flight_message:
-        messages.append(in_flight_message)
+        commits = itertools.chain([(None, in_flight_message)], commits)
 
-    portion, has_valid_cc = bump_from_messages(messages)
+    with phase("commit walk"):
+        portion, has_valid_cc = bump_from_commits(
+            commits, session.commit_message, commit_cache
+        )
 
     if portion is None:
         if conventional_strict or not has_valid_cc:
@@ -299,20 +403,24 @@ def check_conventional(
                 else "no Conventional Commits messages found at all"
             )
 
-            log.error(
+            raise CommitMessageError(
                 "%s in range %s..%s for chart '%s' (including the "
                 "in-flight message)."
-                % (reason.capitalize(), main_branch.name, current_branch.name, dir_path)
+                % (
+                    reason.capitalize(),
+                    session.main_branch.name,
+                    session.current_branch.name,
+                    dir_path,
+                ),
+                path,
             )
 
-            return 1
-
         log.info(
             "Only no-bump Conventional Commits messages found; no version "
-            "change required (current: %s)" % current_yaml["version"]
+            "change required (current: %s)" % current_version
         )
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     if portion == "major":
         expected = semver.bump_major(baseline)
@@ -327,47 +435,108 @@ def check_conventional(
     )
 
     try:
-        cmp = semver.compare(current_yaml["version"], expected)
+        cmp = semver.compare(current_version, expected)
     except Exception as e:
-        log.error("Failed to compare versions: %s" % e)
-
-        return 1
+        raise VersionError("Failed to compare versions: %s" % e, path) from e
 
     if cmp == 0:
-        log.info("Version matches the expected: %s" % current_yaml["version"])
+        log.info("Version matches the expected: %s" % current_version)
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     if cmp > 0:
         log.info(
             "Version %s is above the expected %s; accepting manual bump"
-            % (current_yaml["version"], expected)
+            % (current_version, expected)
         )
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     log.warning(
         "Version is %s but expected at least %s based on commit messages"
-        % (current_yaml["version"], expected)
+        % (current_version, expected)
     )
 
+    action = ACTION_BUMP_REQUIRED
+
     if autofix:
         log.info("Autofixing version to %s" % expected)
 
         current_yaml["version"] = expected
+        action = write_chart(yaml, local_path, current_yaml, log)
 
-        try:
-            with open(path, "w") as f:
-                yaml.dump(current_yaml, f)
-        except Exception as e:
-            log.error("Failed to write YAML file: %s" % e)
+    return CheckResult(path, baseline, current_version, expected, action)
 
-    return 127
 
+def get_yaml():
+    """Return the YAML reader/writer keeping the formatting of the charts."""
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    yaml.indent(mapping=2, sequence=4, offset=2)
+
+    return yaml
+
+
+def open_snapshot(repo, main_branch, log):
+    """Return the snapshot of the versions of all Chart.yaml files of the
+    main branch."""
+    safe_yaml = YAML(typ="safe")
 
+    return BaselineSnapshot(
+        repo,
+        main_branch.commit.hexsha,
+        "chart",
+        "Chart.yaml",
+        lambda content: parse_chart_version(content, safe_yaml),
+        log,
+    )
+
+
+def check_path(
+    yaml, session, snapshot, path, in_flight_message, commit_cache, args, log
+):
+    """Run the check selected by the arguments and return the exit status."""
+    try:
+        if args.autofix_strategy == "conventional":
+            result = check_conventional(
+                yaml,
+                session,
+                snapshot,
+                path,
+                os.path.dirname(path),
+                in_flight_message,
+                commit_cache,
+                args.autofix,
+                args.conventional_strict,
+                log,
+            )
+        else:
+            result = check_fixed(
+                yaml,
+                session,
+                snapshot,
+                path,
+                args.autofix,
+                args.autofix_portion,
+                log,
+            )
+    except HookError as e:
+        log.error(e)
+
+        return 1
+
+    return result.status
+
+
+@metered("check-helm-version")
+@profiled
 def main():
     # Parse args
-    args = parse_args()
+    with phase("parse args"):
+        args = parse_args()
+
+    enable_profiling(args.profile, args.profile_output)
+    enable_metrics(args.metrics_file)
 
     # Get logger
     log = get_logger(args.debug)
@@ -384,23 +553,57 @@ def main():
         return
 
     # YAML reader/writer
-    yaml = YAML()
-    yaml.preserve_quotes = True
-    yaml.indent(mapping=2, sequence=4, offset=2)
+    yaml = get_yaml()
 
     # Create Git repo object and start querying all the details
-    repo = Repo(os.getcwd(), search_parent_directories=True)
+    with phase("repo open"):
+        repo = get_shared(
+            ("repo", os.getcwd()),
+            lambda: Repo(os.getcwd(), search_parent_directories=True),
+        )
 
     # Current branch head
     current_branch = repo.head
 
     # Resolve main branch
-    main_branch = find_main_branch(repo, args.branch, args.remote, log)
+    with phase("main branch"):
+        try:
+            main_branch = get_shared(
+                ("main branch", repo.common_dir, args.branch, args.remote),
+                lambda: find_main_branch(repo, args.branch, args.remote, log),
+            )
+        except MainBranchNotFoundError as e:
+            log.error(e)
+
+            sys.exit(1)
+
+    # Data shared with the other hooks running in the same session
+    with phase("session cache"):
+        session = get_shared(
+            ("session", repo.common_dir, main_branch.path, args.no_session_cache),
+            lambda: SessionCache(
+                repo,
+                main_branch,
+                current_branch,
+                log,
+                enabled=not args.no_session_cache,
+            ),
+        )
 
     # Determine the set of charts to check based on the stage
     if commit_msg_stage:
-        candidate_paths = changed_paths_since_main(repo, main_branch)
-        charts = process_paths(candidate_paths)
+        # Shallow clones (e.g. in CI) need the history down to the merge base
+        # for the commit walk. The other checks compare with the main branch
+        # tree only.
+        if not args.no_deepen:
+            with phase("deepen"):
+                deepen_to_merge_base(
+                    repo, main_branch, current_branch, args.remote, log
+                )
+
+        with phase("path discovery"):
+            candidate_paths = session.changed_paths()
+            charts = process_paths(candidate_paths)
 
         try:
             with open(args.PATH[0]) as f:
@@ -409,6 +612,18 @@ def main():
             log.error("Failed to read commit message file '%s': %s" % (args.PATH[0], e))
 
             sys.exit(1)
+
+        # Persistent cache of the parsed commit messages
+        commit_cache = None
+
+        if not args.no_commit_cache:
+            commit_cache = ParsedCommitCache.open(repo.common_dir, log)
+
+        if commit_cache is not None:
+            with phase("commit cache prune"):
+                commit_cache.prune_if_due(
+                    lambda: unmerged_commit_shas(repo, main_branch)
+                )
     else:
         # Union the pre-commit file list with deletions reported by git.
         # pre-commit's default file list excludes deleted paths, so a
@@ -416,55 +631,58 @@ def main():
         # process_paths. Adding the deleted paths here makes find_chart_dir
         # walk up to the still-existing Chart.yaml and include the chart in
         # the version-bump check.
-        paths = set(args.PATH)
+        with phase("path discovery"):
+            paths = set(args.PATH)
+
+            for p in session.changed_paths():
+                if not os.path.exists(p):
+                    paths.add(p)
 
-        for p in changed_paths_since_main(repo, main_branch):
-            if not os.path.exists(p):
-                paths.add(p)
+            charts = process_paths(paths)
 
-        charts = process_paths(paths)
         in_flight_message = None
+        commit_cache = None
 
     final_status = 0
     charts_cnt = len(charts)
 
+    inc("items_total", charts_cnt, kind="chart")
+
+    snapshot = None
+
+    if args.no_baseline_cache:
+        # Fetch all the needed main branch files at once in partial clones
+        with phase("blob prefetch"):
+            session.prefetch_file_contents(
+                [os.path.relpath(c, start=repo.working_tree_dir) for c in charts]
+            )
+    elif charts:
+        # Versions of all Chart.yaml files of the main branch
+        with phase("baseline snapshot"):
+            snapshot = open_snapshot(repo, main_branch, log)
+
     # Process individual charts
     for i, chart in enumerate(charts):
         path = os.path.relpath(chart, start=repo.working_tree_dir)
-        dir_path = os.path.dirname(path)
 
-        log.info("Processing chart: %s" % dir_path)
+        log.info("Processing chart: %s" % os.path.dirname(path))
 
-        if args.autofix_strategy == "conventional":
-            status = check_conventional(
-                yaml,
-                repo,
-                main_branch,
-                current_branch,
-                path,
-                dir_path,
-                in_flight_message,
-                args.autofix,
-                args.conventional_strict,
-                log,
-            )
-        else:
-            status = check_fixed(
-                yaml,
-                repo,
-                main_branch,
-                path,
-                args.autofix,
-                args.autofix_portion,
-                log,
-            )
+        status = check_path(
+            yaml, session, snapshot, path, in_flight_message, commit_cache, args, log
+        )
 
-        if final_status == 0 and status is not None:
+        if final_status == 0 and status:
             final_status = status
 
         if i + 1 < charts_cnt:
             log.info("~~~")
 
+    with phase("session cache"):
+        session.save()
+
+    if commit_cache is not None:
+        commit_cache.close()
+
     sys.exit(final_status)
 
 
@@ -1,4 +1,5 @@
 import argparse
+import itertools
 import logging
 import os
 import semver
@@ -6,17 +7,31 @@ import sys
 
 from git import Repo
 
-from hooks.common.conventional import bump_from_messages
-from hooks.common.get_file_content import (
-    get_file_content,
-    get_local_file_content,
+from hooks.common.baseline import BaselineSnapshot
+from hooks.common.conventional import ParsedCommitCache, bump_from_commits
+from hooks.common.errors import (
+    CommitMessageError,
+    HookError,
+    MainBranchNotFoundError,
+    VersionError,
 )
+from hooks.common.get_file_content import get_local_file_content
 from hooks.common.git_helpers import (
-    changed_paths_since_main,
+    deepen_to_merge_base,
     find_main_branch,
     is_commit_msg_invocation,
-    iter_commit_messages,
+    unmerged_commit_shas,
 )
+from hooks.common.metrics import enable_metrics, inc, metered
+from hooks.common.profiling import enable_profiling, phase, profiled
+from hooks.common.results import (
+    ACTION_AUTOFIX_FAILED,
+    ACTION_AUTOFIXED,
+    ACTION_BUMP_REQUIRED,
+    CheckResult,
+)
+from hooks.common.session_cache import SessionCache
+from hooks.common.shared import get_shared
 
 
 def parse_args():
@@ -90,6 +105,59 @@ def parse_args():
         ),
         action="store_true",
     )
+    parser.add_argument(
+        "--no-deepen",
+        help=(
+            "don't fetch the missing history down to the merge base with the "
+            "main branch in shallow clones"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-session-cache",
+        help=(
+            "don't share the changed paths, commit messages and main branch "
+            "file contents with the other hooks via the session cache"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-baseline-cache",
+        help=(
+            "don't read the main branch versions from the persistent snapshot "
+            "of all version files of the main branch"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-commit-cache",
+        help=(
+            "with --autofix-strategy=conventional, don't use the persistent "
+            "cache of parsed commit messages"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "add the run metrics into a Prometheus textfile collector file "
+            "(OpenMetrics if FILE ends with .om)"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the wall and CPU time spent in each phase of the run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help=(
+            "write the profile into FILE (JSON with the phases if FILE ends "
+            "with .json, cProfile stats otherwise)"
+        ),
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -163,106 +231,137 @@ def process_paths(paths, version_file):
     return dirs
 
 
-def check_fixed(repo, main_branch, path, autofix, autofix_portion, log):
-    current_version = get_local_file_content(path, log).strip()
-    main_content = get_file_content(repo, main_branch, path)
-    main_version = main_content.strip() if main_content is not None else None
+def get_main_version(snapshot, session, path):
+    """Return the version from the file on the main branch or None if the file
+    doesn't exist there."""
+    if snapshot is not None:
+        with phase("baseline lookup"):
+            version = snapshot.get(path)
+
+        if version is not None:
+            return version
+
+    # The file is read from the main branch if the snapshot doesn't have it
+    # (or couldn't parse it) so a mismatch of the snapshot paths can't be
+    # taken for a new directory
+
+    with phase("blob fetch"):
+        main_content = session.file_content(path)
+
+    return main_content.strip() if main_content is not None else None
+
+
+def write_version(path, version, log):
+    """Write the version into the file and return the action taken."""
+    try:
+        with open(path, "w") as f:
+            f.write("%s\n" % version)
+    except Exception as e:
+        log.error("Failed to write into the version file: %s" % e)
+
+        return ACTION_AUTOFIX_FAILED
+
+    return ACTION_AUTOFIXED
+
+
+def check_fixed(session, snapshot, path, autofix, autofix_portion, log):
+    """Check that the version in the ``path`` file (relative to the working
+    tree) was incremented. Returns the `CheckResult` and raises `HookError`
+    if the versions can't be read or compared."""
+    local_path = os.path.join(session.repo.working_tree_dir, path)
+    current_version = get_local_file_content(local_path).strip()
+    main_version = get_main_version(snapshot, session, path)
 
     if main_version is None:
         log.info("It's a new directory")
 
-        return
+        return CheckResult(path, None, current_version)
 
     if len(main_version) == 0:
-        log.error("File in the main branch has no version")
-
-        return 1
+        raise VersionError("File in the main branch has no version", path)
 
     if len(current_version) == 0:
-        log.error("File in the current branch has no version")
-
-        return 1
+        raise VersionError("File in the current branch has no version", path)
 
     try:
         comparison_result = semver.compare(main_version, current_version)
     except Exception as e:
-        log.error("Failed to compare versions: %s" % e)
-
-        return 1
+        raise VersionError("Failed to compare versions: %s" % e, path) from e
 
     # Check if the main version is smaller than the current version
     if comparison_result == -1:
         log.info("Version was incremented (%s > %s)" % (current_version, main_version))
-    else:
-        log.warning(
-            "Version wasn't incremented (%s <= %s)" % (current_version, main_version)
-        )
 
-        if autofix:
-            log.info("Autofixing the %s portion of the version" % autofix_portion)
+        return CheckResult(path, main_version, current_version)
 
-            if autofix_portion == "major":
-                current_version = semver.bump_major(main_version)
-            elif autofix_portion == "minor":
-                current_version = semver.bump_minor(main_version)
-            elif autofix_portion == "patch":
-                current_version = semver.bump_patch(main_version)
-            elif autofix_portion == "prerelease":
-                current_version = semver.bump_prerelease(main_version)
-            elif autofix_portion == "build":
-                current_version = semver.bump_build(main_version)
+    log.warning(
+        "Version wasn't incremented (%s <= %s)" % (current_version, main_version)
+    )
+
+    if autofix_portion == "major":
+        expected = semver.bump_major(main_version)
+    elif autofix_portion == "minor":
+        expected = semver.bump_minor(main_version)
+    elif autofix_portion == "patch":
+        expected = semver.bump_patch(main_version)
+    elif autofix_portion == "prerelease":
+        expected = semver.bump_prerelease(main_version)
+    elif autofix_portion == "build":
+        expected = semver.bump_build(main_version)
 
-            log.info("Autofixed version: %s" % current_version)
+    action = ACTION_BUMP_REQUIRED
+
+    if autofix:
+        log.info("Autofixing the %s portion of the version" % autofix_portion)
+        log.info("Autofixed version: %s" % expected)
 
-            try:
-                with open(path, "w") as f:
-                    f.write("%s\n" % current_version)
-            except Exception as e:
-                log.error("Failed to write into the version file: %s" % e)
+        action = write_version(local_path, expected, log)
 
-        return 127
+    return CheckResult(path, main_version, current_version, expected, action)
 
 
 def check_conventional(
-    repo,
-    main_branch,
-    current_branch,
+    session,
+    snapshot,
     path,
     dir_path,
     in_flight_message,
+    commit_cache,
     autofix,
     conventional_strict,
     log,
 ):
-    main_content = get_file_content(repo, main_branch, path)
+    """Check that the version in the ``path`` file (relative to the working
+    tree) was incremented at least as the Conventional Commits messages
+    require. Returns the `CheckResult` and raises `HookError` if the versions
+    can't be read or compared or the messages don't determine the bump."""
+    baseline = get_main_version(snapshot, session, path)
 
-    if main_content is None:
+    if baseline is None:
         baseline = "0.0.0"
 
         log.info("Version file does not exist on main; using 0.0.0 as baseline")
-    else:
-        baseline = main_content.strip()
 
     if len(baseline) == 0:
-        log.error("File in the main branch has no version")
-
-        return 1
+        raise VersionError("File in the main branch has no version", path)
 
-    current_version = get_local_file_content(path, log).strip()
+    local_path = os.path.join(session.repo.working_tree_dir, path)
+    current_version = get_local_file_content(local_path).strip()
 
     if len(current_version) == 0:
-        log.error("File in the current branch has no version")
+        raise VersionError("File in the current branch has no version", path)
 
-        return 1
-
-    messages = list(
-        iter_commit_messages(repo, main_branch, current_branch, dir_path=dir_path)
-    )
+    # Commits are streamed lazily and the evaluation stops at the first
+    # breaking change. The in-flight message goes first as it's at hand.
+    commits = session.commit_subjects(dir_path)
 
     if in_flight_message:
-        messages.append(in_flight_message)
+        commits = itertools.chain([(None, in_flight_message)], commits)
 
-    portion, has_valid_cc = bump_from_messages(messages)
+    with phase("commit walk"):
+        portion, has_valid_cc = bump_from_commits(
+            commits, session.commit_message, commit_cache
+        )
 
     if portion is None:
         if conventional_strict or not has_valid_cc:
@@ -272,14 +371,18 @@ def check_conventional(
                 else "no Conventional Commits messages found at all"
             )
 
-            log.error(
+            raise CommitMessageError(
                 "%s in range %s..%s for directory '%s' (including the "
                 "in-flight message)."
-                % (reason.capitalize(), main_branch.name, current_branch.name, dir_path)
+                % (
+                    reason.capitalize(),
+                    session.main_branch.name,
+                    session.current_branch.name,
+                    dir_path,
+                ),
+                path,
             )
 
-            return 1
-
         # Non-strict mode with at least one valid CC message but no bump
         # required: accept whatever the current version is.
         log.info(
@@ -287,7 +390,7 @@ def check_conventional(
             "change required (current: %s)" % current_version
         )
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     if portion == "major":
         expected = semver.bump_major(baseline)
@@ -304,14 +407,12 @@ def check_conventional(
     try:
         cmp = semver.compare(current_version, expected)
     except Exception as e:
-        log.error("Failed to compare versions: %s" % e)
-
-        return 1
+        raise VersionError("Failed to compare versions: %s" % e, path) from e
 
     if cmp == 0:
         log.info("Version matches the expected: %s" % current_version)
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     if cmp > 0:
         log.info(
@@ -319,28 +420,72 @@ def check_conventional(
             % (current_version, expected)
         )
 
-        return
+        return CheckResult(path, baseline, current_version)
 
     log.warning(
         "Version is %s but expected at least %s based on commit messages"
         % (current_version, expected)
     )
 
+    action = ACTION_BUMP_REQUIRED
+
     if autofix:
         log.info("Autofixing version to %s" % expected)
 
-        try:
-            with open(path, "w") as f:
-                f.write("%s\n" % expected)
-        except Exception as e:
-            log.error("Failed to write into the version file: %s" % e)
+        action = write_version(local_path, expected, log)
 
-    return 127
+    return CheckResult(path, baseline, current_version, expected, action)
 
 
+def open_snapshot(repo, main_branch, version_file, log):
+    """Return the snapshot of the versions of all version files of the main
+    branch."""
+    return BaselineSnapshot(
+        repo, main_branch.commit.hexsha, "version", version_file, str.strip, log
+    )
+
+
+def check_path(session, snapshot, path, in_flight_message, commit_cache, args, log):
+    """Run the check selected by the arguments and return the exit status."""
+    try:
+        if args.autofix_strategy == "conventional":
+            result = check_conventional(
+                session,
+                snapshot,
+                path,
+                os.path.dirname(path),
+                in_flight_message,
+                commit_cache,
+                args.autofix,
+                args.conventional_strict,
+                log,
+            )
+        else:
+            result = check_fixed(
+                session,
+                snapshot,
+                path,
+                args.autofix,
+                args.autofix_portion,
+                log,
+            )
+    except HookError as e:
+        log.error(e)
+
+        return 1
+
+    return result.status
+
+
+@metered("check-version")
+@profiled
 def main():
     # Parse args
-    args = parse_args()
+    with phase("parse args"):
+        args = parse_args()
+
+    enable_profiling(args.profile, args.profile_output)
+    enable_metrics(args.metrics_file)
 
     # Get logger
     log = get_logger(args.debug)
@@ -357,19 +502,55 @@ def main():
         return
 
     # Create Git repo object and start querying all the details
-    repo = Repo(os.getcwd(), search_parent_directories=True)
+    with phase("repo open"):
+        repo = get_shared(
+            ("repo", os.getcwd()),
+            lambda: Repo(os.getcwd(), search_parent_directories=True),
+        )
 
     # Current branch head
     current_branch = repo.head
 
     # Resolve main branch
-    main_branch = find_main_branch(repo, args.branch, args.remote, log)
+    with phase("main branch"):
+        try:
+            main_branch = get_shared(
+                ("main branch", repo.common_dir, args.branch, args.remote),
+                lambda: find_main_branch(repo, args.branch, args.remote, log),
+            )
+        except MainBranchNotFoundError as e:
+            log.error(e)
+
+            sys.exit(1)
+
+    # Data shared with the other hooks running in the same session
+    with phase("session cache"):
+        session = get_shared(
+            ("session", repo.common_dir, main_branch.path, args.no_session_cache),
+            lambda: SessionCache(
+                repo,
+                main_branch,
+                current_branch,
+                log,
+                enabled=not args.no_session_cache,
+            ),
+        )
 
     # Determine the set of version files to check based on the stage
     if commit_msg_stage:
+        # Shallow clones (e.g. in CI) need the history down to the merge base
+        # for the commit walk. The other checks compare with the main branch
+        # tree only.
+        if not args.no_deepen:
+            with phase("deepen"):
+                deepen_to_merge_base(
+                    repo, main_branch, current_branch, args.remote, log
+                )
+
         # commit-msg stage: derive candidate paths from changes since main
-        candidate_paths = changed_paths_since_main(repo, main_branch)
-        dirs = process_paths(candidate_paths, args.version_file)
+        with phase("path discovery"):
+            candidate_paths = session.changed_paths()
+            dirs = process_paths(candidate_paths, args.version_file)
 
         # Read the in-flight commit message
         try:
@@ -379,49 +560,66 @@ def main():
             log.error("Failed to read commit message file '%s': %s" % (args.PATH[0], e))
 
             sys.exit(1)
+
+        # Persistent cache of the parsed commit messages
+        commit_cache = None
+
+        if not args.no_commit_cache:
+            commit_cache = ParsedCommitCache.open(repo.common_dir, log)
+
+        if commit_cache is not None:
+            with phase("commit cache prune"):
+                commit_cache.prune_if_due(
+                    lambda: unmerged_commit_shas(repo, main_branch)
+                )
     else:
         # pre-commit stage: dirs come from the staged file paths
-        dirs = process_paths(args.PATH, args.version_file)
+        with phase("path discovery"):
+            dirs = process_paths(args.PATH, args.version_file)
+
         in_flight_message = None
+        commit_cache = None
 
     final_status = 0
     dirs_cnt = len(dirs)
 
+    inc("items_total", dirs_cnt, kind="dir")
+
+    snapshot = None
+
+    if args.no_baseline_cache:
+        # Fetch all the needed main branch files at once in partial clones
+        with phase("blob prefetch"):
+            session.prefetch_file_contents(
+                [os.path.relpath(d, start=repo.working_tree_dir) for d in dirs]
+            )
+    elif dirs:
+        # Versions of all version files of the main branch
+        with phase("baseline snapshot"):
+            snapshot = open_snapshot(repo, main_branch, args.version_file, log)
+
     # Process individual directories
     for i, d in enumerate(dirs):
         path = os.path.relpath(d, start=repo.working_tree_dir)
-        dir_path = os.path.dirname(path)
 
-        log.info("Processing directory: %s" % dir_path)
+        log.info("Processing directory: %s" % os.path.dirname(path))
 
-        if args.autofix_strategy == "conventional":
-            status = check_conventional(
-                repo,
-                main_branch,
-                current_branch,
-                path,
-                dir_path,
-                in_flight_message,
-                args.autofix,
-                args.conventional_strict,
-                log,
-            )
-        else:
-            status = check_fixed(
-                repo,
-                main_branch,
-                path,
-                args.autofix,
-                args.autofix_portion,
-                log,
-            )
+        status = check_path(
+            session, snapshot, path, in_flight_message, commit_cache, args, log
+        )
 
-        if final_status == 0 and status is not None:
+        if final_status == 0 and status:
             final_status = status
 
         if i + 1 < dirs_cnt:
             log.info("~~~")
 
+    with phase("session cache"):
+        session.save()
+
+    if commit_cache is not None:
+        commit_cache.close()
+
     sys.exit(final_status)
 
 
@@ -0,0 +1,195 @@
+import os
+import posixpath
+
+from git import GitCommandError
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+from hooks.common.git_helpers import fetch_blobs
+from hooks.common.metrics import inc
+
+# Name of the snapshot file inside the cache directory (per kind of the
+# version files).
+SNAPSHOT_FILE = "baseline_%s.json"
+
+
+def _parse_tree_entries(out, file_name):
+    """Return ``{path: blob_sha}`` of the files with the given name from the
+    `git ls-tree -r -z` output."""
+    entries = {}
+
+    for entry in out.split("\0"):
+        info, _, path = entry.partition("\t")
+        fields = info.split()
+
+        if fields[1:2] == ["blob"] and posixpath.basename(path) == file_name:
+            entries[path] = fields[2]
+
+    return entries
+
+
+def _parse_tree_diff(out, file_name):
+    """Return ``{path: blob_sha}`` of the changed files with the given name
+    from the `git diff-tree -r -z --no-renames` output (the SHA is None for
+    the deleted files)."""
+    changes = {}
+    records = out.split("\0")
+
+    for info, path in zip(records[::2], records[1::2]):
+        fields = info.split()
+
+        if len(fields) < 5 or posixpath.basename(path) != file_name:
+            continue
+
+        changes[path] = None if fields[4] == "D" else fields[3]
+
+    return changes
+
+
+class BaselineSnapshot:
+    """Versions of all the version files of a main branch commit.
+
+    The snapshot maps the path of every file with the given name on the main
+    branch to its version as returned by ``parse(content)`` (None if the
+    version can't be parsed). It's built by a single tree listing and a batch
+    read of the blobs and stored in the cache directory of the common git dir
+    so all the following runs (from all worktrees) read it until the main
+    branch moves. The snapshot of the previous main commit is then updated
+    only by the files changed between the two commits.
+    """
+
+    def __init__(self, repo, main_sha, kind, file_name, parse, log):
+        self.repo = repo
+        self.main_sha = main_sha
+        self.file_name = file_name
+        self.parse = parse
+        self.log = log
+        self.path = None
+        self.versions = None
+
+        try:
+            self.path = os.path.join(
+                get_cache_dir(repo.common_dir), SNAPSHOT_FILE % kind
+            )
+
+            with locked(self.path, shared=True):
+                data = read_json(self.path)
+        except OSError as e:
+            log.debug("Baseline snapshot cache disabled: %s" % e)
+
+            self.path = None
+            data = None
+
+        if not isinstance(data, dict) or data.get("file_name") != file_name:
+            data = {}
+
+        versions = data.get("versions")
+
+        if not isinstance(versions, dict) or not isinstance(data.get("sha"), str):
+            versions = None
+
+        if versions is not None and data["sha"] == main_sha:
+            inc("cache_requests_total", cache="baseline", result="hit")
+
+            self.versions = versions
+
+            return
+
+        if versions is not None:
+            inc("cache_requests_total", cache="baseline", result="update")
+
+            self.versions = self._update(data["sha"], versions)
+
+        if self.versions is None:
+            inc("cache_requests_total", cache="baseline", result="miss")
+
+            self.versions = self._build()
+
+        self.save()
+
+    def _read_versions(self, blobs):
+        """Return ``{path: version}`` of the ``{path: blob_sha}`` blobs."""
+        # Missing blobs of a partial clone are fetched at once
+        fetch_blobs(self.repo, sorted(set(blobs.values())), self.log)
+
+        versions = {}
+
+        for path, sha in blobs.items():
+            try:
+                # Read via the persistent `git cat-file --batch` process
+                content = self.repo.odb.stream(bytes.fromhex(sha)).read()
+                versions[path] = self.parse(content.decode("ascii"))
+            except Exception as e:
+                self.log.debug("Failed to parse %s on main: %s" % (path, e))
+
+                versions[path] = None
+
+        return versions
+
+    def _build(self):
+        self.log.debug("Building the baseline snapshot of %s" % self.main_sha)
+
+        out = self.repo.git.ls_tree("-r", "-z", self.main_sha)
+
+        return self._read_versions(_parse_tree_entries(out, self.file_name))
+
+    def _update(self, old_sha, versions):
+        """Return the versions of the old snapshot updated by the files changed
+        since the old main commit (or None if the commit is not available)."""
+        self.log.debug(
+            "Updating the baseline snapshot from %s to %s" % (old_sha, self.main_sha)
+        )
+
+        try:
+            out = self.repo.git.diff_tree(
+                "-r", "-z", "--no-renames", old_sha, self.main_sha
+            )
+        except GitCommandError as e:
+            self.log.debug("Failed to diff the main commits: %s" % e)
+
+            return None
+
+        changes = _parse_tree_diff(out, self.file_name)
+        versions = dict(versions)
+
+        for path, sha in changes.items():
+            if sha is None:
+                versions.pop(path, None)
+
+        versions.update(
+            self._read_versions(
+                {path: sha for path, sha in changes.items() if sha is not None}
+            )
+        )
+
+        return versions
+
+    def save(self):
+        if self.path is None:
+            return
+
+        try:
+            with locked(self.path):
+                write_json_atomic(
+                    self.path,
+                    {
+                        "sha": self.main_sha,
+                        "file_name": self.file_name,
+                        "versions": self.versions,
+                    },
+                )
+        except OSError as e:
+            self.log.debug("Failed to save the baseline snapshot: %s" % e)
+
+    def __contains__(self, path):
+        """Whether the file exists on the main branch."""
+        return path in self.versions
+
+    def get(self, path):
+        """Return the version of the file on the main branch or None if the
+        file doesn't exist there or its version can't be parsed."""
+        return self.versions.get(path)
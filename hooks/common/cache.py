@@ -0,0 +1,66 @@
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Name of the directory inside the git dir holding all cache files of these
+# hooks.
+CACHE_DIR_NAME = "jtyr-pre-commit-hooks"
+
+
+def get_cache_dir(git_dir):
+    """Return (and create) the cache directory inside the given git dir."""
+    path = os.path.join(git_dir, CACHE_DIR_NAME)
+
+    os.makedirs(path, exist_ok=True)
+
+    return path
+
+
+@contextmanager
+def locked(path, shared=False):
+    """Hold an advisory lock on ``path + '.lock'`` for the duration of the
+    block. Shared locks are used for reading, exclusive ones for writing."""
+    with open("%s.lock" % path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_json(path):
+    """Return the decoded content of a JSON file or None if the file is
+    missing or corrupted."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path, content):
+    """Write text content so that readers never see a partially written
+    file."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=".%s." % os.path.basename(path),
+    )
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+
+        raise
+
+
+def write_json_atomic(path, data):
+    """Write JSON data so that readers never see a partially written file."""
+    write_atomic(path, json.dumps(data, separators=(",", ":")))
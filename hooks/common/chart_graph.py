@@ -0,0 +1,190 @@
+import os
+from pathlib import Path
+
+from ruamel.yaml import YAML
+from ruamel.yaml.error import YAMLError
+
+# Name of the file identifying a chart directory.
+CHART_FILE = "Chart.yaml"
+
+# Files with the dependencies of the chart (`requirements.yaml` of the Helm 2
+# charts).
+DEPENDENCY_FILES = (CHART_FILE, "requirements.yaml")
+
+# Directory of the subcharts of the chart.
+SUBCHARTS_DIR = "charts"
+
+# Prefix of the dependency repository pointing to a chart on the disk.
+LOCAL_REPOSITORY_PREFIX = "file://"
+
+
+def find_charts(root):
+    """Return the set of resolved chart directories under ``root``. Hidden
+    directories (e.g. `.git`) are skipped."""
+    charts = set()
+
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+
+        if CHART_FILE in file_names:
+            charts.add(Path(dir_path).resolve())
+
+    return charts
+
+
+def get_chart_dependencies(chart_dir, yaml, log):
+    """Return the resolved directories of the charts the chart depends on.
+
+    These are the `file://` repositories from the `dependencies` of the
+    `Chart.yaml` (or the `requirements.yaml`) and the (possibly symlinked)
+    subcharts in the `charts/` subdirectory.
+    """
+    deps = set()
+    prefix_len = len(LOCAL_REPOSITORY_PREFIX)
+
+    for file_name in DEPENDENCY_FILES:
+        if file_name != CHART_FILE and not (chart_dir / file_name).is_file():
+            continue
+
+        try:
+            with open(chart_dir / file_name) as f:
+                data = yaml.load(f)
+        except (OSError, YAMLError) as e:
+            log.warning(f"Failed to read {chart_dir / file_name}: {e}")
+
+            data = None
+
+        if not isinstance(data, dict) or not isinstance(data.get("dependencies"), list):
+            continue
+
+        for dep in data["dependencies"]:
+            if not isinstance(dep, dict):
+                continue
+
+            repository = str(dep.get("repository") or "")
+
+            if repository.startswith(LOCAL_REPOSITORY_PREFIX):
+                deps.add((chart_dir / repository[prefix_len:]).resolve())
+
+    subcharts_dir = chart_dir / SUBCHARTS_DIR
+
+    if subcharts_dir.is_dir():
+        for subchart in subcharts_dir.iterdir():
+            if (subchart / CHART_FILE).is_file():
+                deps.add(subchart.resolve())
+
+    return deps
+
+
+class ChartGraph:
+    """Dependency graph of the charts found in the search directories.
+
+    The graph is kept in memory between the runs of the watch mode and only
+    the dependencies of the charts whose dependency files or subcharts
+    changed are re-read by `update`.
+    """
+
+    def __init__(self, root, log, search_dirs=None):
+        self.root = Path(root).resolve()
+        self.log = log
+        self.yaml = YAML(typ="safe")
+        self.search_dirs = [
+            (self.root / d).resolve()
+            for d in (search_dirs if search_dirs is not None else ["."])
+        ]
+        self.deps = {}
+        self.dependents = None
+
+        for search_dir in self.search_dirs:
+            for chart_dir in find_charts(search_dir):
+                self.deps[chart_dir] = get_chart_dependencies(chart_dir, self.yaml, log)
+
+    def _rel_path(self, chart_dir):
+        try:
+            return chart_dir.relative_to(self.root)
+        except ValueError:
+            return chart_dir
+
+    def _is_searched(self, path):
+        return any(d == path or d in path.parents for d in self.search_dirs)
+
+    def _refresh(self, chart_dir):
+        """Re-read the dependencies of the chart (or drop it if it's gone)."""
+        if (chart_dir / CHART_FILE).is_file() and self._is_searched(chart_dir):
+            self.deps[chart_dir] = get_chart_dependencies(
+                chart_dir, self.yaml, self.log
+            )
+        else:
+            self.deps.pop(chart_dir, None)
+
+        self.dependents = None
+
+    def update(self, changed_files):
+        """Update the graph for the changed files (relative to the root or
+        absolute)."""
+        for changed_file in changed_files:
+            path = self.root / changed_file
+
+            if path.name in DEPENDENCY_FILES:
+                self._refresh(path.parent.resolve())
+
+            # A subchart (or a symlink to it) was added or removed
+            for subchart in (path.parent, path):
+                parent_dir = subchart.parent.parent.resolve()
+
+                if subchart.parent.name == SUBCHARTS_DIR and parent_dir in self.deps:
+                    self._refresh(parent_dir)
+
+    def find_chart(self, path):
+        """Return the directory (relative to the root) of the chart the file
+        belongs to or None if it's not in any chart."""
+        path = (self.root / path).resolve()
+
+        for parent in path.parents:
+            if parent in self.deps:
+                return self._rel_path(parent)
+
+        return None
+
+    def affected(self, chart_dirs):
+        """Return the given chart directories together with all the charts
+        which (transitively) depend on them, relative to the root (relative
+        chart directories are relative to it as well)."""
+        if self.dependents is None:
+            self.dependents = {}
+
+            for chart_dir, deps in self.deps.items():
+                for dep in deps:
+                    self.dependents.setdefault(dep, set()).add(chart_dir)
+
+        affected = {
+            Path(chart_dir): (self.root / chart_dir).resolve()
+            for chart_dir in chart_dirs
+        }
+        seen = set(affected.values())
+        queue = list(seen)
+
+        while queue:
+            for dependent in self.dependents.get(queue.pop(), ()):
+                if dependent in seen:
+                    continue
+
+                seen.add(dependent)
+                queue.append(dependent)
+
+                rel_path = self._rel_path(dependent)
+
+                self.log.debug(f"Chart {rel_path} depends on a changed chart")
+
+                affected[rel_path] = dependent
+
+        return set(affected)
+
+
+def find_affected_charts(chart_dirs, root, log, search_dirs=None):
+    """Return the given chart directories together with all the charts which
+    (transitively) depend on them. The dependent charts are searched for in
+    the ``search_dirs`` (the whole ``root`` if None) and returned relative to
+    ``root`` (relative chart and search directories are relative to it as
+    well)."""
+    return ChartGraph(root, log, search_dirs).affected(chart_dirs)
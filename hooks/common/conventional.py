@@ -1,4 +1,10 @@
+import os
 import re
+import sqlite3
+import time
+
+from hooks.common.cache import get_cache_dir
+from hooks.common.metrics import inc
 
 # Conventional Commits type -> semver portion to bump.
 # Aligned with semantic-release defaults; other valid CC types (chore, docs,
@@ -26,6 +32,9 @@ HEADER_RE = re.compile(
 
 BREAKING_FOOTER_RE = re.compile(r"^BREAKING[ -]CHANGE: ", re.MULTILINE)
 
+# Rank of the biggest possible bump. Evaluation stops once it's reached.
+MAX_RANK = max(PORTION_RANK.values())
+
 
 def parse_commit(message):
     """Parse a Conventional Commits message.
@@ -69,28 +78,38 @@ def portion_for_commit(parsed):
     return TYPE_TO_PORTION.get(parsed["type"])
 
 
-def bump_from_messages(messages):
-    """Determine the highest semver portion to bump from a list of messages.
+def summarize_commit(message):
+    """Parse a message into a compact ``(type, scope, breaking, portion)``
+    tuple, or None if the message does not match the spec."""
+    parsed = parse_commit(message)
 
-    Returns a tuple ``(portion, has_valid_cc)`` where:
-      - ``portion`` is 'major', 'minor', 'patch', or None when no message
-        carries a bump-eligible type.
-      - ``has_valid_cc`` is True if at least one message parses as a valid
-        Conventional Commits message (regardless of whether it bumps).
+    if parsed is None:
+        return None
+
+    return (
+        parsed["type"],
+        parsed["scope"],
+        parsed["breaking"],
+        portion_for_commit(parsed),
+    )
+
+
+def bump_from_summaries(summaries):
+    """Determine the highest semver portion to bump from commit summaries.
+
+    See `bump_from_messages` for the meaning of the returned tuple.
     """
     highest = None
     highest_rank = 0
     has_valid_cc = False
 
-    for msg in messages:
-        parsed = parse_commit(msg)
-
-        if parsed is None:
+    for summary in summaries:
+        if summary is None:
             continue
 
         has_valid_cc = True
 
-        portion = portion_for_commit(parsed)
+        portion = summary[3]
 
         if portion is None:
             continue
@@ -101,4 +120,178 @@ def bump_from_messages(messages):
             highest = portion
             highest_rank = rank
 
+            # Nothing can bump more than a breaking change
+            if rank == MAX_RANK:
+                break
+
     return highest, has_valid_cc
+
+
+def bump_from_messages(messages):
+    """Determine the highest semver portion to bump from a list of messages.
+
+    Returns a tuple ``(portion, has_valid_cc)`` where:
+      - ``portion`` is 'major', 'minor', 'patch', or None when no message
+        carries a bump-eligible type.
+      - ``has_valid_cc`` is True if at least one message parses as a valid
+        Conventional Commits message (regardless of whether it bumps).
+    """
+    return bump_from_summaries(map(summarize_commit, messages))
+
+
+def bump_from_commits(commits, load_message=None, cache=None):
+    """Streaming version of `bump_from_messages`.
+
+    ``commits`` yields ``(sha, subject)`` tuples and is consumed lazily. The
+    evaluation stops at the first breaking change as nothing can bump more.
+
+    The full message of a commit is loaded with ``load_message(sha)`` only
+    when its subject is a valid Conventional Commits header (otherwise the
+    full message can't be valid either), so the body is only fetched to look
+    for the ``BREAKING CHANGE:`` footer. If ``sha`` is None (e.g. the
+    in-flight message) or no loader is given, the second item of the tuple is
+    used as the full message.
+
+    When a `ParsedCommitCache` is given, commits already known to it are not
+    fetched nor parsed again and the newly parsed ones are stored in it.
+    """
+    new = {}
+
+    def _summaries():
+        for sha, text in commits:
+            if sha is None or load_message is None:
+                yield summarize_commit(text)
+
+                continue
+
+            if cache is not None:
+                known = cache.get([sha])
+
+                if sha in known:
+                    inc("cache_requests_total", cache="commits", result="hit")
+
+                    yield known[sha]
+
+                    continue
+
+                inc("cache_requests_total", cache="commits", result="miss")
+
+            if HEADER_RE.match(text.strip()) is None:
+                summary = None
+            else:
+                summary = summarize_commit(load_message(sha))
+
+            new[sha] = summary
+
+            yield summary
+
+    try:
+        return bump_from_summaries(_summaries())
+    finally:
+        if cache is not None and new:
+            cache.put(new)
+
+
+class ParsedCommitCache:
+    """Persistent cache of parsed commits keyed by the commit SHA.
+
+    Commits are immutable so the summary of a commit never changes. The cache
+    is stored in a SQLite database and is pruned from commits that can no
+    longer be part of a main..HEAD range (unreachable or merged into main).
+    """
+
+    # Name of the database file inside the cache directory.
+    FILE = "commits.sqlite"
+
+    # How often (seconds) to prune the cache.
+    PRUNE_INTERVAL = 24 * 60 * 60
+
+    # Maximum number of SQL variables used in a single query.
+    CHUNK_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=10)
+
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS commits ("
+                "sha TEXT PRIMARY KEY, valid INTEGER NOT NULL, type TEXT, "
+                "scope TEXT, breaking INTEGER, portion TEXT) WITHOUT ROWID"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @classmethod
+    def open(cls, git_dir, log):
+        """Open the cache in the cache directory of the given git dir. Returns
+        None if the database cannot be opened."""
+        try:
+            return cls(os.path.join(get_cache_dir(git_dir), cls.FILE))
+        except (OSError, sqlite3.Error) as e:
+            log.debug("Parsed commit cache disabled: %s" % e)
+
+            return None
+
+    def get(self, shas):
+        """Return a dict of the known SHAs mapped to their summaries."""
+        result = {}
+
+        for i in range(0, len(shas), self.CHUNK_SIZE):
+            end = i + self.CHUNK_SIZE
+            chunk = shas[i:end]
+
+            rows = self.db.execute(
+                "SELECT sha, valid, type, scope, breaking, portion FROM commits "
+                "WHERE sha IN (%s)" % ",".join("?" * len(chunk)),
+                chunk,
+            )
+
+            for sha, valid, type_, scope, breaking, portion in rows:
+                result[sha] = (type_, scope, bool(breaking), portion) if valid else None
+
+        return result
+
+    def put(self, summaries):
+        """Store the ``{sha: summary}`` mapping."""
+        rows = []
+
+        for sha, summary in summaries.items():
+            if summary is None:
+                rows.append((sha, 0, None, None, None, None))
+            else:
+                rows.append((sha, 1) + tuple(summary))
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def prune_if_due(self, get_keep_shas, now=None):
+        """Remove all commits not returned by ``get_keep_shas()``. The
+        callable is invoked at most once per `PRUNE_INTERVAL`."""
+        if now is None:
+            now = time.time()
+
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'pruned'").fetchone()
+
+        if row is not None and now - float(row[0]) < self.PRUNE_INTERVAL:
+            return
+
+        keep = set(get_keep_shas())
+
+        with self.db:
+            stale = [
+                (sha,)
+                for (sha,) in self.db.execute("SELECT sha FROM commits")
+                if sha not in keep
+            ]
+
+            self.db.executemany("DELETE FROM commits WHERE sha = ?", stale)
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('pruned', ?)", (str(now),)
+            )
+
+    def close(self):
+        self.db.close()
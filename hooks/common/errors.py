@@ -0,0 +1,25 @@
+class HookError(Exception):
+    """Base class of the errors of the checks. The message is the one logged
+    by the hooks."""
+
+    def __init__(self, message, path=None):
+        super().__init__(message)
+
+        self.path = path
+
+
+class MainBranchNotFoundError(HookError):
+    """The main branch doesn't exist locally and can't be created from the
+    remote."""
+
+
+class FileReadError(HookError):
+    """The file can't be read from the working tree."""
+
+
+class VersionError(HookError):
+    """The version is missing, can't be parsed or compared."""
+
+
+class CommitMessageError(HookError):
+    """The commit messages don't determine the version bump."""
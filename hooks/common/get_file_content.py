@@ -1,4 +1,4 @@
-import sys
+from hooks.common.errors import FileReadError
 
 
 def search_file(tree, path):
@@ -17,7 +17,7 @@ def search_file(tree, path):
 
 
 def get_file_content(repo, branch, path):
-    tree = repo.tree(branch)
+    tree = branch.commit.tree
 
     blob = search_file(tree, path)
     content = None
@@ -28,11 +28,11 @@ def get_file_content(repo, branch, path):
     return content
 
 
-def get_local_file_content(path, log):
+def get_local_file_content(path):
     try:
         with open(path) as f:
             return f.read()
     except Exception as e:
-        log.error("Failed to read file '%s' from the current branch: %s" % (path, e))
-
-        sys.exit(1)
+        raise FileReadError(
+            "Failed to read file '%s' from the current branch: %s" % (path, e), path
+        ) from e
@@ -1,67 +1,264 @@
 import os
-import sys
 
+from git import GitCommandError, Head
 
-def find_main_branch(repo, branch_name, remote_name, log):
-    """Resolve the main branch head locally or by creating it from a remote ref.
+from hooks.common.errors import MainBranchNotFoundError
+
+# Number of commits fetched by the first deepening of a shallow clone. Every
+# next deepening fetches twice as many commits as the previous one.
+DEEPEN_STEP = 50
+
+# Maximum number of objects requested by a single fetch (keeps the command
+# line short).
+FETCH_CHUNK_SIZE = 1000
+
+
+class ResolvedHead(Head):
+    """Head with the commit resolved once.
+
+    GitPython looks the ref up on every access of ``commit`` which scans all
+    the packed refs if the ref is not a loose one.
+    """
+
+    def __init__(self, repo, path, hexsha):
+        super().__init__(repo, path)
 
-    Exits with status 1 if the branch cannot be found.
+        self.hexsha = hexsha
+
+    @property
+    def commit(self):
+        return self.repo.commit(self.hexsha)
+
+
+def get_ref_shas(repo, *ref_names):
+    """Return ``{ref_name: sha}`` of the given full ref names which exist.
+
+    The refs are looked up by a single `git for-each-ref` which reads only the
+    matching part of the packed refs (or of the reftable) instead of
+    enumerating all of them.
     """
-    for head in repo.heads:
-        if head.name == branch_name:
-            return head
+    out = repo.git.for_each_ref("--format=%(objectname) %(refname)", *ref_names)
+    shas = {}
+
+    for line in out.splitlines():
+        sha, _, ref_name = line.partition(" ")
 
-    remote = None
+        # The patterns match the refs below the given name as well
+        if ref_name in ref_names:
+            shas[ref_name] = sha
+
+    return shas
+
+
+def find_main_branch(repo, branch_name, remote_name, log):
+    """Resolve the main branch head locally or by creating it from a remote ref.
 
-    for r in repo.remotes:
-        if r.name == remote_name:
-            remote = r
+    Raises `MainBranchNotFoundError` if the branch cannot be found.
+    """
+    head_ref = "refs/heads/%s" % branch_name
+    remote_ref = "refs/remotes/%s/%s" % (remote_name, branch_name)
+    shas = get_ref_shas(repo, head_ref, remote_ref)
 
-            break
+    if head_ref in shas:
+        return ResolvedHead(repo, head_ref, shas[head_ref])
 
-    if remote is None:
-        log.error(
+    if remote_name not in [r.name for r in repo.remotes]:
+        raise MainBranchNotFoundError(
             "Main branch '%s' not found. Couldn't find the remote '%s'."
             % (branch_name, remote_name)
         )
 
-        sys.exit(1)
+    if remote_ref not in shas:
+        raise MainBranchNotFoundError(
+            "Main branch '%s' not found. Failed to find it on the remote '%s'."
+            % (branch_name, remote_name)
+        )
 
-    for ref in remote.refs:
-        if ref.name == "%s/%s" % (remote_name, branch_name):
-            try:
-                return repo.create_head(ref.remote_head, ref)
-            except Exception as e:
-                log.error(
-                    "Main branch '%s' not found. Failed to create head "
-                    "from remote '%s': %s" % (branch_name, remote_name, e)
-                )
+    try:
+        repo.create_head(branch_name, shas[remote_ref])
+    except Exception as e:
+        raise MainBranchNotFoundError(
+            "Main branch '%s' not found. Failed to create head "
+            "from remote '%s': %s" % (branch_name, remote_name, e)
+        ) from e
 
-                sys.exit(1)
+    return ResolvedHead(repo, head_ref, shas[remote_ref])
 
-    log.error(
-        "Main branch '%s' not found. Failed to find it on the remote '%s'."
-        % (branch_name, remote_name)
-    )
 
-    sys.exit(1)
+def is_shallow(repo):
+    """Return True if the repository is a shallow clone."""
+    return os.path.isfile(os.path.join(repo.common_dir, "shallow"))
 
 
-def iter_commit_messages(repo, main_branch, current_branch, dir_path=None):
-    """Yield commit messages on current_branch but not on main_branch.
+def has_merge_base(repo, a, b):
+    """Return True if the merge base of the two commits is present."""
+    try:
+        repo.git.merge_base(a, b)
+    except GitCommandError:
+        return False
+
+    return True
+
+
+def deepen_to_merge_base(repo, main_branch, current_branch, remote_name, log):
+    """Deepen a shallow clone until the merge base of the branches is present.
+
+    The history is fetched from the remote in growing steps (`git fetch
+    --deepen`) so only a little more than the commits down to the merge base
+    is transferred instead of the whole history. Returns False if the merge
+    base can't be fetched.
+    """
+    main_sha = main_branch.commit.hexsha
+    current_sha = current_branch.commit.hexsha
+    depth = DEEPEN_STEP
+
+    while is_shallow(repo) and not has_merge_base(repo, main_sha, current_sha):
+        log.info(
+            "Shallow clone without the merge base of '%s', fetching %d more "
+            "commits from '%s'" % (main_branch.name, depth, remote_name)
+        )
+
+        try:
+            repo.git.fetch("--quiet", "--deepen=%d" % depth, remote_name)
+        except GitCommandError as e:
+            log.warning("Failed to deepen the shallow clone: %s" % e)
+
+            return False
+
+        depth *= 2
+
+    return has_merge_base(repo, main_sha, current_sha)
 
-    If dir_path is given, only yield messages of commits whose changes touched
-    files under that directory. Paths are matched relative to the repo root.
+
+def get_promisor_remote(repo):
+    """Return the name of the remote the missing objects of a partial clone
+    are fetched from (or None if it's not a partial clone)."""
+    config = repo.config_reader()
+
+    # Set by git < 2.29 (newer ones mark the remote as a promisor)
+    if config.has_option("extensions", "partialclone"):
+        return config.get_value("extensions", "partialclone")
+
+    for remote in repo.remotes:
+        if remote.config_reader.get_value("promisor", False):
+            return remote.name
+
+    return None
+
+
+def fetch_blobs(repo, shas, log):
+    """Fetch the missing blobs by as few requests as possible in a partial
+    (e.g. `--filter=blob:none`) clone.
+
+    Git would otherwise fetch each missing blob separately on its first read.
+    Blobs which are present already are not transferred again.
+    """
+    remote = get_promisor_remote(repo)
+
+    if remote is None or not shas:
+        return
+
+    log.debug("Prefetching %d blobs from '%s'" % (len(shas), remote))
+
+    for i in range(0, len(shas), FETCH_CHUNK_SIZE):
+        end = i + FETCH_CHUNK_SIZE
+
+        try:
+            # The same options git uses for the on-demand fetches (no
+            # negotiation of the refs we have, no tags, no FETCH_HEAD)
+            repo.git(c="fetch.negotiationAlgorithm=noop").fetch(
+                "--quiet",
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--recurse-submodules=no",
+                "--filter=blob:none",
+                remote,
+                *shas[i:end],
+            )
+        except GitCommandError as e:
+            log.warning("Failed to prefetch the blobs: %s" % e)
+
+            return
+
+
+def prefetch_blobs(repo, commit_sha, paths, log):
+    """Fetch the blobs of the files (relative to the repo root) of the commit
+    at once in a partial clone (see `fetch_blobs`)."""
+    if not paths or get_promisor_remote(repo) is None:
+        return
+
+    out = repo.git.ls_tree("-z", commit_sha, "--", *paths)
+    shas = [
+        info.split()[2]
+        for info, _, _ in (entry.partition("\t") for entry in out.split("\0"))
+        if info.split()[1:2] == ["blob"]
+    ]
+
+    fetch_blobs(repo, shas, log)
+
+
+def iter_commit_subjects(repo, main_branch, current_branch, dir_path=None):
+    """Lazily yield ``(sha, subject)`` of commits on current_branch but not on
+    main_branch.
+
+    If dir_path is given, only yield commits whose changes touched files under
+    that directory. Paths are matched relative to the repo root. The commits
+    are streamed from `git log` which is stopped when the generator is closed
+    before it's exhausted. Raises `GitCommandError` once exhausted if
+    `git log` failed (e.g. missing objects in a shallow clone).
     """
     rev_range = "%s..%s" % (main_branch.commit.hexsha, current_branch.commit.hexsha)
 
-    kwargs = {}
+    args = ["--format=%H%x00%s", rev_range]
 
     if dir_path:
-        kwargs["paths"] = dir_path
+        args += ["--", dir_path]
+
+    proc = repo.git.log(*args, as_process=True)
+
+    try:
+        for line in proc.stdout:
+            sha, _, subject = (
+                line.decode("utf-8", "replace").rstrip("\n").partition("\0")
+            )
+
+            yield sha, subject
+
+        stderr = proc.proc.stderr.read()
+        status = proc.proc.wait()
+    finally:
+        # Stop the command if the generator was closed early
+        if proc.proc.poll() is None:
+            proc.proc.kill()
+
+        proc.proc.wait()
+        proc.proc.stdout.close()
+        proc.proc.stderr.close()
+
+    if status != 0:
+        raise GitCommandError(["git", "log"] + args, status, stderr)
+
+
+def get_commit_message(repo, sha):
+    """Return the full message of the given commit."""
+    return repo.commit(sha).message
+
+
+def iter_commit_messages(repo, main_branch, current_branch, dir_path=None):
+    """Yield commit messages on current_branch but not on main_branch.
+
+    See `iter_commit_subjects` for the meaning of dir_path.
+    """
+    for sha, _ in iter_commit_subjects(repo, main_branch, current_branch, dir_path):
+        yield get_commit_message(repo, sha)
+
+
+def unmerged_commit_shas(repo, main_branch):
+    """Return SHAs of all commits reachable from any ref but not from
+    main_branch."""
+    out = repo.git.rev_list("--all", "--not", main_branch.commit.hexsha)
 
-    for commit in repo.iter_commits(rev_range, **kwargs):
-        yield commit.message
+    return out.split()
 
 
 def changed_paths_since_main(repo, main_branch):
@@ -0,0 +1,149 @@
+import os
+import subprocess
+import time
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+from hooks.common.sharding import get_item_key
+from hooks.common.shared import get_shared
+
+# Name of the history file inside the cache directory.
+HISTORY_FILE = "history.json"
+
+# Maximum number of entries kept in the history (the least recently run items
+# are dropped first).
+MAX_ENTRIES = 5000
+
+# Weight of the latest duration in the recorded (exponentially smoothed)
+# duration.
+SMOOTHING = 0.5
+
+
+def get_common_dir():
+    """Return the git dir shared by all worktrees of the repository in the
+    current directory (or None if it's not in a git repository)."""
+    return get_shared(("common dir", os.getcwd()), _get_common_dir)
+
+
+def _get_common_dir():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--git-common-dir"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+    common_dir = result.stdout.strip()
+
+    return os.path.abspath(common_dir) if common_dir else None
+
+
+class DurationHistory:
+    """Durations and outcomes of the items tested by a hook in the previous
+    runs.
+
+    The history is stored in the cache directory of the common git dir so it
+    is shared between the worktrees of the repository. Each entry is a
+    ``[duration, failed, timestamp]`` list keyed by ``<hook>:<item>``. The
+    duration is None until a full run of the item completes.
+    """
+
+    def __init__(self, hook, root, log, common_dir=None):
+        self.hook = hook
+        self.root = root
+        self.log = log
+        self.path = None
+        self.entries = {}
+        self.updates = {}
+        self.durations = {}
+
+        if common_dir is None:
+            return
+
+        try:
+            self.path = os.path.join(get_cache_dir(common_dir), HISTORY_FILE)
+
+            with locked(self.path, shared=True):
+                self.entries = self._load()
+        except OSError as e:
+            log.debug("Duration history disabled: %s" % e)
+
+            self.path = None
+
+    def _load(self):
+        data = read_json(self.path)
+
+        if not isinstance(data, dict) or not isinstance(data.get("entries"), dict):
+            return {}
+
+        return {
+            key: entry
+            for key, entry in data["entries"].items()
+            if isinstance(entry, list) and len(entry) == 3
+        }
+
+    def _key(self, item):
+        return "%s:%s" % (self.hook, get_item_key(item, self.root))
+
+    def get(self, item):
+        """Return the ``(duration, failed)`` of the item or None if it has
+        never run."""
+        key = self._key(item)
+        entry = self.updates.get(key) or self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        return entry[0], bool(entry[1])
+
+    def order(self, items):
+        """Return the items which failed the last time first (so `--failfast`
+        fails fast), otherwise in their original order. The items run one
+        after another so their durations don't matter here."""
+        return sorted(items, key=lambda item: not (self.get(item) or (0, False))[1])
+
+    def record(self, item, duration, success):
+        """Record the outcome of the item. The ``duration`` is None if not all
+        tests of the item ran (e.g. only the suites covering the changes or
+        the tests before a `--failfast` failure) and the previous duration is
+        kept then."""
+        self.durations[item] = duration
+
+        previous = self.get(item)
+
+        if previous is not None and previous[0] is not None:
+            if duration is None:
+                duration = previous[0]
+            else:
+                duration = SMOOTHING * duration + (1 - SMOOTHING) * previous[0]
+
+        self.updates[self._key(item)] = [
+            None if duration is None else round(duration, 3),
+            0 if success else 1,
+            int(time.time()),
+        ]
+
+    def save(self):
+        """Merge the recorded entries into the history file."""
+        if self.path is None or not self.updates:
+            return
+
+        try:
+            with locked(self.path):
+                entries = self._load()
+                entries.update(self.updates)
+
+                if len(entries) > MAX_ENTRIES:
+                    keep = sorted(entries, key=lambda k: entries[k][2])[-MAX_ENTRIES:]
+                    entries = {k: entries[k] for k in keep}
+
+                write_json_atomic(self.path, {"entries": entries})
+        except OSError as e:
+            self.log.debug("Failed to save the duration history: %s" % e)
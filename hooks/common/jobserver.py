@@ -0,0 +1,308 @@
+import fcntl
+import logging
+import os
+import re
+import select
+import stat
+import threading
+import time
+from contextlib import contextmanager
+
+from hooks.common.metrics import inc
+from hooks.common.probes import get_user_cache_dir
+
+# Environment variable setting the size of the machine-wide pool of job
+# slots (defaults to the number of CPUs).
+JOBS_ENV = "PRE_COMMIT_HOOKS_JOBS"
+
+# Jobserver option in MAKEFLAGS (`--jobserver-fds` is used by make < 4.2).
+JOBSERVER_AUTH_RE = re.compile(r"--jobserver-(?:auth|fds)=(\S+)")
+
+# Name of the directory inside the user cache directory holding the lock
+# files of the job slots.
+SLOTS_DIR = "jobs"
+
+# Lock file of the implicit token shared by the processes of the same parent.
+IMPLICIT_LOCK_RE = re.compile(r"^implicit-(\d+)\.lock$")
+
+# Interval (seconds) of polling for a free job slot.
+POLL_INTERVAL = 0.05
+
+
+def parse_jobserver_auth(makeflags):
+    """Return the jobserver from MAKEFLAGS as ``("fifo", path)`` or
+    ``("pipe", (read_fd, write_fd))`` or None if there is none."""
+    matches = JOBSERVER_AUTH_RE.findall(makeflags or "")
+
+    if not matches:
+        return None
+
+    # Only the last option is valid
+    auth = matches[-1]
+
+    if auth.startswith("fifo:"):
+        return "fifo", auth[5:]
+
+    try:
+        read_fd, write_fd = (int(fd) for fd in auth.split(","))
+    except ValueError:
+        return None
+
+    return "pipe", (read_fd, write_fd)
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def remove_stale_locks(slots_dir):
+    """Remove the lock files of the implicit tokens of the parent processes
+    which no longer exist."""
+    try:
+        names = os.listdir(slots_dir)
+    except OSError:
+        return
+
+    for name in names:
+        match = IMPLICIT_LOCK_RE.match(name)
+
+        if not match or _pid_exists(int(match.group(1))):
+            continue
+
+        path = os.path.join(slots_dir, name)
+
+        try:
+            with open(path, "a") as f:
+                # Still held by an orphaned job
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def _warn_no_slots(e):
+    logging.getLogger(__name__).warning(
+        "Failed to use the job slots, running without a limit: %s" % e
+    )
+
+
+def get_default_slots():
+    """Return the size of the machine-wide pool of job slots."""
+    try:
+        return max(1, int(os.environ[JOBS_ENV]))
+    except (KeyError, ValueError):
+        return os.cpu_count() or 1
+
+
+class JobLimiter:
+    """Limiter of the number of subprocesses run at once across all hooks.
+
+    Under `make -j` (MAKEFLAGS with `--jobserver-auth`), the GNU make
+    jobserver protocol is used: a job runs either on the implicit token of
+    the make job or on a token read from the jobserver and written back once
+    finished. pre-commit runs a hook as several processes under a single make
+    job, so the implicit token is shared by the processes of the same parent
+    via a lock file and only one job at a time runs on it. The lock files of
+    the parents which no longer exist are removed. If make closes the
+    jobserver or the lock files can't be used, the jobs run without a limit
+    (with a warning in the latter case). Otherwise the jobs share a
+    pool of ``slots`` lock files in the user cache directory so all hooks run
+    by all pre-commit processes of the user run at most ``slots`` jobs at once.
+    The locks are released by the OS even if the hook gets killed.
+    """
+
+    def __init__(self, makeflags=None, slots=None, slots_dir=None):
+        self.read_fd = None
+        self.write_fd = None
+        self.slots = slots or get_default_slots()
+        self.slots_dir = None
+
+        if makeflags is None:
+            makeflags = os.environ.get("MAKEFLAGS", "")
+
+        jobserver = self._open_jobserver(parse_jobserver_auth(makeflags))
+
+        try:
+            self.slots_dir = slots_dir or os.path.join(get_user_cache_dir(), SLOTS_DIR)
+
+            os.makedirs(self.slots_dir, exist_ok=True)
+        except OSError as e:
+            # Run without a limit rather than not at all (under make, the
+            # jobserver can't be used without the implicit token)
+            _warn_no_slots(e)
+
+            self.slots_dir = None
+            self.read_fd = self.write_fd = None
+            jobserver = False
+
+        # Lock file of the implicit token shared by the sibling processes
+        self.implicit_path = None
+
+        if jobserver:
+            remove_stale_locks(self.slots_dir)
+
+            self.implicit_path = os.path.join(
+                self.slots_dir, "implicit-%d.lock" % os.getppid()
+            )
+
+    def _open_jobserver(self, auth):
+        if auth is None:
+            return False
+
+        kind, value = auth
+
+        try:
+            if kind == "fifo":
+                self.read_fd = self.write_fd = os.open(value, os.O_RDWR)
+
+                return True
+
+            # The fds are not inherited if the recipe isn't marked as
+            # recursive (`+` or `$(MAKE)`) and can be reused by other files
+            for fd in value:
+                if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+                    return False
+        except OSError:
+            return False
+
+        self.read_fd, self.write_fd = value
+
+        return True
+
+    def _lock(self, path):
+        """Return the file of the lock taken without blocking or None if the
+        lock is held by another job."""
+        f = open(path, "a")
+
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+
+            return None
+
+        return f
+
+    def _read_token(self, timeout):
+        """Return the token read from the jobserver, None if there is none
+        within ``timeout`` seconds or b"" if make closed the jobserver."""
+        if not select.select([self.read_fd], [], [], timeout)[0]:
+            return None
+
+        try:
+            return os.read(self.read_fd, 1)
+        except BlockingIOError:
+            # Taken by another process in the meantime (make can pass the
+            # pipe in the non-blocking mode)
+            return None
+
+    def _acquire_token(self):
+        """Block until the implicit token or a jobserver token is free.
+        Returns the lock file of the implicit token or None and the token read
+        (None once make closed the jobserver or the implicit token can't be
+        used)."""
+        while True:
+            if self.read_fd is None:
+                # Given up by another thread
+                return None, None
+
+            try:
+                f = self._lock(self.implicit_path)
+            except OSError as e:
+                # Without the implicit token, the jobs could wait forever
+                _warn_no_slots(e)
+
+                self.read_fd = self.write_fd = None
+
+                return None, None
+
+            if f is not None:
+                return f, None
+
+            token = self._read_token(POLL_INTERVAL)
+
+            if token == b"":
+                # make has exited or closed the pipe so there is no limit
+                self.read_fd = self.write_fd = None
+
+                return None, None
+
+            if token is not None:
+                return None, token
+
+    def _acquire_slot(self):
+        while True:
+            for i in range(self.slots):
+                try:
+                    f = self._lock(os.path.join(self.slots_dir, "slot-%d.lock" % i))
+                except OSError as e:
+                    _warn_no_slots(e)
+
+                    self.slots_dir = None
+
+                    return None
+
+                if f is not None:
+                    return f
+
+            time.sleep(POLL_INTERVAL)
+
+    @contextmanager
+    def slot(self):
+        """Hold a job slot for the duration of the block (blocks until one is
+        free)."""
+        if self.read_fd is not None:
+            # The jobserver can be given up by another thread meanwhile
+            write_fd = self.write_fd
+            f, token = self._acquire_token()
+
+            try:
+                yield
+            finally:
+                if f is not None:
+                    f.close()
+
+                if token is not None:
+                    os.write(write_fd, token)
+
+            return
+
+        f = self._acquire_slot() if self.slots_dir is not None else None
+
+        try:
+            yield
+        finally:
+            if f is not None:
+                f.close()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return the job limiter of this process."""
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = JobLimiter()
+
+        return _limiter
+
+
+@contextmanager
+def job_slot():
+    """Hold a job slot of the limiter of this process for the duration of the
+    block. Use it around every subprocess running the actual checks."""
+    with get_limiter().slot():
+        inc("jobs_total")
+
+        yield
@@ -0,0 +1,254 @@
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+from hooks.common import profiling
+from hooks.common.cache import locked, write_atomic
+
+# Environment variable setting the metrics file for entry points which can't
+# take extra arguments (e.g. docker-image).
+METRICS_ENV = "PRE_COMMIT_HOOKS_METRICS_FILE"
+
+# Prefix of all metric names.
+PREFIX = "pre_commit_hook_"
+
+# Metric name (without the prefix) -> (type, help)
+METRICS = {
+    "runs_total": ("counter", "Number of hook runs by exit status."),
+    "duration_seconds_total": ("counter", "Wall time spent in the hook."),
+    "phase_duration_seconds_total": (
+        "counter",
+        "Wall time spent in the individual phases of the hook.",
+    ),
+    "jobs_total": (
+        "counter",
+        "Number of check processes (test runners, containers) run.",
+    ),
+    "items_total": (
+        "counter",
+        "Number of processed items (charts, directories, bats files).",
+    ),
+    "cache_requests_total": ("counter", "Number of cache lookups by result."),
+    "tests_total": ("counter", "Number of tested items by result."),
+    "test_cases_total": ("counter", "Number of test cases by result."),
+    "last_run_timestamp_seconds": (
+        "gauge",
+        "Unix time of the end of the last hook run.",
+    ),
+}
+
+SAMPLE_RE = re.compile(
+    r"^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?P<labels>\{.*\})?\s+(?P<value>\S+)"
+)
+
+
+class Registry:
+    """Samples collected during a hook run."""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.path = None
+        # Counters are incremented by the threads running the batches
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def as_samples(self, **extra_labels):
+        """Return the ``{key: value}`` samples with the extra labels added."""
+        samples = {}
+
+        for values in (self.counters, self.gauges):
+            for (name, labels), value in values.items():
+                labels = dict(labels, **extra_labels)
+
+                samples[format_sample_key(PREFIX + name, labels)] = value
+
+        return samples
+
+
+# Registry of the current hook run
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Increment the counter ``name`` (without the prefix)."""
+    registry.inc(name, value, **labels)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_sample_key(name, labels):
+    if not labels:
+        return name
+
+    return "%s{%s}" % (
+        name,
+        ",".join(
+            '%s="%s"' % (k, escape_label_value(v)) for k, v in sorted(labels.items())
+        ),
+    )
+
+
+def get_short_name(name):
+    """Return the metric name without the prefix (or None if it's not one of
+    our metrics)."""
+    prefix_len = len(PREFIX)
+
+    if name[:prefix_len] == PREFIX:
+        return name[prefix_len:]
+
+
+def parse_samples(content):
+    """Parse samples from Prometheus/OpenMetrics text into a ``{key:
+    value}`` dict. Comments and malformed lines are ignored."""
+    samples = {}
+
+    for line in content.splitlines():
+        if not line or line.startswith("#"):
+            continue
+
+        m = SAMPLE_RE.match(line)
+
+        if m is None:
+            continue
+
+        try:
+            samples[m.group("name") + (m.group("labels") or "")] = float(
+                m.group("value")
+            )
+        except ValueError:
+            continue
+
+    return samples
+
+
+def format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def format_samples(samples, openmetrics=False):
+    """Format the samples as the Prometheus text (or OpenMetrics) format."""
+    families = {}
+
+    for key, value in samples.items():
+        families.setdefault(key.partition("{")[0], []).append((key, value))
+
+    lines = []
+
+    for name in sorted(families):
+        short_name = get_short_name(name)
+
+        if short_name in METRICS:
+            metric_type, help_text = METRICS[short_name]
+            family = name
+
+            # OpenMetrics counter families don't have the _total suffix
+            if openmetrics and metric_type == "counter":
+                family = name.rsplit("_total", 1)[0]
+
+            lines.append("# HELP %s %s" % (family, help_text))
+            lines.append("# TYPE %s %s" % (family, metric_type))
+
+        for key, value in sorted(families[name]):
+            lines.append("%s %s" % (key, format_value(value)))
+
+    if openmetrics:
+        lines.append("# EOF")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, samples):
+    """Add the samples to the metrics file. Counters are summed with the
+    values already in the file while gauges replace them. The file is
+    updated under a lock and atomically replaced so concurrent jobs writing
+    into the same file and the collector reading it are safe."""
+    openmetrics = path.endswith((".om", ".openmetrics"))
+
+    with locked(path):
+        try:
+            with open(path) as f:
+                merged = parse_samples(f.read())
+        except OSError:
+            merged = {}
+
+        for key, value in samples.items():
+            short_name = get_short_name(key.partition("{")[0])
+
+            if METRICS.get(short_name, ("counter",))[0] == "counter":
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged[key] = value
+
+        write_atomic(path, format_samples(merged, openmetrics))
+
+
+def enable_metrics(path=None):
+    """Enable writing of the metrics into ``path`` (or into the file set by
+    the environment variable) at the end of the run."""
+    registry.path = path or os.environ.get(METRICS_ENV) or None
+
+
+def metered(hook):
+    """Decorator for the entry points collecting the run metrics of the hook
+    and writing them into the metrics file if enabled. It must wrap the
+    `profiling.profiled` decorator as the phase durations are taken from the
+    profiler."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global registry
+
+            registry = Registry()
+            status = 1
+            start = time.perf_counter()
+
+            try:
+                result = func(*args, **kwargs)
+                status = result or 0
+
+                return result
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else (1 if e.code else 0)
+
+                raise
+            finally:
+                if registry.path is not None:
+                    _finish(hook, status, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def _finish(hook, status, duration):
+    registry.inc("runs_total", hook=hook, status=status)
+    registry.inc("duration_seconds_total", duration, hook=hook)
+    registry.set("last_run_timestamp_seconds", time.time(), hook=hook)
+
+    for name, (_, wall, _) in profiling.profiler.phases.items():
+        registry.inc("phase_duration_seconds_total", wall, hook=hook, phase=name)
+
+    try:
+        write_metrics(registry.path, registry.as_samples(hook=hook))
+    except OSError as e:
+        logging.getLogger(__name__).warning(
+            "Failed to write metrics into '%s': %s" % (registry.path, e)
+        )
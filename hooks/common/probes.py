@@ -0,0 +1,116 @@
+import os
+import shutil
+import time
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+from hooks.common.metrics import inc
+
+# Name of the probe cache file inside the user cache directory.
+PROBES_FILE = "probes.json"
+
+# Maximum age (seconds) of a cached probe result. The fingerprint covers the
+# tool install and its selected configuration but not e.g. a daemon
+# reconfigured behind the same address.
+MAX_AGE = 24 * 60 * 60
+
+
+def get_user_cache_dir():
+    """Return (and create) the cache directory of these hooks in the user
+    cache directory. Tools are installed per user, not per repository."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+
+    return get_cache_dir(base)
+
+
+def get_fingerprint(binary, extra_paths=(), env_keys=()):
+    """Return the fingerprint of the tool install or None if the binary is
+    not on the PATH.
+
+    The fingerprint consists of the resolved binary path, the mtime and the
+    size of the binary and of the ``extra_paths`` (e.g. the plugin files) and
+    the values of the ``env_keys`` environment variables.
+    """
+    path = shutil.which(binary)
+
+    if path is None:
+        return None
+
+    path = os.path.realpath(path)
+    fingerprint = [path]
+
+    for p in [path] + list(extra_paths):
+        try:
+            st = os.stat(p)
+            fingerprint.append([p, st.st_mtime_ns, st.st_size])
+        except OSError:
+            fingerprint.append([p, None, None])
+
+    fingerprint.extend(os.environ.get(key) for key in env_keys)
+
+    return fingerprint
+
+
+def probe(name, binary, run, extra_paths=(), env_keys=(), max_age=MAX_AGE):
+    """Return the result of the probe ``run`` cached until the tool install
+    changes.
+
+    ``run`` returns a JSON serializable result (e.g. the tool version and
+    capabilities) or None if the tool is not usable. None results are not
+    cached so a fixed install is picked up by the next run.
+    """
+    fingerprint = get_fingerprint(binary, extra_paths, env_keys)
+
+    if fingerprint is None:
+        return run()
+
+    try:
+        path = os.path.join(get_user_cache_dir(), PROBES_FILE)
+
+        with locked(path, shared=True):
+            data = read_json(path)
+    except OSError:
+        return run()
+
+    entry = data.get(name) if isinstance(data, dict) else None
+
+    if (
+        isinstance(entry, dict)
+        and entry.get("fingerprint") == fingerprint
+        and 0 <= time.time() - entry.get("time", 0) < max_age
+    ):
+        inc("cache_requests_total", cache="probes", result="hit")
+
+        return entry.get("result")
+
+    inc("cache_requests_total", cache="probes", result="miss")
+
+    result = run()
+
+    if result is None:
+        return None
+
+    try:
+        with locked(path):
+            data = read_json(path)
+
+            if not isinstance(data, dict):
+                data = {}
+
+            data[name] = {
+                "fingerprint": fingerprint,
+                "time": time.time(),
+                "result": result,
+            }
+
+            write_json_atomic(path, data)
+    except OSError:
+        pass
+
+    return result
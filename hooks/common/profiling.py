@@ -0,0 +1,164 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Environment variable enabling the profiling for entry points which can't
+# take extra arguments (e.g. docker-image). Set it to `1` to print the table
+# or to a file path to write the profile into.
+PROFILE_ENV = "PRE_COMMIT_HOOKS_PROFILE"
+
+
+class Profiler:
+    """Wall and CPU time accumulated per named phase of a hook run."""
+
+    def __init__(self):
+        self.phases = {}
+        self.enabled = False
+        self.output = None
+        self.cprofile = None
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add(self, name, wall, cpu):
+        calls, total_wall, total_cpu = self.phases.get(name, (0, 0.0, 0.0))
+
+        self.phases[name] = (calls + 1, total_wall + wall, total_cpu + cpu)
+
+    def as_dict(self):
+        return {
+            "phases": {
+                name: {"calls": calls, "wall": wall, "cpu": cpu}
+                for name, (calls, wall, cpu) in self.phases.items()
+            },
+            "total": {
+                "wall": time.perf_counter() - self.start_wall,
+                "cpu": time.process_time() - self.start_cpu,
+            },
+        }
+
+    def format_table(self):
+        data = self.as_dict()
+        lines = ["%-24s %6s %10s %10s" % ("phase", "calls", "wall [s]", "cpu [s]")]
+
+        for name, phase_data in data["phases"].items():
+            lines.append(
+                "%-24s %6d %10.4f %10.4f"
+                % (name, phase_data["calls"], phase_data["wall"], phase_data["cpu"])
+            )
+
+        lines.append(
+            "%-24s %6s %10.4f %10.4f"
+            % ("total", "", data["total"]["wall"], data["total"]["cpu"])
+        )
+
+        return "\n".join(lines)
+
+
+# Profiler of the current hook run
+profiler = Profiler()
+
+
+@contextmanager
+def phase(name):
+    """Record the wall and CPU time spent in the block under ``name``."""
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+
+    try:
+        yield
+    finally:
+        profiler.add(
+            name, time.perf_counter() - start_wall, time.process_time() - start_cpu
+        )
+
+
+def get_process_age():
+    """Return the wall time (seconds) since the process started or None if
+    it can't be determined."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The process name can contain spaces so split after it
+            fields = f.read().rpartition(")")[2].split()
+
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def enable_profiling(profile=False, output=None):
+    """Enable reporting of the collected phases at the end of the run.
+
+    The table is printed to stderr. If ``output`` is given, the phases are
+    written into it as JSON when it ends with `.json`, otherwise the
+    function-level cProfile stats are dumped into it.
+    """
+    env = os.environ.get(PROFILE_ENV)
+
+    if env and not profile and output is None:
+        profile = True
+
+        if env != "1":
+            output = env
+
+    if not profile and output is None:
+        return
+
+    profiler.enabled = True
+    profiler.output = output
+
+    # Interpreter startup and module imports happened before the profiler
+    # could measure them. The process age includes the phases recorded since
+    # the profiler was created (e.g. argument parsing) so subtract them.
+    age = get_process_age()
+    startup = 0.0
+
+    if age is not None:
+        startup = max(age - (time.perf_counter() - profiler.start_wall), 0.0)
+
+    profiler.phases = dict(
+        {"startup": (1, startup, profiler.start_cpu)}, **profiler.phases
+    )
+
+    if output is not None and not output.endswith(".json"):
+        profiler.cprofile = cProfile.Profile()
+        profiler.cprofile.enable()
+
+
+def report_profiling():
+    """Print and/or write the collected profile if enabled."""
+    if not profiler.enabled:
+        return
+
+    if profiler.cprofile is not None:
+        profiler.cprofile.disable()
+        profiler.cprofile.dump_stats(profiler.output)
+    elif profiler.output is not None:
+        with open(profiler.output, "w") as f:
+            json.dump(profiler.as_dict(), f, indent=2)
+
+    print(profiler.format_table(), file=sys.stderr)
+
+
+def profiled(func):
+    """Decorator for the entry points resetting the profiler at the start and
+    reporting it at the end of the run."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global profiler
+
+        profiler = Profiler()
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            report_profiling()
+
+    return wrapper
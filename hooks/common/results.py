@@ -0,0 +1,48 @@
+# Action taken by the check.
+ACTION_NONE = "none"
+ACTION_BUMP_REQUIRED = "bump required"
+ACTION_AUTOFIXED = "autofixed"
+ACTION_AUTOFIX_FAILED = "autofix failed"
+
+# Exit code of the hooks if the version has to be incremented.
+BUMP_REQUIRED_STATUS = 127
+
+
+class CheckResult:
+    """Result of the check of a version file.
+
+    ``baseline`` is the version on the main branch (None if the file doesn't
+    exist there), ``current`` the version in the working tree and ``expected``
+    the lowest version which would pass the check (None if the check passed).
+    The Chart.yaml check doesn't parse the chart if it doesn't exist on the
+    main branch (and the fixed strategy is used), so ``current`` is None
+    then.
+    """
+
+    def __init__(self, path, baseline, current, expected=None, action=ACTION_NONE):
+        self.path = path
+        self.baseline = baseline
+        self.current = current
+        self.expected = expected
+        self.action = action
+
+    @property
+    def passed(self):
+        return self.action == ACTION_NONE
+
+    @property
+    def status(self):
+        """Exit code of the hooks for the result."""
+        return 0 if self.passed else BUMP_REQUIRED_STATUS
+
+    def __repr__(self):
+        return (
+            "CheckResult(path=%r, baseline=%r, current=%r, expected=%r, action=%r)"
+            % (
+                self.path,
+                self.baseline,
+                self.current,
+                self.expected,
+                self.action,
+            )
+        )
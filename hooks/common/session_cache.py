@@ -0,0 +1,200 @@
+import os
+import time
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+from hooks.common.get_file_content import get_file_content
+from hooks.common.git_helpers import (
+    changed_paths_since_main,
+    get_commit_message,
+    iter_commit_subjects,
+    prefetch_blobs,
+)
+from hooks.common.metrics import inc
+
+# Name of the session cache file inside the cache directory.
+SESSION_FILE = "session.json"
+
+# Maximum age (seconds) of a session cache entry. Entries are only trusted
+# for the duration of a single `pre-commit run` / `git commit`.
+SESSION_MAX_AGE = 300
+
+
+def get_index_checksum(repo):
+    """Return the trailing checksum of the git index file (or an empty string
+    if there is no index yet)."""
+    try:
+        with open(os.path.join(repo.git_dir, "index"), "rb") as f:
+            f.seek(-20, os.SEEK_END)
+
+            return f.read().hex()
+    except OSError:
+        return ""
+
+
+def get_session_key(repo, main_branch):
+    """Return the key identifying the state the cached data was computed for."""
+    try:
+        head_sha = repo.head.commit.hexsha
+    except ValueError:
+        head_sha = ""
+
+    return [head_sha, main_branch.commit.hexsha, get_index_checksum(repo)]
+
+
+class SessionCache:
+    """Git-derived data shared between hooks running in the same session.
+
+    The first hook populates the cache file in the git dir and the hooks
+    running after it (check-version, check-helm-version at both stages) read
+    the commit messages and main branch file contents from it instead of
+    recomputing them. The cache is invalidated whenever HEAD, the main branch
+    or the index changes. The changed paths include the unstaged working tree
+    changes which the key doesn't cover, so they are kept only in memory
+    (shared by the hooks run in the same process).
+    """
+
+    def __init__(self, repo, main_branch, current_branch, log, enabled=True):
+        self.repo = repo
+        self.main_branch = main_branch
+        self.current_branch = current_branch
+        self.log = log
+        self.enabled = enabled
+        self.dirty = False
+        self.data = {}
+        self.changed = None
+
+        if not enabled:
+            return
+
+        self.key = get_session_key(repo, main_branch)
+
+        # E.g. a read-only or a full cache dir
+        try:
+            self.path = os.path.join(get_cache_dir(repo.git_dir), SESSION_FILE)
+
+            with locked(self.path, shared=True):
+                data = read_json(self.path)
+        except OSError as e:
+            self.log.debug("Session cache disabled: %s" % e)
+
+            self.enabled = False
+
+            return
+
+        if (
+            isinstance(data, dict)
+            and data.get("key") == self.key
+            and time.time() - data.get("created", 0) < SESSION_MAX_AGE
+        ):
+            self.log.debug("Using session cache: %s" % self.path)
+
+            self.data = data
+        else:
+            self.log.debug("Session cache is missing or stale")
+
+            self.data = {"key": self.key, "created": time.time()}
+
+    def _get(self, section, key, compute):
+        values = self.data.setdefault(section, {})
+
+        if key in values:
+            inc("cache_requests_total", cache="session", result="hit")
+        else:
+            inc("cache_requests_total", cache="session", result="miss")
+
+            values[key] = compute()
+
+            self.dirty = True
+
+        return values[key]
+
+    def changed_paths(self):
+        """Version of `changed_paths_since_main` cached in memory only."""
+        if self.changed is None:
+            self.changed = changed_paths_since_main(self.repo, self.main_branch)
+
+        return set(self.changed)
+
+    def commit_subjects(self, dir_path=None):
+        """Cached version of `iter_commit_subjects` for the current branch.
+
+        The commits are still streamed lazily from git when they are not
+        cached yet. Only a fully consumed walk is stored in the cache.
+        """
+        key = dir_path or ""
+        cached = self.data.get("commit_subjects", {}).get(key)
+
+        if cached is not None:
+            inc("cache_requests_total", cache="session", result="hit")
+
+            for sha, subject in cached:
+                yield sha, subject
+
+            return
+
+        inc("cache_requests_total", cache="session", result="miss")
+
+        recorded = []
+
+        for commit in iter_commit_subjects(
+            self.repo, self.main_branch, self.current_branch, dir_path
+        ):
+            recorded.append(commit)
+
+            yield commit
+
+        self.data.setdefault("commit_subjects", {})[key] = recorded
+        self.dirty = True
+
+    def commit_message(self, sha):
+        """Return the full message of the given commit."""
+        return get_commit_message(self.repo, sha)
+
+    def file_content(self, path):
+        """Cached version of `get_file_content` for the main branch."""
+        return self._get(
+            "main_blobs",
+            path,
+            lambda: get_file_content(self.repo, self.main_branch, path),
+        )
+
+    def prefetch_file_contents(self, paths):
+        """Fetch the main branch blobs of the files which are not cached yet
+        at once (in partial clones only)."""
+        cached = self.data.get("main_blobs", {})
+
+        prefetch_blobs(
+            self.repo,
+            self.main_branch.commit.hexsha,
+            [p for p in paths if p not in cached],
+            self.log,
+        )
+
+    def save(self):
+        """Merge the newly computed values into the cache file."""
+        if not self.enabled or not self.dirty:
+            return
+
+        try:
+            with locked(self.path):
+                data = read_json(self.path)
+
+                # Keep values computed by hooks running concurrently with us
+                if isinstance(data, dict) and data.get("key") == self.key:
+                    for section, values in data.items():
+                        if isinstance(values, dict):
+                            for k, v in values.items():
+                                self.data.setdefault(section, {}).setdefault(k, v)
+
+                write_json_atomic(self.path, self.data)
+        except OSError as e:
+            self.log.debug("Failed to write the session cache: %s" % e)
+
+            return
+
+        self.dirty = False
@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import re
+import statistics
+
+from hooks.common.cache import read_json
+
+# Format of the --shard argument value.
+SHARD_RE = re.compile(r"^(\d+)/(\d+)$")
+
+# Weight of the items without a recorded duration if no duration is known at
+# all (only the relative weights matter).
+DEFAULT_DURATION = 1.0
+
+
+def parse_shard(value):
+    """Parse the ``INDEX/TOTAL`` argument value (``INDEX`` is 1-based) into an
+    ``(index, total)`` tuple. Used as an argparse type."""
+    m = SHARD_RE.match(value)
+
+    if m is None or not 1 <= int(m.group(1)) <= int(m.group(2)):
+        raise argparse.ArgumentTypeError(
+            "invalid shard '%s' (expected INDEX/TOTAL with 1 <= INDEX <= TOTAL)" % value
+        )
+
+    return int(m.group(1)), int(m.group(2))
+
+
+def add_shard_arguments(parser):
+    """Add the sharding arguments to the argument parser."""
+    parser.add_argument(
+        "--shard",
+        metavar="INDEX/TOTAL",
+        help="process only the INDEX-th of TOTAL deterministic parts of the items",
+        type=parse_shard,
+    )
+    parser.add_argument(
+        "--shard-durations",
+        metavar="FILE",
+        help=(
+            "balance the shards by the item durations from a shard report "
+            "(can be repeated)"
+        ),
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--shard-report",
+        metavar="FILE",
+        help="write the items owned by the shard and their durations into FILE",
+    )
+
+
+def get_item_key(path, root):
+    """Return the key identifying the item on all nodes (the path relative to
+    the root if it's inside of it)."""
+    rel_path = os.path.relpath(os.path.abspath(path), root)
+
+    if rel_path.startswith(os.pardir + os.sep):
+        return str(path)
+
+    return rel_path
+
+
+def load_durations(paths, log):
+    """Return the merged ``{key: duration}`` from the shard report files.
+    Unreadable files are ignored so a missing history only affects the
+    balance, not the correctness of the sharding."""
+    durations = {}
+
+    for path in paths:
+        data = read_json(path)
+
+        if not isinstance(data, dict) or not isinstance(data.get("items"), dict):
+            log.warning("Ignoring invalid shard durations file '%s'" % path)
+
+            continue
+
+        for key, duration in data["items"].items():
+            if isinstance(duration, (int, float)):
+                durations[key] = duration
+
+    return durations
+
+
+def partition(keys, total, durations=None):
+    """Split the keys into ``total`` lists with a similar sum of durations.
+
+    The items are assigned longest first to the least loaded shard (ties are
+    broken by the key and by the shard index) so every node computes the same
+    partition from the same keys and durations. Items without a duration are
+    weighted by the median of the known ones.
+    """
+    durations = durations or {}
+    known = [durations[key] for key in keys if key in durations]
+    default = statistics.median(known) if known else DEFAULT_DURATION
+
+    weights = {key: durations.get(key, default) for key in keys}
+    shards = [[] for _ in range(total)]
+    loads = [0.0] * total
+
+    for key in sorted(set(keys), key=lambda k: (-weights[k], k)):
+        i = min(range(total), key=lambda n: (loads[n], n))
+
+        shards[i].append(key)
+        loads[i] += weights[key]
+
+    return [sorted(shard) for shard in shards]
+
+
+def select_shard(items, shard, root, durations, log):
+    """Return the items (in their original order) owned by the shard."""
+    index, total = shard
+    keys = {item: get_item_key(item, root) for item in items}
+    owned = set(partition(list(keys.values()), total, durations)[index - 1])
+    selected = [item for item in items if keys[item] in owned]
+
+    log.info(
+        "Shard %d/%d owns %d of %d item(s):" % (index, total, len(selected), len(items))
+    )
+
+    for item in selected:
+        log.info("  - %s" % keys[item])
+
+    return selected
+
+
+def write_shard_report(path, shard, items, root):
+    """Write the owned items and their durations (None if not run).
+
+    ``items`` is a ``{item: duration}`` dict. The report can be passed to
+    `--shard-durations` of the next run.
+    """
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "shard": "%d/%d" % shard if shard else None,
+                "items": {
+                    get_item_key(item, root): duration
+                    for item, duration in items.items()
+                },
+            },
+            f,
+            indent=2,
+        )
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+
+# Values shared by the hooks run in the current scope (None outside of it).
+_values = None
+
+
+@contextmanager
+def shared_scope():
+    """Share the values of `get_shared` between all hooks run (in this
+    process) inside the block, e.g. the opened repo, the resolved main branch
+    and the session cache of the hooks run by `check-all`."""
+    global _values
+
+    previous = _values
+    _values = {}
+
+    try:
+        yield
+    finally:
+        _values = previous
+
+
+def get_shared(key, compute):
+    """Return the value of ``compute()`` computed only once per key inside the
+    `shared_scope` block (and on every call outside of it)."""
+    if _values is None:
+        return compute()
+
+    if key not in _values:
+        _values[key] = compute()
+
+    return _values[key]
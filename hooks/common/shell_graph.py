@@ -0,0 +1,226 @@
+import hashlib
+import os
+import re
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+
+# Name of the index file inside the cache directory.
+INDEX_FILE = "shell_index.json"
+
+# Suffixes of the indexed files.
+SHELL_SUFFIXES = (".sh", ".bash", ".bats")
+
+# `source FILE`, `. FILE` and the bats `load FILE` (also after `;`, `&&`,
+# `||`, `then` and `do` on the same line)
+SOURCE_RE = re.compile(
+    r"""(?:^|[;&|]|\bthen\b|\bdo\b)\s*
+    (?P<keyword>source|\.|load|bats_load_library)\s+
+    (?P<ref>(?:\$\([^)]*\)|"(?:\$\([^)]*\)|[^"])*"|'[^']*'|[^\s;&|)"'$]+|\$)+)""",
+    re.MULTILINE | re.VERBOSE,
+)
+
+# Expressions expanding to the directory of the current file
+DIR_EXPR_RE = re.compile(
+    r"""\$\(\s*dirname\s+"?\$(?:\{BASH_SOURCE(?:\[0\])?\}|BASH_SOURCE|\{0\}|0)"?\s*\)
+    |\$\{BASH_SOURCE(?:\[0\])?%/\*\}
+    |\$\{?BATS_TEST_DIRNAME\}?""",
+    re.VERBOSE,
+)
+
+# Any other shell expansion
+EXPANSION_RE = re.compile(r"\$\{[^}]*\}|\$\([^)]*\)|\$\w+|`[^`]*`")
+
+
+def parse_references(content):
+    """Return the ``[keyword, ref]`` pairs of the files sourced or loaded by
+    the shell content."""
+    return [
+        [m.group("keyword"), re.sub("[\"']", "", m.group("ref"))]
+        for m in SOURCE_RE.finditer(content)
+        if not m.group("ref").startswith("#")
+    ]
+
+
+def resolve_reference(keyword, ref, file_dir, root, known):
+    """Return the set of the absolute paths the reference can point to.
+
+    Relative references are resolved against the directory of the file and
+    against the root (the shell resolves them against the current directory
+    which is usually one of them).
+
+    References with unknown variables (e.g. `$LIB_DIR/common.sh`) are matched
+    by their literal suffix against the ``known`` files so a change of the
+    referenced file rather selects too many tests than none.
+    """
+    ref = DIR_EXPR_RE.sub(lambda _: file_dir, ref)
+    candidates = [ref]
+
+    # bats `load` adds the `.bash` suffix to the file name
+    if keyword in ("load", "bats_load_library"):
+        candidates.append(ref + ".bash")
+
+    if EXPANSION_RE.search(ref) is None:
+        return {
+            os.path.normpath(os.path.join(base, c))
+            for base in (file_dir, root)
+            for c in candidates
+            if os.path.isfile(os.path.join(base, c))
+        }
+
+    paths = set()
+
+    for c in candidates:
+        # Only the part after the last expansion and the last `..` is known
+        suffix = re.sub(r"^(\./)+", "", EXPANSION_RE.split(c)[-1].split("../")[-1])
+        suffix = suffix.lstrip("/")
+
+        if not suffix:
+            continue
+
+        paths.update(p for p in known if p.endswith(os.sep + suffix) or p == suffix)
+
+    return paths
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ShellIndex:
+    """Index of the `source`/`.`/`load` references of the shell scripts and
+    bats files under the root directory.
+
+    The index is stored in the cache directory of the given git dir. A file
+    is re-parsed only if its mtime or size and its content hash changed.
+    """
+
+    def __init__(self, root, log, git_dir=None):
+        self.root = os.path.abspath(root)
+        self.log = log
+        self.path = None
+        self.files = {}
+        self.dirty = False
+
+        if git_dir is None:
+            return
+
+        try:
+            self.path = os.path.join(get_cache_dir(git_dir), INDEX_FILE)
+
+            with locked(self.path, shared=True):
+                data = read_json(self.path)
+        except OSError as e:
+            log.debug("Shell index cache disabled: %s" % e)
+
+            self.path = None
+
+            return
+
+        if isinstance(data, dict) and isinstance(data.get("files"), dict):
+            self.files = {
+                rel_path: entry
+                for rel_path, entry in data["files"].items()
+                if isinstance(entry, list) and len(entry) == 4
+            }
+
+    def _walk(self):
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+
+            for file_name in file_names:
+                if file_name.endswith(SHELL_SUFFIXES):
+                    yield os.path.join(dir_path, file_name)
+
+    def update(self):
+        """Re-index the new and changed files and drop the removed ones."""
+        files = {}
+
+        for path in self._walk():
+            rel_path = os.path.relpath(path, self.root)
+            entry = self.files.get(rel_path)
+
+            try:
+                st = os.stat(path)
+
+                if entry is not None and entry[:2] == [st.st_mtime_ns, st.st_size]:
+                    files[rel_path] = entry
+
+                    continue
+
+                digest = _hash_file(path)
+
+                if entry is not None and entry[2] == digest:
+                    refs = entry[3]
+                else:
+                    with open(path, errors="replace") as f:
+                        refs = parse_references(f.read())
+            except OSError as e:
+                self.log.debug("Failed to index %s: %s" % (path, e))
+
+                continue
+
+            files[rel_path] = [st.st_mtime_ns, st.st_size, digest, refs]
+            self.dirty = True
+
+        if files.keys() != self.files.keys():
+            self.dirty = True
+
+        self.files = files
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        try:
+            with locked(self.path):
+                write_json_atomic(self.path, {"files": self.files})
+        except OSError as e:
+            self.log.debug("Failed to save the shell index: %s" % e)
+
+    def get_dependents(self):
+        """Return the reverse graph ``{path: {paths sourcing it}}`` with
+        absolute paths."""
+        known = {os.path.join(self.root, rel_path) for rel_path in self.files}
+        dependents = {}
+
+        for rel_path, entry in self.files.items():
+            path = os.path.join(self.root, rel_path)
+            file_dir = os.path.dirname(path)
+
+            for keyword, ref in entry[3]:
+                for dep in resolve_reference(keyword, ref, file_dir, self.root, known):
+                    if dep != path:
+                        dependents.setdefault(dep, set()).add(path)
+
+        return dependents
+
+
+def find_affected_files(changed_files, root, log, git_dir=None, index=None):
+    """Return the absolute paths of the changed files and of all the shell
+    scripts and bats files which (transitively) source or load them. An
+    already loaded ``index`` (e.g. in the watch mode) is only updated."""
+    if index is None:
+        index = ShellIndex(root, log, git_dir)
+
+    index.update()
+    index.save()
+
+    dependents = index.get_dependents()
+    affected = {os.path.abspath(os.path.join(root, f)) for f in changed_files}
+    queue = list(affected)
+
+    while queue:
+        for dependent in dependents.get(queue.pop(), ()):
+            if dependent not in affected:
+                log.debug("%s sources a changed file" % dependent)
+
+                affected.add(dependent)
+                queue.append(dependent)
+
+    return affected
@@ -0,0 +1,260 @@
+import fnmatch
+import hashlib
+import os
+from pathlib import Path
+
+from ruamel.yaml import YAML
+from ruamel.yaml.error import YAMLError
+
+from hooks.common.cache import (
+    get_cache_dir,
+    locked,
+    read_json,
+    write_json_atomic,
+)
+
+# Name of the index file inside the cache directory.
+INDEX_FILE = "suite_index.json"
+
+# Directory of the chart templates.
+TEMPLATES_DIR = "templates"
+
+# Directory and suffix of the snapshot files of the suites.
+SNAPSHOT_DIR = "__snapshot__"
+SNAPSHOT_SUFFIX = ".snap"
+
+
+def parse_suite(content, yaml):
+    """Return the ``[templates, values]`` of the helm unittest suite.
+
+    ``templates`` are the patterns of the templates (relative to the
+    `templates` directory) rendered by the suite or None if the suite renders
+    all templates. ``values`` are the values files used by the suite (relative
+    to the suite file).
+    """
+    templates = set()
+    values = set()
+    all_templates = False
+
+    try:
+        docs = list(yaml.load_all(content))
+    except YAMLError:
+        return [None, []]
+
+    for doc in docs:
+        if not isinstance(doc, dict):
+            continue
+
+        if isinstance(doc.get("templates"), list) and doc["templates"]:
+            templates.update(str(t) for t in doc["templates"])
+        else:
+            all_templates = True
+
+        tests = doc.get("tests") if isinstance(doc.get("tests"), list) else []
+
+        for item in [doc] + tests:
+            if isinstance(item, dict) and isinstance(item.get("values"), list):
+                values.update(str(v) for v in item["values"])
+
+    if all_templates or not templates:
+        return [None, sorted(values)]
+
+    prefix = TEMPLATES_DIR + "/"
+    prefix_len = len(prefix)
+
+    return [
+        sorted(t[prefix_len:] if t.startswith(prefix) else t for t in templates),
+        sorted(values),
+    ]
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class SuiteIndex:
+    """Index of the templates and values files used by the helm unittest
+    suites.
+
+    The index is stored in the cache directory of the given git dir. A suite
+    is re-parsed only if its mtime or size and its content hash changed. The
+    suites already checked by this instance aren't checked again until they
+    are passed to `invalidate` (the watch mode does it for the changed
+    files).
+    """
+
+    def __init__(self, root, log, git_dir=None):
+        self.root = os.path.abspath(root)
+        self.log = log
+        self.path = None
+        self.suites = {}
+        self.dirty = False
+        self.checked = set()
+        self.yaml = YAML(typ="safe")
+
+        if git_dir is None:
+            return
+
+        try:
+            self.path = os.path.join(get_cache_dir(git_dir), INDEX_FILE)
+
+            with locked(self.path, shared=True):
+                data = read_json(self.path)
+        except OSError as e:
+            log.debug("Suite index cache disabled: %s" % e)
+
+            self.path = None
+
+            return
+
+        if isinstance(data, dict) and isinstance(data.get("suites"), dict):
+            self.suites = {
+                rel_path: entry
+                for rel_path, entry in data["suites"].items()
+                if isinstance(entry, list) and len(entry) == 5
+            }
+
+    def get(self, suite_path):
+        """Return the ``[templates, values]`` of the suite (see
+        `parse_suite`)."""
+        path = os.path.abspath(suite_path)
+        rel_path = os.path.relpath(path, self.root)
+        entry = self.suites.get(rel_path)
+
+        if entry is not None and rel_path in self.checked:
+            return entry[3:]
+
+        try:
+            st = os.stat(path)
+
+            if entry is not None and entry[:2] == [st.st_mtime_ns, st.st_size]:
+                self.checked.add(rel_path)
+
+                return entry[3:]
+
+            digest = _hash_file(path)
+
+            if entry is not None and entry[2] == digest:
+                parsed = entry[3:]
+            else:
+                with open(path, errors="replace") as f:
+                    parsed = parse_suite(f.read(), self.yaml)
+        except OSError as e:
+            self.log.debug("Failed to index %s: %s" % (path, e))
+
+            return [None, []]
+
+        self.suites[rel_path] = [st.st_mtime_ns, st.st_size, digest] + parsed
+        self.checked.add(rel_path)
+        self.dirty = True
+
+        return parsed
+
+    def invalidate(self, paths):
+        """Check the given suites again on their next `get`."""
+        for path in paths:
+            self.checked.discard(os.path.relpath(os.path.realpath(path), self.root))
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        try:
+            with locked(self.path):
+                data = read_json(self.path)
+
+                # Keep the suites of the charts indexed by other runs
+                suites = data.get("suites") if isinstance(data, dict) else None
+                suites = suites if isinstance(suites, dict) else {}
+                suites.update(self.suites)
+
+                write_json_atomic(
+                    self.path,
+                    {
+                        "suites": {
+                            rel_path: entry
+                            for rel_path, entry in suites.items()
+                            if os.path.isfile(os.path.join(self.root, rel_path))
+                        }
+                    },
+                )
+        except OSError as e:
+            self.log.debug("Failed to save the suite index: %s" % e)
+
+
+def select_suites(chart_dir, changed_files, tests_path, test_files, index, log):
+    """Return the paths (relative to the chart directory) of the suites
+    affected by the changed files or None if all suites are affected.
+
+    Only the suites rendering a changed template, the changed suites and the
+    suites using a changed values file or snapshot are affected. All suites
+    are affected by a change of any other file of the chart (e.g.
+    `Chart.yaml`, `values.yaml` or the `_*.tpl` helpers) or if no file of
+    the chart changed (e.g. the chart depends on a changed chart).
+    """
+    chart_dir = Path(chart_dir).resolve()
+    tests_dir = chart_dir / tests_path
+    suites = {p.resolve(): p.relative_to(chart_dir) for p in tests_dir.glob(test_files)}
+    selected = set()
+    templates = set()
+    others = set()
+
+    for changed_file in changed_files:
+        path = Path(changed_file).resolve()
+
+        try:
+            rel_path = path.relative_to(chart_dir)
+        except ValueError:
+            continue
+
+        if rel_path.parts[0] == TEMPLATES_DIR and len(rel_path.parts) > 1:
+            # Helpers can be included by any template
+            if path.name.startswith("_") or path.suffix == ".tpl":
+                log.debug("Helper %s changed, running all suites" % rel_path)
+
+                return None
+
+            templates.add(rel_path.relative_to(TEMPLATES_DIR).as_posix())
+        elif path in suites:
+            selected.add(path)
+        else:
+            others.add(path)
+
+    if not templates and not selected and not others:
+        return None
+
+    used = set()
+
+    for suite in suites:
+        suite_templates, suite_values = index.get(suite)
+
+        if templates and (
+            suite_templates is None
+            or any(
+                fnmatch.fnmatch(t, pattern)
+                for t in templates
+                for pattern in suite_templates
+            )
+        ):
+            selected.add(suite)
+
+        snapshot = suite.parent / SNAPSHOT_DIR / (suite.name + SNAPSHOT_SUFFIX)
+        suite_used = others & {
+            snapshot,
+            *((suite.parent / v).resolve() for v in suite_values),
+        }
+
+        if suite_used:
+            selected.add(suite)
+            used.update(suite_used)
+
+    # Files not used by the suites affect the templates (e.g. `values.yaml`)
+    # unless they are in the tests directory
+    for path in sorted(others - used):
+        if tests_dir not in path.parents:
+            log.debug("%s changed, running all suites" % path.relative_to(chart_dir))
+
+            return None
+
+    return sorted(suites[p].as_posix() for p in selected)
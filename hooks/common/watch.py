@@ -0,0 +1,276 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# inotify event flags (see inotify(7)).
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# Events of the watched directories reported as changes. Modifications are
+# reported once the file is closed so a change is never seen half-written.
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Header of the inotify event (wd, mask, cookie, length of the name).
+EVENT_HEADER = struct.Struct("iIII")
+
+# Time (seconds) without any change after which a burst of writes is
+# considered finished.
+DEBOUNCE = 0.2
+
+# Interval (seconds) of scanning the trees if inotify is not available. It's
+# doubled after every scan without a change up to `POLL_MAX_INTERVAL`.
+POLL_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 5.0
+
+
+def _walk(root, recursive=True):
+    """`os.walk` of the tree skipping the hidden directories (e.g. `.git`).
+    Only the root directory itself is listed unless ``recursive``."""
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if recursive and not d.startswith(".")]
+
+        yield dir_path, dir_names, file_names
+
+
+def _walk_roots(roots, shallow_roots):
+    for root in roots:
+        yield from _walk(root)
+
+    for root in shallow_roots:
+        yield from _walk(root, recursive=False)
+
+
+class InotifyWatcher:
+    """Watcher of the directory trees using the Linux inotify API (via libc,
+    so no extra dependency is needed). New directories are watched as they
+    are created. The subdirectories of the ``shallow_roots`` aren't
+    watched."""
+
+    def __init__(self, roots, shallow_roots=()):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.roots = roots
+        self.shallow_roots = {os.path.normpath(r) for r in shallow_roots}
+        self.dirs = {}
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Failed to initialize inotify")
+
+        try:
+            for root in roots:
+                self._add_tree(root)
+
+            for root in shallow_roots:
+                self._add_tree(root, recursive=False)
+        except OSError:
+            self.close()
+
+            raise
+
+    def _add_tree(self, root, recursive=True):
+        """Watch all directories of the tree and return the files in it."""
+        files = set()
+
+        for dir_path, _, file_names in _walk(root, recursive):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+
+            if wd < 0:
+                err = ctypes.get_errno()
+
+                # The directory was removed in the meantime
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+
+                # E.g. ENOSPC if the limit of the watches was reached
+                raise OSError(err, "Failed to watch %s" % dir_path)
+
+            self.dirs[wd] = dir_path
+
+            files.update(os.path.join(dir_path, f) for f in file_names)
+
+        return files
+
+    def wait(self, timeout=None):
+        """Wait for a change at most ``timeout`` seconds (forever if None).
+        Returns whether there is a change to be read."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+
+        return bool(ready)
+
+    def read(self):
+        """Return the set of the paths changed since the last read."""
+        paths = set()
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name_start = offset + EVENT_HEADER.size
+                offset = name_start + length
+                name = os.fsdecode(data[name_start:offset].rstrip(b"\0"))
+
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost so any file could have changed
+                    paths.update(
+                        os.path.normpath(os.path.join(dir_path, f))
+                        for dir_path, _, file_names in _walk_roots(
+                            self.roots, self.shallow_roots
+                        )
+                        for f in file_names
+                    )
+
+                    continue
+
+                if mask & IN_IGNORED:
+                    # The watched directory was removed
+                    self.dirs.pop(wd, None)
+
+                    continue
+
+                if wd not in self.dirs or not name:
+                    continue
+
+                path = os.path.normpath(os.path.join(self.dirs[wd], name))
+
+                if not mask & IN_ISDIR:
+                    paths.add(path)
+                elif (
+                    mask & (IN_CREATE | IN_MOVED_TO)
+                    and not name.startswith(".")
+                    and os.path.normpath(self.dirs[wd]) not in self.shallow_roots
+                ):
+                    # Files of a directory moved into the tree are changes too
+                    paths.update(os.path.normpath(p) for p in self._add_tree(path))
+
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watcher of the directory trees comparing the mtimes and sizes of the
+    files every ``interval``. The interval is doubled after every scan
+    without a change up to ``max_interval``. The subdirectories of the
+    ``shallow_roots`` aren't scanned."""
+
+    def __init__(
+        self,
+        roots,
+        shallow_roots=(),
+        interval=POLL_INTERVAL,
+        max_interval=POLL_MAX_INTERVAL,
+    ):
+        self.roots = roots
+        self.shallow_roots = shallow_roots
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+        self.files = self._scan()
+        self.changed = set()
+
+    def _scan(self):
+        files = {}
+
+        for dir_path, _, file_names in _walk_roots(self.roots, self.shallow_roots):
+            for file_name in file_names:
+                path = os.path.normpath(os.path.join(dir_path, file_name))
+
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+
+                files[path] = (st.st_mtime_ns, st.st_size)
+
+        return files
+
+    def wait(self, timeout=None):
+        """Wait for a change at most ``timeout`` seconds (forever if None).
+        Returns whether there is a change to be read."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not self.changed:
+            remaining = self.interval
+
+            if deadline is not None:
+                remaining = min(remaining, deadline - time.monotonic())
+
+                if remaining <= 0:
+                    break
+
+            time.sleep(remaining)
+
+            files = self._scan()
+            self.changed = {
+                path
+                for path in files.keys() | self.files.keys()
+                if files.get(path) != self.files.get(path)
+            }
+            self.files = files
+
+            if self.changed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+
+        return bool(self.changed)
+
+    def read(self):
+        """Return the set of the paths changed since the last read."""
+        paths = self.changed
+        self.changed = set()
+
+        return paths
+
+    def close(self):
+        pass
+
+
+def open_watcher(roots, log, shallow_roots=()):
+    """Return the inotify watcher of the directory trees or the polling one if
+    inotify is not available. Only the files directly in the
+    ``shallow_roots`` are watched."""
+    try:
+        return InotifyWatcher(roots, shallow_roots)
+    except (OSError, AttributeError) as e:
+        log.info("Polling for changes as inotify is not available: %s" % e)
+
+        return PollingWatcher(roots, shallow_roots)
+
+
+def iter_changes(watcher, debounce=DEBOUNCE):
+    """Yield the sets of the changed paths. A set is yielded once a burst of
+    writes (e.g. an editor saving several files) is over, that is when no
+    change came for ``debounce`` seconds."""
+    while True:
+        watcher.wait()
+
+        changed = watcher.read()
+
+        while watcher.wait(debounce):
+            changed |= watcher.read()
+
+        if changed:
+            yield changed
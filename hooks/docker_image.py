@@ -215,9 +215,22 @@ def run_hook(
 # https://github.com/pre-commit/pre-commit/pull/2242, extended with an extra
 # `/.dockerenv` marker-file detection signal.
 # =============================================================================
+import codecs
+import subprocess
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from pre_commit import xargs
+from pre_commit.parse_shebang import ExecutableNotFoundError, normalize_cmd
+
+from hooks.common.jobserver import job_slot
+from hooks.common.metrics import enable_metrics, metered
+from hooks.common.probes import probe
+from hooks.common.profiling import enable_profiling, phase, profiled
+
 # Keep a reference to the upstream implementation so the combined version below
 # can still call it as the primary detection method.
 _get_container_id_mountinfo = _get_container_id
@@ -243,9 +256,78 @@ DOCKER_PS = ("docker", "ps", "--format", "{{ .ID }}")
 # Command to inspect Docker container (container ID is appended at call site).
 DOCKER_INSPECT = ("docker", "inspect")
 
+# Path to the mount table of this process.
+PROC_MOUNTINFO = "/proc/self/mountinfo"
+
 # Mockable command-line arguments.
 SYS_ARGV = sys.argv
 
+# Maximum size of the output chunk forwarded at once from the container.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# docker run options without a value.
+DOCKER_RUN_FLAGS = frozenset(
+    (
+        "-d",
+        "--detach",
+        "-i",
+        "--interactive",
+        "-t",
+        "--tty",
+        "-P",
+        "--publish-all",
+        "-q",
+        "--quiet",
+        "--rm",
+        "--init",
+        "--privileged",
+        "--read-only",
+        "--no-healthcheck",
+        "--oom-kill-disable",
+    )
+)
+
+# Label of the warm containers.
+WARM_LABEL = "jtyr-pre-commit-hooks.warm"
+
+# Label holding the JSON `[entrypoint, cmd]` of the image of a warm container.
+WARM_CONFIG_LABEL = "jtyr-pre-commit-hooks.config"
+
+# Default idle time (seconds) after which a warm container stops itself.
+WARM_TIMEOUT = 600
+
+# States of a warm container in which it's removed before starting a new one.
+WARM_REMOVABLE_STATES = ("exited", "dead")
+
+# File touched inside the warm container while it's used.
+WARM_MARKER = "/tmp/.pre-commit-warm"
+
+# Main process of the warm container exiting once the marker is not touched
+# for the given number of minutes.
+WARM_LOOP = (
+    "touch {marker}; "
+    'while [ -n "$(find {marker} -mmin -{minutes})" ]; do sleep 10; done'
+)
+
+# Wrapper of the command executed in the warm container keeping the marker
+# fresh while the command runs.
+WARM_EXEC = (
+    "(while :; do touch {marker}; sleep 10; done) >/dev/null 2>&1 & t=$!; "
+    '"$@"; rc=$?; kill $t; touch {marker}; exit $rc'
+)
+
+# Strategies of mounting the working directory into the container.
+MOUNT_AUTO = "auto"
+MOUNT_BIND = "bind"
+MOUNT_VOLUMES_FROM = "volumes-from"
+MOUNT_STRATEGIES = (MOUNT_AUTO, MOUNT_BIND, MOUNT_VOLUMES_FROM)
+
+# Marker put at the end of the hook args separating them from the file names
+# appended by pre-commit. The file names are then split into batches. The
+# marker is kept at the end of the command of each batch so it still protects
+# the file names starting with a dash.
+FILES_MARKER = "--"
+
 
 # -------- Detection signals --------
 
@@ -422,28 +504,593 @@ def _get_container_id() -> str | None:  # type: ignore[no-redef]
     return None
 
 
+# -------- Override the upstream `_is_rootless` --------
+
+
+# Environment variables selecting the Docker daemon.
+DOCKER_ENV_KEYS = ("DOCKER_HOST", "DOCKER_CONTEXT", "DOCKER_CONFIG")
+
+
+def _probe_docker() -> dict | None:
+    """Return the info about the Docker daemon or None if it's not
+    reachable."""
+    retcode, out, _ = cmd_output_b(
+        "docker",
+        "system",
+        "info",
+        "--format",
+        "{{ json . }}",
+        check=False,
+    )
+    if retcode != 0:
+        return None
+
+    info = json.loads(out)
+    try:
+        rootless = bool(
+            "name=rootless" in (info.get("SecurityOptions") or ())
+            or info["host"]["security"]["rootless"]
+        )
+    except KeyError:
+        rootless = False
+
+    return {
+        "version": info.get("ServerVersion") or info.get("version", {}).get("Version"),
+        "rootless": rootless,
+    }
+
+
+def _get_docker_config() -> str:
+    """Return the path of the Docker client config (it holds the current
+    context)."""
+    config_dir = os.environ.get("DOCKER_CONFIG") or os.path.join(
+        os.path.expanduser("~"), ".docker"
+    )
+
+    return os.path.join(config_dir, "config.json")
+
+
+def get_docker_info() -> dict | None:
+    """Return the info about the Docker daemon (`version`, `rootless`) or
+    None if it's not reachable. The result is cached until the docker binary
+    or the daemon selection (the environment or the client config)
+    changes."""
+    return probe(
+        "docker",
+        "docker",
+        _probe_docker,
+        extra_paths=[_get_docker_config()],
+        env_keys=DOCKER_ENV_KEYS,
+    )
+
+
+def _is_rootless() -> bool:  # type: ignore[no-redef]  # noqa: F811
+    """Cached version of the upstream `_is_rootless`."""
+    info = get_docker_info()
+
+    return info is not None and info["rootless"]
+
+
+# -------- Override the upstream `docker_cmd` --------
+
+# Octal escapes of spaces and other special characters in the mount table.
+MOUNTINFO_ESCAPE_RE = re.compile(rb"\\([0-7]{3})")
+
+
+def _is_mounted(path: str) -> bool:
+    """Return True if the path is on a volume or a bind mount (i.e. not on the
+    root filesystem of this container)."""
+    try:
+        with open(PROC_MOUNTINFO, "rb") as f:
+            for line in f:
+                fields = line.split(b" ")
+
+                if len(fields) < 5:
+                    continue
+
+                mount_point = os.fsdecode(
+                    MOUNTINFO_ESCAPE_RE.sub(lambda m: bytes((int(m[1], 8),)), fields[4])
+                )
+
+                if (
+                    mount_point != "/"
+                    and os.path.commonpath((path, mount_point)) == mount_point
+                ):
+                    return True
+    except FileNotFoundError:
+        return False
+
+    return False
+
+
+def _is_local_daemon() -> bool:
+    """Return True if the Docker daemon is selected via the default context
+    or a unix socket. A remote daemon (e.g. a `docker:dind` service) can't see
+    the container this hook runs in."""
+    host = os.environ.get("DOCKER_HOST", "")
+    context = os.environ.get("DOCKER_CONTEXT", "")
+
+    return (not host or host.startswith("unix://")) and context in ("", "default")
+
+
+def _get_docker_mount(mount: str, container: str | None) -> tuple[str, ...]:
+    """Return the docker run options mounting the working directory.
+
+    The `volumes-from` strategy mounts all the volumes of the container this
+    hook runs in at the same paths so no path translation (and no
+    `docker inspect`) is needed. The `auto` strategy uses it if the container
+    is detected, the Docker daemon is local and the working directory is on a
+    volume. Otherwise the working directory is bind mounted to `/src`.
+    """
+    path = os.getcwd()
+
+    if mount != MOUNT_BIND:
+        if container is None and (mount == MOUNT_VOLUMES_FROM or _is_local_daemon()):
+            container = _get_container_id()
+
+            if container is None and mount == MOUNT_AUTO:
+                # Not in a container so there is no path to translate
+                return ("-v", f"{path}:/src:rw,Z", "--workdir", "/src")
+
+        if container is not None and (mount == MOUNT_VOLUMES_FROM or _is_mounted(path)):
+            return ("--volumes-from", container, "--workdir", path)
+
+    return ("-v", f"{_get_docker_path(path)}:/src:rw,Z", "--workdir", "/src")
+
+
+def docker_cmd(  # type: ignore[no-redef]  # noqa: F811
+    *, color: bool, mount: str = MOUNT_BIND, container: str | None = None
+) -> tuple[str, ...]:
+    """Upstream `docker_cmd` with a selectable mount strategy of the working
+    directory (see `_get_docker_mount`)."""
+    return (
+        "docker",
+        "run",
+        "--rm",
+        *get_docker_tty(color=color),
+        *get_docker_user(),
+        *_get_docker_mount(mount, container),
+    )
+
+
+# -------- Streaming of the container output --------
+
+
+def _forward_stream(pipe, stream) -> None:
+    """Copy the pipe into the stream chunk by chunk as the data arrive."""
+    binary = getattr(stream, "buffer", None)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    # Keep the order with anything already written via the text layer
+    stream.flush()
+
+    with pipe:
+        for chunk in iter(lambda: pipe.read1(STREAM_CHUNK_SIZE), b""):
+            if binary is not None:
+                binary.write(chunk)
+                binary.flush()
+            else:
+                stream.write(decoder.decode(chunk))
+                stream.flush()
+
+    if binary is None:
+        stream.write(decoder.decode(b"", final=True))
+        stream.flush()
+
+
+def _run_streamed(*cmd: str) -> int:
+    """Run the command forwarding its stdout and stderr to ours while it runs.
+
+    Unlike `cmd_output_b`, the output is not collected so the memory use
+    doesn't grow with the output size and the user sees the progress of long
+    running containers. Returns the exit code of the command.
+    """
+    try:
+        cmd = normalize_cmd(cmd)
+    except ExecutableNotFoundError as e:
+        returncode, out, _ = e.to_output()
+        sys.stderr.write(out.decode())
+
+        return returncode
+
+    with job_slot():
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        threads = [
+            threading.Thread(target=_forward_stream, args=(pipe, stream))
+            for pipe, stream in ((proc.stdout, sys.stdout), (proc.stderr, sys.stderr))
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return proc.wait()
+
+
+# -------- Batched runs for long file lists --------
+
+
+class HookOptions:
+    """Options of this hook given in front of the docker args."""
+
+    def __init__(self) -> None:
+        self.jobs = lang_base.target_concurrency()
+        self.warm = False
+        self.warm_timeout = WARM_TIMEOUT
+        self.mount = MOUNT_BIND
+        self.container: str | None = None
+
+
+def _parse_hook_args(
+    args: Sequence[str],
+) -> tuple[HookOptions, tuple[str, ...], tuple[str, ...] | None]:
+    """Split the hook args into the hook options, the docker args (ending
+    with the `--` marker if it's used) and the file names (None if the marker
+    is not used).
+
+    The `--jobs=N`, `--serial`, `--warm`, `--warm-timeout=SECONDS`,
+    `--hook-mount=STRATEGY` and `--hook-volumes-from=CONTAINER` options are
+    recognized only in front of the docker args. The mount options are
+    prefixed so they don't shadow the `docker run` options of the same
+    name.
+    """
+    options = HookOptions()
+    args = list(args)
+
+    while args:
+        name, _, value = args[0].partition("=")
+
+        if name == "--serial":
+            options.jobs = 1
+        elif name == "--jobs":
+            options.jobs = max(1, int(value))
+        elif name == "--warm":
+            options.warm = True
+        elif name == "--warm-timeout":
+            options.warm_timeout = max(1, int(value))
+        elif name == "--hook-mount":
+            if value not in MOUNT_STRATEGIES:
+                raise ValueError(f"--hook-mount={value}")
+
+            options.mount = value
+        elif name == "--hook-volumes-from" and value:
+            options.mount = MOUNT_VOLUMES_FROM
+            options.container = value
+        else:
+            break
+
+        args.pop(0)
+
+    if FILES_MARKER not in args:
+        return options, tuple(args), None
+
+    i = len(args) - args[::-1].index(FILES_MARKER)
+
+    return options, tuple(args[:i]), tuple(args[i:])
+
+
+def _run_captured(cmd: tuple[str, ...]) -> tuple[int, object, object]:
+    """Run the command with its output spooled into temporary files."""
+    stdout = tempfile.TemporaryFile()
+    stderr = tempfile.TemporaryFile()
+
+    try:
+        with job_slot():
+            returncode = subprocess.call(
+                normalize_cmd(cmd), stdout=stdout, stderr=stderr
+            )
+    except ExecutableNotFoundError as e:
+        returncode, out, _ = e.to_output()
+        stderr.write(out)
+
+    stdout.seek(0)
+    stderr.seek(0)
+
+    return returncode, stdout, stderr
+
+
+def _run_batched(cmd: tuple[str, ...], files: tuple[str, ...], jobs: int) -> int:
+    """Run the command for ARG_MAX safe batches of the files with up to
+    ``jobs`` containers at once. The output of each batch is printed in the
+    batch order once it finishes. Returns the highest exit code."""
+    try:
+        batches = xargs.partition(cmd, files, jobs)
+    except xargs.ArgumentTooLongError as e:
+        sys.stderr.write(f"Argument too long: {e}\n")
+
+        return 1
+
+    if jobs == 1 or len(batches) == 1:
+        return max([_run_streamed(*batch) for batch in batches])
+
+    returncode = 0
+
+    with ThreadPoolExecutor(min(jobs, len(batches))) as executor:
+        for batch_returncode, stdout, stderr in executor.map(_run_captured, batches):
+            _forward_stream(stdout, sys.stdout)
+            _forward_stream(stderr, sys.stderr)
+
+            returncode = max(returncode, batch_returncode)
+
+    return returncode
+
+
+# -------- Warm containers reused via docker exec --------
+
+
+def _split_docker_args(
+    args: Sequence[str],
+) -> tuple[tuple[str, ...], str | None, tuple[str, ...]]:
+    """Split the docker run args into the options, the image and the
+    command."""
+    i = 0
+
+    while i < len(args) and args[i].startswith("-"):
+        arg = args[i]
+        i += 1
+
+        if "=" in arg or arg in DOCKER_RUN_FLAGS:
+            continue
+
+        # Combined short flags (e.g. `-it`)
+        if not arg.startswith("--") and all(
+            f"-{c}" in DOCKER_RUN_FLAGS for c in arg[1:]
+        ):
+            continue
+
+        # Skip the option value
+        i += 1
+
+    if i >= len(args):
+        return tuple(args), None, ()
+
+    image, *command = args[i:]
+
+    return tuple(args[:i]), image, tuple(command)
+
+
+def _pop_entrypoint(
+    options: Sequence[str],
+) -> tuple[tuple[str, ...], list[str] | None]:
+    """Remove the `--entrypoint` from the docker run options and return it."""
+    rest: list[str] = []
+    entrypoint = None
+    options = list(options)
+
+    while options:
+        option = options.pop(0)
+
+        if option == "--entrypoint" and options:
+            entrypoint = [options.pop(0)]
+        elif option.startswith("--entrypoint="):
+            entrypoint = [option.partition("=")[2]]
+        else:
+            rest.append(option)
+
+    return tuple(rest), entrypoint
+
+
+def _get_image_config(image: str) -> list[list[str]] | None:
+    """Return the ``[entrypoint, cmd]`` of the image (pulling it if needed)
+    or None if the image is not available."""
+    for _ in range(2):
+        retcode, out, _ = cmd_output_b(
+            "docker",
+            "image",
+            "inspect",
+            "--format",
+            "{{ json .Config }}",
+            image,
+            check=False,
+        )
+        if retcode == 0:
+            config = json.loads(out) or {}
+
+            return [config.get("Entrypoint") or [], config.get("Cmd") or []]
+
+        cmd_output_b("docker", "pull", image, check=False)
+
+    return None
+
+
+def _inspect_warm_container(name: str) -> tuple[str | None, list[list[str]] | None]:
+    """Return the state of the warm container (None if it doesn't exist) and
+    the image ``[entrypoint, cmd]`` if it's running."""
+    retcode, out, _ = cmd_output_b(
+        "docker",
+        "container",
+        "inspect",
+        "--format",
+        f'{{{{ .State.Status }}}} {{{{ index .Config.Labels "{WARM_CONFIG_LABEL}" }}}}',
+        name,
+        check=False,
+    )
+    status, _, config = out.decode().strip().partition(" ")
+
+    if retcode != 0:
+        return None, None
+
+    if status != "running":
+        return status, None
+
+    return status, json.loads(config)
+
+
+def _start_warm_container(
+    name: str,
+    run_cmd: tuple[str, ...],
+    options: tuple[str, ...],
+    image: str,
+    timeout: int,
+) -> list[list[str]] | None:
+    """Start the warm container (if it's not running yet) and return the
+    image ``[entrypoint, cmd]``. Returns None if it can't be started."""
+    status, config = _inspect_warm_container(name)
+    if config is not None:
+        return config
+
+    config = _get_image_config(image)
+    if config is None:
+        return None
+
+    # Remove a stopped container of the same name. Containers in the other
+    # states can be being started or used by a concurrent hook process (and
+    # `docker rm` without `--force` refuses to remove a running one).
+    if status in WARM_REMOVABLE_STATES:
+        cmd_output_b("docker", "rm", name, check=False)
+
+    loop = WARM_LOOP.format(marker=WARM_MARKER, minutes=max(1, -(-timeout // 60)))
+    cmd_output_b(
+        *run_cmd[:2],
+        "--detach",
+        *run_cmd[2:],
+        "--name",
+        name,
+        "--label",
+        WARM_LABEL,
+        "--label",
+        f"{WARM_CONFIG_LABEL}={json.dumps(config)}",
+        "--entrypoint",
+        "sh",
+        *options,
+        image,
+        "-c",
+        loop,
+        check=False,
+    )
+
+    # Another hook run could have started it in the meantime
+    return _inspect_warm_container(name)[1]
+
+
+def warm_cmd(
+    run_cmd: tuple[str, ...], args: tuple[str, ...], timeout: int
+) -> tuple[str, ...] | None:
+    """Return the `docker exec` command running the hook in a warm container
+    (started by the ``run_cmd`` if needed) or None if the warm container can't
+    be used.
+
+    There is one warm container per image, docker options and mount. It
+    stops itself after ``timeout`` seconds (rounded up to minutes) without any
+    exec. The image must provide `sh`.
+    """
+    options, image, command = _split_docker_args(args)
+    if image is None:
+        return None
+
+    options, entrypoint = _pop_entrypoint(options)
+    key = json.dumps([run_cmd, options, image, timeout])
+    name = f"pre-commit-warm-{md5(key)[:16]}"
+
+    config = _start_warm_container(name, run_cmd, options, image, timeout)
+    if config is None:
+        return None
+
+    image_entrypoint, image_cmd = config
+
+    return (
+        "docker",
+        "exec",
+        name,
+        "sh",
+        "-c",
+        WARM_EXEC.format(marker=WARM_MARKER),
+        "sh",
+        *(entrypoint if entrypoint is not None else image_entrypoint),
+        *(command or image_cmd),
+    )
+
+
+# -------- Image pull overlapped with the container detection --------
+
+
+def _get_pull_image(args: Sequence[str]) -> str | None:
+    """Return the image to pull ahead of the docker run or None if there is
+    no image or the docker args set the pull policy themselves."""
+    options, image, _ = _split_docker_args(args)
+
+    if any(o == "--pull" or o.startswith("--pull=") for o in options):
+        return None
+
+    return image
+
+
+def _pull_image(image: str) -> tuple[int, bytes]:
+    """Pull the image unless it's present already. Returns the exit code and
+    the error output of the pull. The pull progress is suppressed."""
+    retcode, _, _ = cmd_output_b(
+        "docker", "image", "inspect", "--format", "{{ .Id }}", image, check=False
+    )
+    if retcode == 0:
+        return 0, b""
+
+    retcode, out, err = cmd_output_b("docker", "pull", "--quiet", image, check=False)
+
+    return retcode, err or out
+
+
 # -------- Entry point --------
 
 
+@metered("docker-image")
+@profiled
 def main() -> int:
-    # Get docker command enriched by the hook args
-    cmd = docker_cmd(color=False) + tuple(SYS_ARGV[1:])
+    # The hook args are passed to docker so profiling and metrics can only be
+    # enabled via the PRE_COMMIT_HOOKS_PROFILE and PRE_COMMIT_HOOKS_METRICS_FILE
+    # environment variables
+    enable_profiling()
+    enable_metrics()
 
-    # Run the command
     try:
-        returncode, stdout, stderr = cmd_output_b(*cmd)
-    except CalledProcessError as e:
-        returncode, stdout, stderr = e.returncode, e.stdout, e.stderr
+        options, args, files = _parse_hook_args(SYS_ARGV[1:])
+    except ValueError as e:
+        sys.stderr.write(f"Invalid hook option value: {e}\n")
 
-    # Print stdout if any
-    if stdout:
-        print(stdout.decode().rstrip())
+        return 1
 
-    # Print stderr if any
-    if stderr:
-        print(stderr.decode().rstrip())
+    # Pull the image while the container is being detected as both can be
+    # slow on a fresh CI runner
+    image = _get_pull_image(args)
 
-    return returncode
+    with ThreadPoolExecutor(1) as executor:
+        pull = executor.submit(_pull_image, image) if image is not None else None
+
+        with phase("container detection"):
+            run_cmd = docker_cmd(
+                color=False, mount=options.mount, container=options.container
+            )
+
+        if pull is not None:
+            with phase("image pull"):
+                retcode, err = pull.result()
+
+            if retcode != 0:
+                # The image guess can be wrong (an unknown docker run flag
+                # shifts it) so docker run pulls and reports on its own
+                sys.stderr.write(f"Failed to pre-pull image {image}, continuing:\n")
+                sys.stderr.write(err.decode(errors="replace"))
+
+    cmd = None
+
+    if options.warm:
+        with phase("warm container"):
+            cmd = warm_cmd(run_cmd, args, options.warm_timeout)
+
+        if cmd is None:
+            sys.stderr.write("Failed to start a warm container, using docker run\n")
+
+    # Get docker command enriched by the hook args
+    if cmd is None:
+        cmd = run_cmd + args
+
+    # Run the command
+    with phase("subprocess"):
+        if files is None:
+            return _run_streamed(*cmd)
+
+        return _run_batched(cmd, files, options.jobs)
 
 
 if __name__ == "__main__":
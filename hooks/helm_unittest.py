@@ -1,10 +1,31 @@
 import argparse
+import glob
 import logging
+import os
 import re
 import subprocess
 import sys
+import time
 from pathlib import Path
 
+from hooks.common.chart_graph import ChartGraph
+from hooks.common.history import DurationHistory, get_common_dir
+from hooks.common.jobserver import job_slot
+from hooks.common.metrics import enable_metrics, inc, metered
+from hooks.common.probes import probe
+from hooks.common.profiling import enable_profiling, phase, profiled
+from hooks.common.sharding import (
+    add_shard_arguments,
+    load_durations,
+    select_shard,
+    write_shard_report,
+)
+from hooks.common.suite_index import SuiteIndex, select_suites
+from hooks.common.watch import iter_changes, open_watcher
+
+# Summary line of the helm unittest output with the test case counts
+TESTS_SUMMARY_RE = re.compile(r"^Tests:\s+(.*)$", re.MULTILINE)
+
 
 def parse_args():
     """Parse command line arguments."""
@@ -44,6 +65,57 @@ def parse_args():
         help="enable debug output",
         action="store_true",
     )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "add the run metrics into a Prometheus textfile collector file "
+            "(OpenMetrics if FILE ends with .om)"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the wall and CPU time spent in each phase of the run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help=(
+            "write the profile into FILE (JSON with the phases if FILE ends "
+            "with .json, cProfile stats otherwise)"
+        ),
+    )
+    parser.add_argument(
+        "--no-dependents",
+        help="test only the charts with changes, not the charts depending on them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--all-suites",
+        help=(
+            "run all test suites of the affected charts, not only the ones "
+            "covering the changed templates"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-history",
+        help=(
+            "don't record the test durations and outcomes and don't order the "
+            "tests by them"
+        ),
+        action="store_true",
+    )
+    add_shard_arguments(parser)
+    parser.add_argument(
+        "--watch",
+        help=(
+            "watch the charts and re-run the tests of the charts affected by "
+            "every change until interrupted"
+        ),
+        action="store_true",
+    )
     parser.add_argument(
         "--path-sub-pattern",
         metavar="PATTERN",
@@ -175,15 +247,118 @@ def find_chart_directories(changed_files, charts_dir, log):
 
 
 def check_helm_unittest_available():
-    """Check if helm unittest plugin is available."""
+    """
+    Check if helm unittest plugin is available.
+
+    Returns:
+        The output of `helm unittest --help` or None if the plugin is not
+        available.
+    """
     try:
-        subprocess.run(
+        result = subprocess.run(
             ["helm", "unittest", "--help"], capture_output=True, text=True, check=True
         )
 
-        return True
+        return result.stdout
     except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+        return None
+
+
+def get_helm_plugins_dir():
+    """Return the directory with the Helm plugins (without calling helm)."""
+    if os.environ.get("HELM_PLUGINS"):
+        return os.environ["HELM_PLUGINS"]
+
+    if os.environ.get("XDG_DATA_HOME"):
+        base = os.environ["XDG_DATA_HOME"]
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library")
+    else:
+        base = os.path.join(os.path.expanduser("~"), ".local", "share")
+
+    return os.path.join(base, "helm", "plugins")
+
+
+def get_helm_plugin_version(name, plugins_dir):
+    """
+    Return the version of the Helm plugin from its plugin.yaml (without
+    calling helm).
+
+    Args:
+        name: Name of the plugin
+        plugins_dir: Directory with the Helm plugins
+
+    Returns:
+        The version or None if the plugin is not found.
+    """
+    for plugin_yaml in sorted(glob.glob(os.path.join(plugins_dir, "*", "plugin.yaml"))):
+        try:
+            with open(plugin_yaml) as f:
+                content = f.read()
+        except OSError:
+            continue
+
+        fields = dict(
+            re.findall(r"^(name|version):\s*[\"']?([^\"'\s]+)", content, re.MULTILINE)
+        )
+
+        if fields.get("name") == name:
+            return fields.get("version")
+
+    return None
+
+
+def parse_helm_unittest_help(output):
+    """
+    Parse the capabilities of the helm unittest plugin from its help.
+
+    Args:
+        output: Output of `helm unittest --help`
+
+    Returns:
+        Dict with the supported `output_types` and whether the `failfast`
+        option is supported.
+    """
+    m = re.search(r"accept:\s*([^)\n]*)", output)
+
+    return {
+        "output_types": re.findall(r"\w+", m.group(1)) if m else [],
+        "failfast": "--failfast" in output,
+    }
+
+
+def probe_helm_unittest():
+    """Return the info about the helm unittest plugin or None if it's not
+    available."""
+    output = check_helm_unittest_available()
+
+    if output is None:
+        return None
+
+    info = {"version": get_helm_plugin_version("unittest", get_helm_plugins_dir())}
+    info.update(parse_helm_unittest_help(output))
+
+    return info
+
+
+def get_helm_unittest_info():
+    """
+    Return the info about the helm unittest plugin (`version`, `output_types`
+    and `failfast`) or None if it's not available.
+
+    The probe loads the plugin which is slow so its result is cached until
+    the helm binary or the installed plugins change.
+    """
+    plugins_dir = get_helm_plugins_dir()
+
+    return probe(
+        "helm-unittest",
+        "helm",
+        probe_helm_unittest,
+        extra_paths=[plugins_dir]
+        + sorted(glob.glob(os.path.join(plugins_dir, "*", "plugin.yaml"))),
+        env_keys=["HELM_PLUGINS"],
+    )
 
 
 def has_dependencies(chart_path):
@@ -210,12 +385,13 @@ def ensure_dependencies(chart_path, log):
 
     log.info(f"Running helm dependency update for chart: {chart_path.name}")
     try:
-        subprocess.run(
-            ["helm", "dependency", "update", str(chart_path)],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        with job_slot(), phase("subprocess"):
+            subprocess.run(
+                ["helm", "dependency", "update", str(chart_path)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
         return True
     except subprocess.CalledProcessError as e:
         log.error(f"helm dependency update failed for chart: {chart_path.name}")
@@ -226,8 +402,28 @@ def ensure_dependencies(chart_path, log):
         return False
 
 
+def count_test_cases(output):
+    """Count the test cases from the summary printed by helm unittest."""
+    match = TESTS_SUMMARY_RE.search(output or "")
+
+    if match is None:
+        return
+
+    for count, result in re.findall(r"(\d+) (\w+)", match.group(1)):
+        if result != "total":
+            inc("test_cases_total", int(count), result=result)
+
+
 def run_helm_unittest(
-    chart_dir, tests_path, test_files, failfast, path_sub_pattern, log
+    chart_dir,
+    tests_path,
+    test_files,
+    failfast,
+    path_sub_pattern,
+    log,
+    changed_files=None,
+    suite_index=None,
+    history=None,
 ):
     """
     Run helm unittest on a specific chart directory.
@@ -239,6 +435,11 @@ def run_helm_unittest(
         failfast: Whether to stop on first failure
         path_sub_pattern: Path substitution pattern for library charts
         log: Logger instance
+        changed_files: Changed files selecting the test suites to run (all
+            test suites are run if None)
+        suite_index: SuiteIndex used for the test suite selection
+        history: DurationHistory recording the outcome (and the duration of
+            a full run) of the chart
 
     Returns:
         True if tests passed, False otherwise
@@ -277,8 +478,32 @@ def run_helm_unittest(
         log.debug("Using tests from helper chart location due to path substitution")
     log.debug(f"Test files found: {[f.name for f in test_file_list]}")
 
+    # Select only the test suites affected by the changed files
+    suites = None
+
+    if changed_files is not None and suite_index is not None:
+        with phase("suite selection"):
+            suites = select_suites(
+                actual_chart_path,
+                changed_files,
+                tests_path,
+                test_files,
+                suite_index,
+                log,
+            )
+
+        if suites == []:
+            log.info(f"No test suites cover the changes of chart: {chart_path.name}")
+            return True
+
+        if suites is not None:
+            log.debug(f"Selected test suites: {suites}")
+
     # Ensure subchart dependencies are built before running the tests
     if not ensure_dependencies(actual_chart_path, log):
+        if history is not None:
+            history.record(chart_dir, None, False)
+
         return False
 
     # Build the helm unittest command
@@ -287,16 +512,33 @@ def run_helm_unittest(
     if failfast:
         cmd.append("--failfast")
 
-    # Specify test file pattern
-    cmd.extend(["-f", f"{tests_path}/{test_files}"])
+    # Specify test file pattern or the selected test suites
+    if suites is None:
+        cmd.extend(["-f", f"{tests_path}/{test_files}"])
+    else:
+        for suite in suites:
+            cmd.extend(["-f", suite])
 
     # Add the actual chart directory (which might be substituted)
     cmd.append(str(actual_chart_path))
 
     log.debug(f"Running command: {' '.join(cmd)}")
 
+    # Only the durations of the runs of all suites are recorded
+    start = time.perf_counter()
+
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with job_slot(), phase("subprocess"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+        if history is not None:
+            history.record(
+                chart_dir,
+                time.perf_counter() - start if suites is None else None,
+                True,
+            )
+
+        count_test_cases(result.stdout)
 
         log.info(f"✓ Tests passed for chart: {chart_path.name}")
         if log.level == logging.DEBUG:
@@ -306,6 +548,16 @@ def run_helm_unittest(
         return True
 
     except subprocess.CalledProcessError as e:
+        # A failfast run stops at the first failure
+        if history is not None:
+            history.record(
+                chart_dir,
+                None if suites is not None or failfast else time.perf_counter() - start,
+                False,
+            )
+
+        count_test_cases(e.stdout)
+
         log.error(f"✗ Tests failed for chart: {chart_path.name}")
         log.error("STDOUT:")
         log.error(e.stdout)
@@ -314,37 +566,241 @@ def run_helm_unittest(
         return False
 
 
+def select_charts(files, args, log, graph=None):
+    """
+    Select the chart directories to test for the changed files.
+
+    Args:
+        files: List of file paths that have changed
+        args: Parsed command line arguments
+        log: Logger instance
+        graph: ChartGraph kept in memory between the runs (built for this
+            run if None)
+
+    Returns:
+        List of chart directory paths
+    """
+    # Find chart directories that contain changed files
+    with phase("path discovery"):
+        if graph is None:
+            chart_dirs = find_chart_directories(files, args.charts_dir, log)
+        else:
+            graph.update(files)
+
+            chart_dirs = {graph.find_chart(f) for f in files} - {None}
+
+            log.info(f"Found {len(chart_dirs)} chart directories with changes")
+
+    if not chart_dirs:
+        return []
+
+    # Charts depending on the changed charts (e.g. on a library chart) must be
+    # re-tested as well
+    if not args.no_dependents:
+        with phase("dependency graph"):
+            if graph is None:
+                graph = ChartGraph(
+                    ".", log, get_chart_roots(args.charts_dir, args.path_sub_pattern)
+                )
+
+            chart_dirs = graph.affected(chart_dirs)
+
+        log.info(f"Found {len(chart_dirs)} affected chart directories")
+
+    # A library chart is tested via its helper chart which can be in the
+    # affected charts too
+    charts = {}
+
+    for chart_dir in sorted(chart_dirs):
+        actual_chart_path, _ = apply_path_substitution(
+            Path(chart_dir), args.path_sub_pattern, log
+        )
+
+        charts.setdefault(actual_chart_path.resolve(), chart_dir)
+
+    return list(charts.values())
+
+
+def get_chart_roots(charts_dir, path_sub_pattern):
+    """
+    Return the top directories of the charts. These are watched in the watch
+    mode and searched for the charts depending on the changed ones.
+
+    Args:
+        charts_dir: Base directory containing Helm charts
+        path_sub_pattern: Substitution pattern of the chart paths
+
+    Returns:
+        List of the charts directory and the existing top directory of the
+        substituted chart paths (e.g. `helper-charts`)
+    """
+    roots = [charts_dir]
+
+    if path_sub_pattern and "," in path_sub_pattern:
+        replacement = path_sub_pattern.split(",", 1)[1]
+        top_dir = replacement.split("/")[0]
+
+        if (
+            top_dir
+            and "\\" not in top_dir
+            and top_dir not in roots
+            and os.path.isdir(top_dir)
+        ):
+            roots.append(top_dir)
+
+    return roots
+
+
+def watch(args, log):
+    """
+    Re-run the tests of the charts affected by the changed files on every
+    change until interrupted. The chart graph and the suite index are kept in
+    memory between the runs and updated for the changed files only.
+
+    Args:
+        args: Parsed command line arguments
+        log: Logger instance
+
+    Returns:
+        Exit code (0 once interrupted)
+    """
+    suite_index = (
+        None if args.all_suites else SuiteIndex(Path.cwd(), log, get_common_dir())
+    )
+    roots = get_chart_roots(args.charts_dir, args.path_sub_pattern)
+
+    with phase("dependency graph"):
+        graph = ChartGraph(".", log, roots)
+
+    watcher = open_watcher(roots, log)
+
+    log.info(f"Watching {', '.join(roots)} for changes (press Ctrl+C to stop)")
+
+    try:
+        for changed in iter_changes(watcher):
+            files = sorted(os.path.relpath(p) for p in changed)
+
+            if suite_index is not None:
+                suite_index.invalidate(files)
+
+            chart_dirs = select_charts(files, args, log, graph)
+
+            if not chart_dirs:
+                continue
+
+            failed_charts = []
+
+            for chart_dir in sorted(chart_dirs):
+                success = run_helm_unittest(
+                    chart_dir,
+                    args.tests_path,
+                    args.test_files,
+                    args.failfast,
+                    args.path_sub_pattern,
+                    log,
+                    files,
+                    suite_index,
+                )
+
+                if not success:
+                    failed_charts.append(chart_dir)
+
+                    if args.failfast:
+                        break
+
+            if suite_index is not None:
+                suite_index.save()
+
+            if failed_charts:
+                log.error(f"Tests failed for {len(failed_charts)} chart(s):")
+                for chart_dir in failed_charts:
+                    log.error(f"  - {chart_dir}")
+            else:
+                log.info("All tests passed!")
+
+            log.info("Waiting for changes...")
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
+    finally:
+        watcher.close()
+
+    return 0
+
+
+@metered("helm-unittest")
+@profiled
 def main():
     """Main function."""
-    args = parse_args()
+    with phase("parse args"):
+        args = parse_args()
+
+    enable_profiling(args.profile, args.profile_output)
+    enable_metrics(args.metrics_file)
     log = get_logger(args.debug)
 
     log.debug(f"Arguments: {args}")
 
     # Check if helm unittest is available
-    if not check_helm_unittest_available():
+    with phase("tool probe"):
+        info = get_helm_unittest_info()
+
+    if info is None:
         log.error("helm unittest plugin is not available")
         log.error(
             "Please install it with: helm plugin install https://github.com/helm-unittest/helm-unittest"
         )
         return 1
 
+    log.debug(f"helm unittest plugin version: {info['version']}")
+    log.debug(
+        "helm unittest output types: " f"{', '.join(info.get('output_types', []))}"
+    )
+
+    if args.watch:
+        return watch(args, log)
+
     # If no files are provided, exit successfully
     if not args.files:
         log.info("No files provided, nothing to check")
         return 0
 
-    # Find chart directories that contain changed files
-    chart_dirs = find_chart_directories(args.files, args.charts_dir, log)
+    chart_dirs = select_charts(args.files, args, log)
 
     if not chart_dirs:
         log.info("No Helm charts found with changes")
         return 0
 
+    if args.shard:
+        chart_dirs = select_shard(
+            chart_dirs,
+            args.shard,
+            Path.cwd(),
+            load_durations(args.shard_durations, log),
+            log,
+        )
+
+    with phase("repo open"):
+        common_dir = get_common_dir()
+
+    # Previously failed items first
+    with phase("history"):
+        history = DurationHistory(
+            "helm-unittest",
+            Path.cwd(),
+            log,
+            None if args.no_history else common_dir,
+        )
+
+    suite_index = None if args.all_suites else SuiteIndex(Path.cwd(), log, common_dir)
+
+    chart_dirs = history.order(chart_dirs)
+
+    inc("items_total", len(chart_dirs), kind="chart")
+
     # Run tests for each chart
     failed_charts = []
 
-    for chart_dir in sorted(chart_dirs):
+    for chart_dir in chart_dirs:
         success = run_helm_unittest(
             chart_dir,
             args.tests_path,
@@ -352,8 +808,13 @@ def main():
             args.failfast,
             args.path_sub_pattern,
             log,
+            args.files,
+            suite_index,
+            history,
         )
 
+        inc("tests_total", kind="chart", result="passed" if success else "failed")
+
         if not success:
             failed_charts.append(chart_dir)
 
@@ -361,6 +822,21 @@ def main():
                 log.error("Stopping on first failure (--failfast enabled)")
                 break
 
+    with phase("history"):
+        history.save()
+
+    if suite_index is not None:
+        with phase("suite selection"):
+            suite_index.save()
+
+    if args.shard_report:
+        write_shard_report(
+            args.shard_report,
+            args.shard,
+            {c: history.durations.get(c) for c in chart_dirs},
+            Path.cwd(),
+        )
+
     # Report results
     if failed_charts:
         log.error(f"Tests failed for {len(failed_charts)} chart(s):")
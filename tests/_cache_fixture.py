@@ -0,0 +1,16 @@
+"""Isolation of the tests from the user cache directory."""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+# Point the user cache directory (the tool probes, the job slots) to a
+# temporary directory at import time so the tests never read or write the
+# real `~/.cache/jtyr-pre-commit-hooks`. Tests patching XDG_CACHE_HOME
+# themselves still take precedence.
+CACHE_HOME = tempfile.mkdtemp()
+
+os.environ["XDG_CACHE_HOME"] = CACHE_HOME
+
+atexit.register(shutil.rmtree, CACHE_HOME, ignore_errors=True)
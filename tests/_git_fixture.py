@@ -6,6 +6,8 @@ import tempfile
 
 from git import Repo
 
+from tests import _cache_fixture  # noqa: F401
+
 # Strip inherited GIT_* env vars at import time. When the tests are invoked
 # from within a `git commit` or `pre-commit run` (e.g. as a pre-commit hook),
 # variables like GIT_DIR / GIT_WORK_TREE / GIT_INDEX_FILE point at the outer
@@ -0,0 +1,152 @@
+import os
+import unittest
+
+from hooks.api import (
+    ACTION_AUTOFIXED,
+    ACTION_BUMP_REQUIRED,
+    ACTION_NONE,
+    CommitMessageError,
+    FileReadError,
+    MainBranchNotFoundError,
+    VersionChecker,
+    VersionError,
+)
+
+from tests._git_fixture import GitRepoFixture
+
+
+class TestVersionChecker(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.write("app/.version", "1.0.0\n")
+        self.fixture.write("charts/foo/Chart.yaml", "name: foo\nversion: 1.0.0\n")
+        self.fixture.add("app/.version", "charts/foo/Chart.yaml")
+        self.fixture.commit("seed")
+        self.fixture.create_branch("feature")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+
+    def _checker(self, **kwargs):
+        checker = VersionChecker(self.fixture.dir, deepen=False, **kwargs)
+        self.addCleanup(checker.close)
+
+        return checker
+
+    def _read(self, rel_path):
+        with open(os.path.join(self.fixture.dir, rel_path)) as f:
+            return f.read()
+
+    def test_fixed(self):
+        checker = self._checker()
+
+        result = checker.check_fixed("app")
+
+        self.assertEqual(result.path, os.path.join("app", ".version"))
+        self.assertEqual(result.baseline, "1.0.0")
+        self.assertEqual(result.current, "1.0.0")
+        self.assertEqual(result.expected, "1.0.1")
+        self.assertEqual(result.action, ACTION_BUMP_REQUIRED)
+        self.assertEqual(result.status, 127)
+
+        # The file is not changed without autofix
+        self.assertEqual(self._read("app/.version"), "1.0.0\n")
+
+        self.fixture.write("app/.version", "1.1.0\n")
+
+        result = checker.check_fixed(os.path.join(self.fixture.dir, "app/.version"))
+
+        self.assertTrue(result.passed)
+        self.assertEqual(result.current, "1.1.0")
+        self.assertIsNone(result.expected)
+
+    def test_fixed_autofix_chart(self):
+        checker = self._checker(kind="chart", cache=False)
+
+        result = checker.check_fixed(
+            "charts/foo/Chart.yaml", autofix=True, autofix_portion="minor"
+        )
+
+        self.assertEqual(result.action, ACTION_AUTOFIXED)
+        self.assertEqual(result.expected, "1.1.0")
+        self.assertEqual(
+            self._read("charts/foo/Chart.yaml"), "name: foo\nversion: 1.1.0\n"
+        )
+
+    def test_conventional(self):
+        self.fixture.write("app/main.py", "x = 1\n")
+        self.fixture.add("app/main.py")
+        self.fixture.commit("feat: add main")
+
+        checker = self._checker()
+
+        result = checker.check_conventional("app", autofix=True)
+
+        self.assertEqual(result.baseline, "1.0.0")
+        self.assertEqual(result.expected, "1.1.0")
+        self.assertEqual(result.action, ACTION_AUTOFIXED)
+        self.assertEqual(self._read("app/.version"), "1.1.0\n")
+
+        # The breaking in-flight message requires a major bump
+        result = checker.check_conventional("app", message="feat!: drop the API")
+
+        self.assertEqual(result.expected, "2.0.0")
+        self.assertEqual(result.action, ACTION_BUMP_REQUIRED)
+
+    def test_conventional_without_messages(self):
+        self.fixture.write("app/main.py", "x = 1\n")
+        self.fixture.add("app/main.py")
+        self.fixture.commit("add main")
+
+        checker = self._checker()
+
+        with self.assertRaises(CommitMessageError) as cm:
+            checker.check_conventional("app")
+
+        self.assertEqual(cm.exception.path, os.path.join("app", ".version"))
+
+    def test_main_branch_moves(self):
+        checker = self._checker()
+
+        self.assertEqual(checker.check_fixed("app").baseline, "1.0.0")
+
+        self.fixture.checkout("main")
+        self.fixture.write("app/.version", "1.2.0\n")
+        self.fixture.add("app/.version")
+        self.fixture.commit("bump")
+        self.fixture.checkout("feature")
+
+        result = checker.check_fixed("app")
+
+        self.assertEqual(result.baseline, "1.2.0")
+        self.assertEqual(result.expected, "1.2.1")
+
+    def test_new_file(self):
+        self.fixture.write("lib/.version", "0.1.0\n")
+
+        result = self._checker().check_fixed("lib")
+
+        self.assertEqual(result.action, ACTION_NONE)
+        self.assertIsNone(result.baseline)
+        self.assertEqual(result.status, 0)
+
+    def test_errors(self):
+        self.fixture.write("app/.version", "not a version\n")
+
+        checker = self._checker()
+
+        with self.assertRaisesRegex(VersionError, "Failed to compare versions"):
+            checker.check_fixed("app")
+
+        with self.assertRaises(FileReadError):
+            checker.check_fixed("missing/.version")
+
+        with self.assertRaises(MainBranchNotFoundError):
+            VersionChecker(self.fixture.dir, branch="release", deepen=False)
+
+        with self.assertRaises(ValueError):
+            VersionChecker(self.fixture.dir, kind="docker", deepen=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
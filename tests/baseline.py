@@ -0,0 +1,113 @@
+import logging
+import os
+import unittest
+from unittest.mock import patch
+
+from hooks.common.baseline import SNAPSHOT_FILE, BaselineSnapshot
+from hooks.common.cache import CACHE_DIR_NAME
+
+from tests._git_fixture import GitRepoFixture
+
+log = logging.getLogger(__name__)
+
+
+class TestBaselineSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+
+        for rel_path, content in (
+            ("a/.version", "1.0.0\n"),
+            ("b/.version", "2.0.0\n"),
+            ("c/d/.version", "\xe9\n"),
+            ("c/other.txt", "x\n"),
+        ):
+            self.fixture.write(rel_path, content)
+            self.fixture.add(rel_path)
+
+        self.fixture.commit("add versions")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+
+    def _snapshot(self, file_name=".version"):
+        return BaselineSnapshot(
+            self.fixture.repo,
+            self.fixture.main.commit.hexsha,
+            "version",
+            file_name,
+            str.strip,
+            log,
+        )
+
+    def test_build(self):
+        snapshot = self._snapshot()
+
+        self.assertEqual(
+            snapshot.versions,
+            {"a/.version": "1.0.0", "b/.version": "2.0.0", "c/d/.version": None},
+        )
+        self.assertIn("c/d/.version", snapshot)
+        self.assertNotIn("c/other.txt", snapshot)
+        self.assertIsNone(snapshot.get("c/d/.version"))
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(
+                    self.fixture.repo.git_dir,
+                    CACHE_DIR_NAME,
+                    SNAPSHOT_FILE % "version",
+                )
+            )
+        )
+
+    def test_served_until_main_moves(self):
+        self._snapshot()
+
+        with patch.object(BaselineSnapshot, "_build") as mock_build, patch.object(
+            BaselineSnapshot, "_update"
+        ) as mock_update:
+            self.assertEqual(self._snapshot().get("a/.version"), "1.0.0")
+
+        mock_build.assert_not_called()
+        mock_update.assert_not_called()
+
+    def test_incremental_update(self):
+        self._snapshot()
+
+        self.fixture.write("a/.version", "1.1.0\n")
+        self.fixture.write("e/.version", "0.1.0\n")
+        self.fixture.add("a/.version", "e/.version")
+        self.fixture.repo.index.remove(["b/.version"], working_tree=True)
+        self.fixture.commit("move main")
+
+        with patch.object(BaselineSnapshot, "_build") as mock_build:
+            snapshot = self._snapshot()
+
+        mock_build.assert_not_called()
+
+        self.assertEqual(
+            snapshot.versions,
+            {"a/.version": "1.1.0", "c/d/.version": None, "e/.version": "0.1.0"},
+        )
+
+    def test_rebuild(self):
+        self._snapshot()
+
+        with patch.object(BaselineSnapshot, "_update") as mock_update:
+            # Different version file name
+            self.assertEqual(self._snapshot("other.txt").versions, {"c/other.txt": "x"})
+
+        mock_update.assert_not_called()
+
+        # Unknown commit of the previous snapshot
+        snapshot = self._snapshot()
+        snapshot.main_sha = "0" * 40
+        snapshot.save()
+
+        with patch.object(BaselineSnapshot, "_build", return_value={}) as mock_build:
+            self._snapshot()
+
+        mock_build.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
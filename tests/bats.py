@@ -9,11 +9,17 @@ from unittest.mock import patch
 from hooks.bats import (
     check_bats_available,
     get_logger,
+    get_watch_roots,
     main,
     parse_args,
+    parse_bats_help,
     resolve_pattern,
     run_bats,
 )
+from hooks.common.history import DurationHistory
+from hooks.common.shell_graph import ShellIndex
+
+from tests import _cache_fixture  # noqa: F401
 
 TRIVIAL_BATS = """\
 @test "trivial" {
@@ -27,6 +33,14 @@ FAILING_BATS = """\
 }
 """
 
+BATS_HELP = """\
+Bats 1.10.0
+Usage: bats [OPTIONS] <tests>
+  -F, --formatter <type>    Switch between formatters: pretty (default),
+                              tap (default w/o term), tap13, junit
+  -T, --timing              Add timing information to tests
+"""
+
 
 class TestParseArgs(unittest.TestCase):
     def test_parse_args_default(self):
@@ -113,6 +127,24 @@ class TestCheckBatsAvailable(unittest.TestCase):
             self.assertFalse(check_bats_available())
 
 
+class TestParseBatsHelp(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_bats_help(BATS_HELP),
+            {
+                "version": "1.10.0",
+                "formatters": ["pretty", "tap", "tap13", "junit"],
+                "timing": True,
+            },
+        )
+
+    def test_old_bats(self):
+        self.assertEqual(
+            parse_bats_help("Bats 0.4.0\nUsage: bats [-c] [-p | -t] <test>\n"),
+            {"version": "0.4.0", "formatters": [], "timing": False},
+        )
+
+
 class TestRunBats(unittest.TestCase):
     def test_run_bats_returns_true_on_zero_exit(self):
         logger = get_logger(debug=False)
@@ -126,6 +158,23 @@ class TestRunBats(unittest.TestCase):
             mock_run.return_value.returncode = 1
             self.assertFalse(run_bats(Path("/tmp/x.bats"), logger))
 
+    def test_run_bats_history(self):
+        logger = get_logger(debug=False)
+        history = DurationHistory("bats-run", "/tmp", logger)
+        bats_file = Path("/tmp/x.bats")
+
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.returncode = 1
+            run_bats(bats_file, logger, history=history)
+
+            self.assertIsNotNone(history.durations[bats_file])
+
+            # Interrupted runs don't record the duration
+            mock_run.return_value.returncode = -2
+            run_bats(bats_file, logger, history=history)
+
+            self.assertIsNone(history.durations[bats_file])
+
 
 class TestMain(unittest.TestCase):
     """End-to-end tests that exercise main() against a real filesystem.
@@ -140,8 +189,12 @@ class TestMain(unittest.TestCase):
         self.test_dir = tempfile.mkdtemp()
         self.cwd = os.getcwd()
         os.chdir(self.test_dir)
+        # Don't use the user's probe cache
+        self.env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.test_dir})
+        self.env.start()
 
     def tearDown(self):
+        self.env.stop()
         os.chdir(self.cwd)
         shutil.rmtree(self.test_dir, ignore_errors=True)
 
@@ -162,6 +215,48 @@ class TestMain(unittest.TestCase):
         except (subprocess.CalledProcessError, FileNotFoundError):
             return False
 
+    def test_watch_runs_affected_bats_files(self):
+        self._write("lib/common.sh", "")
+        self._write("scripts/foo.sh", "source ../lib/common.sh\n")
+        foo = self._write("scripts/foo.bats", TRIVIAL_BATS)
+        self._write("scripts/bar.sh", "")
+        self._write("scripts/bar.bats", TRIVIAL_BATS)
+
+        changes = [{"lib/common.sh"}, {"README.md"}]
+
+        def _iter_changes(watcher):
+            yield from changes
+
+            raise KeyboardInterrupt
+
+        argv = ["bats.py", "--watch"]
+
+        with patch("sys.argv", argv), patch(
+            "hooks.bats.check_bats_available", return_value=BATS_HELP
+        ), patch("hooks.bats.iter_changes", _iter_changes), patch(
+            "hooks.bats.run_bats", return_value=True
+        ) as mock_run:
+            self.assertEqual(main(), 0)
+
+        self.assertEqual([c.args[0] for c in mock_run.call_args_list], [foo.resolve()])
+
+    def test_watch_roots(self):
+        self._write("repo/install.sh", "source scripts/lib/common.sh\n")
+        self._write("repo/scripts/lib/common.sh", "")
+        self._write("repo/tests/foo.bats", "load ../../shared/helpers\n")
+        self._write("repo/build/out/readme.txt", "")
+        self._write("repo/.git/hooks/check.sh", "")
+        shared = self._write("shared/helpers.bash", "")
+        root = Path(self.test_dir) / "repo"
+
+        index = ShellIndex(root, get_logger(False))
+        index.update()
+
+        self.assertEqual(
+            get_watch_roots(root, index),
+            (["scripts", "tests"], sorted([".", str(shared.parent)])),
+        )
+
     def test_no_files_returns_zero(self):
         argv = ["bats.py"]
         with patch("sys.argv", argv):
@@ -170,7 +265,7 @@ class TestMain(unittest.TestCase):
     def test_non_sh_files_are_skipped(self):
         argv = ["bats.py", "README.md", "foo.yaml"]
         with patch("sys.argv", argv), patch(
-            "hooks.bats.check_bats_available", return_value=True
+            "hooks.bats.check_bats_available", return_value=BATS_HELP
         ):
             self.assertEqual(main(), 0)
 
@@ -178,7 +273,7 @@ class TestMain(unittest.TestCase):
         self._write("scripts/foo.sh", "")
         argv = ["bats.py", "scripts/foo.sh"]
         with patch("sys.argv", argv), patch(
-            "hooks.bats.check_bats_available", return_value=True
+            "hooks.bats.check_bats_available", return_value=BATS_HELP
         ):
             self.assertEqual(main(), 0)
 
@@ -253,7 +348,7 @@ class TestMain(unittest.TestCase):
     def test_bats_not_installed_returns_one(self):
         argv = ["bats.py", "scripts/foo.sh"]
         with patch("sys.argv", argv), patch(
-            "hooks.bats.check_bats_available", return_value=False
+            "hooks.bats.check_bats_available", return_value=None
         ):
             self.assertEqual(main(), 1)
 
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from git import Repo
+
+from benchmarks.generator import MonorepoSpec, generate
+import benchmarks.run as run
+from benchmarks.run import format_table, run_benchmarks
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestGenerate(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.dir, "repo")
+        self.spec = MonorepoSpec(
+            charts=2, version_dirs=2, scripts=2, main_commits=3, branch_commits=3
+        )
+        self.changed = generate(self.repo_dir, self.spec)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_layout(self):
+        for rel_path in (
+            "charts/chart-0001/Chart.yaml",
+            "charts/chart-0001/tests/unittest/deployment_test.yaml",
+            "component-0001/.version",
+            "scripts/script-0001.sh",
+            "scripts/script-0001.bats",
+        ):
+            self.assertTrue(os.path.isfile(os.path.join(self.repo_dir, rel_path)))
+
+    def test_history(self):
+        repo = Repo(self.repo_dir)
+
+        self.assertEqual(repo.active_branch.name, "feature")
+        self.assertEqual(
+            len(list(repo.iter_commits("main"))), self.spec.main_commits + 1
+        )
+        self.assertEqual(
+            len(list(repo.iter_commits("main..feature"))), self.spec.branch_commits
+        )
+
+    def test_changed_files(self):
+        self.assertEqual(
+            self.changed,
+            [
+                "charts/chart-0001/values.yaml",
+                "component-0001/data.txt",
+                "scripts/script-0001.sh",
+            ],
+        )
+
+    def test_refs(self):
+        repo_dir = os.path.join(self.dir, "refs")
+        generate(
+            repo_dir,
+            MonorepoSpec(
+                charts=1,
+                version_dirs=0,
+                scripts=0,
+                main_commits=0,
+                branch_commits=1,
+                refs=4,
+            ),
+        )
+        repo = Repo(repo_dir)
+
+        self.assertEqual(len(repo.tags), 2)
+        self.assertEqual(len(repo.remotes.origin.refs), 3)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(
+            self.repo_dir, self.changed, 1, only=["check-version[fixed]", "bats-run"]
+        )
+
+        self.assertEqual(list(results), ["check-version[fixed]", "bats-run"])
+        self.assertEqual(results["bats-run"]["cold"]["returncode"], 0)
+        self.assertIn("bats-run", format_table(results, results))
+
+    def test_failed_case(self):
+        # The version checks require a bump, the tools fail
+        with patch.object(run, "STUB_SCRIPT", "#!/bin/sh\nexit 2\n"):
+            results = run_benchmarks(
+                self.repo_dir,
+                self.changed,
+                1,
+                only=["check-version[fixed]", "bats-run"],
+            )
+
+        self.assertIn("cold", results["check-version[fixed]"])
+        self.assertRegex(results["bats-run"]["error"], r"^exit code \d+ \(expected 0\)")
+        self.assertIn(
+            "bats-run                           FAILED", format_table(results)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import hooks.common.chart_graph as chart_graph
+from hooks.common.chart_graph import ChartGraph, find_affected_charts, find_charts
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestChartGraph(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = logging.getLogger(__name__)
+
+        self._chart("charts/libchart", "type: library\n")
+        self._chart(
+            "charts/app",
+            "dependencies:\n"
+            "  - name: libchart\n"
+            "    repository: file://../libchart\n"
+            "  - name: redis\n"
+            "    repository: https://charts.example.com\n",
+        )
+        self._chart(
+            "charts/umbrella",
+            "dependencies:\n  - name: app\n    repository: file://../app\n",
+        )
+        self._chart("charts/standalone")
+        self._chart("helper-charts/libchart")
+        os.makedirs(os.path.join(self.dir, "helper-charts/libchart/charts"))
+        os.symlink(
+            os.path.join(self.dir, "charts/libchart"),
+            os.path.join(self.dir, "helper-charts/libchart/charts/libchart"),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _chart(self, path, extra=""):
+        chart_dir = os.path.join(self.dir, path)
+        os.makedirs(chart_dir)
+
+        with open(os.path.join(chart_dir, "Chart.yaml"), "w") as f:
+            f.write(
+                "apiVersion: v2\nname: %s\nversion: 1.0.0\n%s"
+                % (os.path.basename(path), extra)
+            )
+
+    def test_find_charts(self):
+        os.makedirs(os.path.join(self.dir, ".git/charts/hidden"))
+        open(os.path.join(self.dir, ".git/charts/hidden/Chart.yaml"), "w").close()
+
+        charts = find_charts(self.dir)
+
+        self.assertEqual(len(charts), 5)
+        self.assertIn(Path(self.dir, "charts/app").resolve(), charts)
+
+    def test_library_change_selects_dependents(self):
+        affected = find_affected_charts([Path("charts/libchart")], self.dir, self.log)
+
+        self.assertEqual(
+            affected,
+            {
+                Path("charts/libchart"),
+                Path("charts/app"),
+                Path("charts/umbrella"),
+                Path("helper-charts/libchart"),
+            },
+        )
+
+    def test_search_dirs(self):
+        # Charts outside of the search directories are not scanned
+        self._chart(
+            "vendor/other",
+            "dependencies:\n  - name: app\n    repository: file://../../charts/app\n",
+        )
+
+        affected = find_affected_charts(
+            [Path("charts/app")], self.dir, self.log, ["charts"]
+        )
+
+        self.assertEqual(affected, {Path("charts/app"), Path("charts/umbrella")})
+
+    def test_leaf_change_selects_only_itself(self):
+        affected = find_affected_charts(
+            [Path("charts/umbrella"), Path("charts/standalone")], self.dir, self.log
+        )
+
+        self.assertEqual(affected, {Path("charts/umbrella"), Path("charts/standalone")})
+
+    def test_invalid_chart_yaml_is_ignored(self):
+        with open(os.path.join(self.dir, "charts/app/Chart.yaml"), "w") as f:
+            f.write("dependencies: [\n")
+
+        with self.assertLogs(self.log, level="WARNING"):
+            affected = find_affected_charts(
+                [Path("charts/libchart")], self.dir, self.log
+            )
+
+        self.assertNotIn(Path("charts/app"), affected)
+        self.assertIn(Path("helper-charts/libchart"), affected)
+
+    def test_graph_update(self):
+        graph = ChartGraph(self.dir, self.log)
+
+        self.assertEqual(
+            graph.find_chart("charts/app/templates/x.yaml"), Path("charts/app")
+        )
+        self.assertIsNone(graph.find_chart("README.md"))
+
+        # A new chart depending on the library chart (Helm 2 style)
+        self._chart("charts/legacy")
+
+        with open(os.path.join(self.dir, "charts/legacy/requirements.yaml"), "w") as f:
+            f.write(
+                "dependencies:\n  - name: lib\n    repository: file://../libchart\n"
+            )
+
+        # The dependencies of the unchanged charts aren't read again
+        with patch(
+            "hooks.common.chart_graph.get_chart_dependencies",
+            wraps=chart_graph.get_chart_dependencies,
+        ) as mock_deps:
+            graph.update(
+                ["charts/legacy/Chart.yaml", "charts/legacy/requirements.yaml"]
+            )
+
+        self.assertEqual(
+            {c.args[0] for c in mock_deps.call_args_list},
+            {Path(self.dir, "charts/legacy").resolve()},
+        )
+        self.assertIn(Path("charts/legacy"), graph.affected([Path("charts/libchart")]))
+
+        # A removed chart is dropped
+        shutil.rmtree(os.path.join(self.dir, "charts/umbrella"))
+        graph.update(["charts/umbrella/Chart.yaml"])
+
+        self.assertNotIn(
+            Path("charts/umbrella"), graph.affected([Path("charts/libchart")])
+        )
+
+        # A subchart added to a chart makes it a dependent
+        self._chart("charts/standalone/charts/sub")
+        graph.update(["charts/standalone/charts/sub/Chart.yaml"])
+
+        self.assertEqual(
+            graph.affected([Path("charts/standalone/charts/sub")]),
+            {Path("charts/standalone/charts/sub"), Path("charts/standalone")},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from ruamel.yaml import YAML
+
+from hooks import bats, check_helm_version, check_version, helm_unittest
+from hooks.check_all import HOOKS, filter_files, main
+from hooks.common.shared import get_shared
+
+from tests._git_fixture import GitRepoFixture
+
+HOOKS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".pre-commit-hooks.yaml",
+)
+
+
+def _run_main(argv):
+    with patch("sys.argv", argv):
+        try:
+            main()
+        except SystemExit as e:
+            return e.code
+
+    return None
+
+
+class TestHookDefinitions(unittest.TestCase):
+    def test_filters_match_hook_definitions(self):
+        with open(HOOKS_FILE) as f:
+            definitions = {h["id"]: h for h in YAML(typ="safe").load(f)}
+
+        self.assertIn("check-all", definitions)
+
+        # All hooks but docker-image can be run by check-all
+        self.assertEqual(set(HOOKS), set(definitions) - {"docker-image", "check-all"})
+
+        for hook_id, hook in HOOKS.items():
+            with self.subTest(hook=hook_id):
+                definition = definitions[hook_id]
+
+                self.assertEqual(hook.get("files", ""), definition.get("files", ""))
+                self.assertEqual(hook.get("types", []), definition.get("types", []))
+                self.assertEqual(
+                    hook.get("always_run", False), definition.get("always_run", False)
+                )
+
+
+class TestFilterFiles(unittest.TestCase):
+    def test_filter(self):
+        paths = [
+            "charts/foo/Chart.yaml",
+            "charts/foo/README.md",
+            "hooks/check_all.py",
+            "tests/fixtures/missing.sh",
+        ]
+
+        self.assertEqual(
+            filter_files(HOOKS["helm-unittest"], paths), ["charts/foo/Chart.yaml"]
+        )
+        self.assertEqual(filter_files(HOOKS["check-version"], paths), paths)
+        self.assertEqual(filter_files(HOOKS["bats"], paths), [])
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.calls = {}
+
+    def _hook(self, hook_id, status):
+        def _main():
+            self.calls[hook_id] = sys.argv[1:]
+
+            # All hooks get the same shared values
+            self.calls.setdefault("shared", set()).add(
+                id(get_shared("key", lambda: object()))
+            )
+
+            if hook_id == "check-version":
+                sys.exit(status)
+
+            return status
+
+        return _main
+
+    def _patch(self, statuses):
+        patches = [
+            patch.object(module, "main", self._hook(hook_id, statuses.get(hook_id)))
+            for hook_id, module in (
+                ("check-helm-version", check_helm_version),
+                ("helm-unittest", helm_unittest),
+                ("check-version", check_version),
+                ("bats", bats),
+            )
+        ]
+
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_runs_hooks_with_their_files(self):
+        self._patch({"helm-unittest": 1, "check-version": 127})
+
+        argv = [
+            "check-all",
+            "--check-version-arg=--autofix",
+            "--debug",
+            "charts/foo/Chart.yaml",
+            "README.md",
+        ]
+
+        # The first failure is reported
+        self.assertEqual(_run_main(argv), 1)
+
+        self.assertEqual(
+            self.calls["check-helm-version"], ["--debug", "charts/foo/Chart.yaml"]
+        )
+        self.assertEqual(
+            self.calls["helm-unittest"], ["--debug", "charts/foo/Chart.yaml"]
+        )
+        self.assertEqual(
+            self.calls["check-version"],
+            ["--autofix", "--debug", "charts/foo/Chart.yaml", "README.md"],
+        )
+
+        # No shell scripts
+        self.assertNotIn("bats", self.calls)
+        self.assertEqual(len(self.calls["shared"]), 1)
+
+    def test_always_run_and_selected_hooks(self):
+        self._patch({"check-version": 127})
+
+        self.assertEqual(
+            _run_main(["check-all", "--hooks=check-helm-version,check-version"]), 0
+        )
+        self.assertEqual(self.calls["check-helm-version"], [])
+        self.assertNotIn("check-version", self.calls)
+
+        self.assertEqual(
+            _run_main(["check-all", "--hooks=check-version", "README.md"]), 127
+        )
+
+
+class TestLogging(unittest.TestCase):
+    def _hook(self, module, hook_id):
+        def _main():
+            log = module.get_logger("--debug" in sys.argv)
+            log.debug("Debug output of %s" % hook_id)
+
+        return _main
+
+    def test_debug_of_single_hook(self):
+        for hook_id, module in (
+            ("check-helm-version", check_helm_version),
+            ("check-version", check_version),
+        ):
+            p = patch.object(module, "main", self._hook(module, hook_id))
+            p.start()
+            self.addCleanup(p.stop)
+
+        argv = [
+            "check-all",
+            "--hooks=check-helm-version,check-version",
+            "--check-version-arg=--debug",
+            "README.md",
+        ]
+        stderr = io.StringIO()
+
+        with redirect_stderr(stderr):
+            self.assertEqual(_run_main(argv), 0)
+
+        self.assertIn("Debug output of check-version", stderr.getvalue())
+        self.assertNotIn("Debug output of check-helm-version", stderr.getvalue())
+
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.write("charts/foo/Chart.yaml", "name: foo\nversion: 1.0.0\n")
+        self.fixture.write("app/.version", "1.0.0\n")
+        self.fixture.add("charts/foo/Chart.yaml", "app/.version")
+        self.fixture.commit("seed")
+        self.fixture.create_branch("feature")
+        self.fixture.write("charts/foo/Chart.yaml", "name: foo\nversion: 1.0.1\n")
+        self.fixture.write("app/.version", "1.0.1\n")
+        self.cwd = os.getcwd()
+        os.chdir(self.fixture.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.fixture.cleanup()
+
+    def test_repo_is_opened_once(self):
+        argv = [
+            "check-all",
+            "--hooks=check-helm-version,check-version",
+            "--check-version-arg=--branch=main",
+            "--check-helm-version-arg=--branch=main",
+            "charts/foo/Chart.yaml",
+            "app/.version",
+        ]
+
+        with patch.object(
+            check_version, "Repo", wraps=check_version.Repo
+        ) as mock_repo, patch.object(
+            check_helm_version, "Repo", wraps=check_helm_version.Repo
+        ) as mock_helm_repo, patch.object(
+            check_version, "find_main_branch", wraps=check_version.find_main_branch
+        ) as mock_find, patch.object(
+            check_helm_version,
+            "find_main_branch",
+            wraps=check_helm_version.find_main_branch,
+        ) as mock_helm_find:
+            self.assertEqual(_run_main(argv), 0)
+
+        self.assertEqual(mock_repo.call_count + mock_helm_repo.call_count, 1)
+        self.assertEqual(mock_find.call_count + mock_helm_find.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,13 +3,13 @@ import unittest
 from unittest.mock import patch
 
 from hooks.check_helm_version import (
-    changed_paths_since_main,
     find_chart_dir,
     get_logger,
     main,
     parse_args,
     process_paths,
 )
+from hooks.common.git_helpers import changed_paths_since_main
 
 from tests._git_fixture import GitRepoFixture
 
@@ -156,6 +156,23 @@ class TestCheckFixed(unittest.TestCase):
         ]
         self.assertEqual(_run_main(argv), 127)
 
+    def test_main_without_version(self):
+        self.fixture.checkout("main")
+        self.fixture.write("charts/foo/Chart.yaml", "apiVersion: v2\n")
+        self.fixture.add("charts/foo/Chart.yaml")
+        self.fixture.commit("drop version")
+        self.fixture.checkout("feature")
+
+        for args in ([], ["--no-baseline-cache"]):
+            with self.subTest(args=args):
+                argv = [
+                    "check_helm_version.py",
+                    "--branch=main",
+                    *args,
+                    "charts/foo/Chart.yaml",
+                ]
+                self.assertEqual(_run_main(argv), 1)
+
     def test_autofix_writes_bumped_version(self):
         self.fixture.write("charts/foo/templates/x.yaml", "x: 1\n")
         argv = [
@@ -492,6 +509,55 @@ class TestChartIsolation(unittest.TestCase):
         self.assertEqual(_run_main(argv), 1)
 
 
+class TestDeepen(unittest.TestCase):
+    """The shallow clone is deepened only for the commit walk."""
+
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.write(
+            "charts/foo/Chart.yaml", CHART_TEMPLATE.format(version="1.0.0")
+        )
+        self.fixture.add("charts/foo/Chart.yaml")
+        self.fixture.commit("seed")
+        self.fixture.create_branch("feature")
+        self.fixture.write(
+            "charts/foo/Chart.yaml", CHART_TEMPLATE.format(version="1.0.1")
+        )
+        self.msg_path = os.path.join(self.fixture.dir, ".git", "COMMIT_EDITMSG")
+
+        with open(self.msg_path, "w") as f:
+            f.write("fix: update\n")
+
+        self.cwd = os.getcwd()
+        os.chdir(self.fixture.dir)
+
+        p = patch("hooks.check_helm_version.deepen_to_merge_base")
+        self.mock_deepen = p.start()
+        self.addCleanup(p.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.fixture.cleanup()
+
+    def test_fixed_strategy(self):
+        self.assertEqual(_run_main(["check-helm-version", "charts/foo/Chart.yaml"]), 0)
+        self.assertEqual(_run_main(["check-helm-version", self.msg_path]), 0)
+
+        self.mock_deepen.assert_not_called()
+
+    def test_conventional_strategy(self):
+        argv = ["check-helm-version", "--autofix-strategy=conventional"]
+
+        self.assertEqual(_run_main(argv + ["charts/foo/Chart.yaml"]), 0)
+        self.mock_deepen.assert_not_called()
+
+        _run_main(argv + [self.msg_path])
+        self.mock_deepen.assert_called_once()
+
+        _run_main(argv + ["--no-deepen", self.msg_path])
+        self.mock_deepen.assert_called_once()
+
+
 class TestChangedPathsSinceMain(unittest.TestCase):
     def setUp(self):
         self.fixture = GitRepoFixture()
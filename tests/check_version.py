@@ -1,15 +1,31 @@
 import os
+import shutil
+import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+from git import GitCommandError, Repo
 
 from hooks.check_version import (
-    changed_paths_since_main,
     find_version_dir,
     get_logger,
+    get_main_version,
     main,
     parse_args,
     process_paths,
 )
+from hooks.common.errors import MainBranchNotFoundError
+import hooks.common.git_helpers as git_helpers
+from hooks.common.git_helpers import (
+    changed_paths_since_main,
+    deepen_to_merge_base,
+    find_main_branch,
+    get_promisor_remote,
+    has_merge_base,
+    is_shallow,
+    iter_commit_subjects,
+    prefetch_blobs,
+)
 
 from tests._git_fixture import GitRepoFixture
 
@@ -432,5 +448,273 @@ class TestChangedPathsSinceMain(unittest.TestCase):
         self.assertIn(expected, result)
 
 
+class TestFindMainBranch(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.create_branch("feature")
+        self.log = get_logger(False)
+
+        # Refs sharing the name prefix must not be matched
+        self.fixture.repo.git.update_ref("refs/heads/main-old", "main")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+
+    def _find(self, branch_name, remote_name="origin"):
+        return find_main_branch(self.fixture.repo, branch_name, remote_name, self.log)
+
+    def test_local_branch(self):
+        head = self._find("main")
+
+        self.assertEqual(head.name, "main")
+        self.assertEqual(head.commit, self.fixture.main.commit)
+
+    def test_created_from_remote(self):
+        git = self.fixture.repo.git
+        git.remote("add", "origin", self.fixture.dir)
+        git.update_ref("refs/remotes/origin/release", "main")
+
+        head = self._find("release")
+
+        self.assertEqual(head.name, "release")
+        self.assertEqual(head.commit, self.fixture.main.commit)
+        self.assertEqual(self.fixture.repo.heads["release"].commit, head.commit)
+
+    def test_missing_remote(self):
+        with self.assertRaisesRegex(MainBranchNotFoundError, "remote 'origin'"):
+            self._find("release")
+
+    def test_missing_remote_branch(self):
+        git = self.fixture.repo.git
+        git.remote("add", "origin", self.fixture.dir)
+
+        # Refs below the branch name must not be matched
+        git.update_ref("refs/remotes/origin/release/v1", "main")
+
+        with self.assertRaises(MainBranchNotFoundError):
+            self._find("release")
+
+
+class TestDeepenToMergeBase(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.dir = tempfile.mkdtemp()
+        self.log = get_logger(False)
+
+        # Long history on main below the merge base
+        self._commits("base", 20)
+        self.fixture.create_branch("feature")
+        self._commits("feature", 4)
+        self.fixture.checkout("main")
+        self._commits("main", 3)
+
+        bare_dir = os.path.join(self.dir, "bare.git")
+        clone_dir = os.path.join(self.dir, "clone")
+
+        Repo.clone_from(self.fixture.dir, bare_dir, bare=True)
+        self.repo = Repo.clone_from(
+            "file://%s" % bare_dir,
+            clone_dir,
+            depth=1,
+            no_single_branch=True,
+            branch="feature",
+        )
+        self.main = find_main_branch(self.repo, "main", "origin", self.log)
+
+    def tearDown(self):
+        self.fixture.cleanup()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _commits(self, name, count):
+        for i in range(count):
+            self.fixture.write("%s.txt" % name, "%d\n" % i)
+            self.fixture.add("%s.txt" % name)
+            self.fixture.commit("chore: %s %d" % (name, i))
+
+    def _has_merge_base(self):
+        return has_merge_base(
+            self.repo, self.main.commit.hexsha, self.repo.head.commit.hexsha
+        )
+
+    def test_deepens_only_to_merge_base(self):
+        self.assertTrue(is_shallow(self.repo))
+        self.assertFalse(self._has_merge_base())
+
+        with patch.object(git_helpers, "DEEPEN_STEP", 2):
+            self.assertTrue(
+                deepen_to_merge_base(
+                    self.repo, self.main, self.repo.head, "origin", self.log
+                )
+            )
+
+        self.assertTrue(self._has_merge_base())
+
+        # The history below the merge base was not fetched
+        self.assertTrue(is_shallow(self.repo))
+        self.assertLess(len(list(self.repo.iter_commits("main"))), 20)
+
+    def test_unknown_remote(self):
+        self.assertFalse(
+            deepen_to_merge_base(
+                self.repo, self.main, self.repo.head, "upstream", self.log
+            )
+        )
+
+    def _run_in_clone(self, *argv):
+        cwd = os.getcwd()
+        os.chdir(self.repo.working_tree_dir)
+
+        try:
+            return _run_main(["check-version"] + list(argv))
+        finally:
+            os.chdir(cwd)
+
+    def _msg_path(self):
+        path = os.path.join(self.repo.git_dir, "COMMIT_EDITMSG")
+
+        with open(path, "w") as f:
+            f.write("chore: update\n")
+
+        return path
+
+    def test_main_deepens_for_commit_walk(self):
+        self._run_in_clone("--autofix-strategy=conventional", self._msg_path())
+
+        self.assertTrue(self._has_merge_base())
+
+    def test_main_does_not_deepen_without_commit_walk(self):
+        # Fixed strategy at the pre-commit stage
+        self._run_in_clone("feature.txt")
+
+        # Fixed strategy at the commit-msg stage
+        self._run_in_clone(self._msg_path())
+
+        # Conventional strategy at the pre-commit stage
+        self._run_in_clone("--autofix-strategy=conventional", "feature.txt")
+
+        self.assertFalse(self._has_merge_base())
+
+
+class TestPrefetchBlobs(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.dir = tempfile.mkdtemp()
+        self.bare_dir = os.path.join(self.dir, "bare.git")
+        self.log = get_logger(False)
+
+        for name, version in (("a", "1.0.0"), ("b", "2.0.0")):
+            self.fixture.write("%s/VERSION" % name, "%s\n" % version)
+            self.fixture.add("%s/VERSION" % name)
+
+        self.fixture.commit("chore: add versions")
+
+        bare = Repo.clone_from(self.fixture.dir, self.bare_dir, bare=True)
+        bare.git.config("uploadpack.allowFilter", "true")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _clone(self, **kwargs):
+        return Repo.clone_from(
+            "file://%s" % self.bare_dir,
+            os.path.join(self.dir, "clone"),
+            no_checkout=True,
+            **kwargs,
+        )
+
+    def test_partial_clone(self):
+        repo = self._clone(filter="blob:none")
+        self.assertEqual(get_promisor_remote(repo), "origin")
+
+        sha = repo.commit("origin/main").hexsha
+
+        prefetch_blobs(repo, sha, ["a/VERSION"], self.log)
+
+        # The prefetched blob is readable without the remote
+        shutil.rmtree(self.bare_dir)
+
+        self.assertEqual(repo.git.show("%s:a/VERSION" % sha), "1.0.0")
+
+        with self.assertRaises(GitCommandError):
+            repo.git.show("%s:b/VERSION" % sha)
+
+    def test_full_clone(self):
+        repo = self._clone()
+
+        self.assertIsNone(get_promisor_remote(repo))
+
+        with patch.object(repo, "git") as mock_git:
+            prefetch_blobs(repo, "origin/main", ["a/VERSION"], self.log)
+
+        mock_git.assert_not_called()
+        mock_git.ls_tree.assert_not_called()
+
+
+class TestGetMainVersion(unittest.TestCase):
+    def test_path_missing_from_snapshot(self):
+        snapshot = MagicMock()
+        snapshot.get.return_value = None
+        session = MagicMock()
+        session.file_content.return_value = "1.2.3\n"
+
+        # The file is read from the main branch instead of taken for a new one
+        self.assertEqual(get_main_version(snapshot, session, "app/.version"), "1.2.3")
+        session.file_content.assert_called_once_with("app/.version")
+
+        session.file_content.return_value = None
+
+        self.assertIsNone(get_main_version(snapshot, session, "new/.version"))
+
+
+class TestIterCommitSubjects(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.create_branch("feature")
+        self.fixture.write("a/x.txt", "x\n")
+        self.fixture.add("a/x.txt")
+        self.fixture.commit("feat: add a\n\nBody text.\n")
+        self.fixture.write("b/y.txt", "y\n")
+        self.fixture.add("b/y.txt")
+        self.fixture.commit("fix: add b")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+
+    def _subjects(self, dir_path=None):
+        return iter_commit_subjects(
+            self.fixture.repo, self.fixture.main, self.fixture.repo.head, dir_path
+        )
+
+    def test_yields_sha_and_subject(self):
+        head = self.fixture.repo.head.commit
+
+        self.assertEqual(
+            list(self._subjects()),
+            [(head.hexsha, "fix: add b"), (head.parents[0].hexsha, "feat: add a")],
+        )
+
+    def test_filters_by_directory(self):
+        self.assertEqual([s for _, s in self._subjects("a")], ["feat: add a"])
+
+    def test_can_be_closed_early(self):
+        commits = self._subjects()
+
+        self.assertEqual(next(commits)[1], "fix: add b")
+
+        commits.close()
+
+    def test_git_log_failure(self):
+        missing = MagicMock()
+        missing.commit.hexsha = "0" * 40
+
+        commits = iter_commit_subjects(
+            self.fixture.repo, missing, self.fixture.repo.head
+        )
+
+        with self.assertRaises(GitCommandError):
+            list(commits)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,11 +1,20 @@
+import logging
+import shutil
+import tempfile
 import unittest
+from unittest.mock import Mock
 
 from hooks.common.conventional import (
+    ParsedCommitCache,
+    bump_from_commits,
     bump_from_messages,
     parse_commit,
     portion_for_commit,
+    summarize_commit,
 )
 
+from tests import _cache_fixture  # noqa: F401
+
 
 class TestParseCommit(unittest.TestCase):
     def test_simple_feat(self):
@@ -157,5 +166,122 @@ class TestBumpFromMessages(unittest.TestCase):
         self.assertEqual(bump_from_messages(["junk", "fix: x"]), ("patch", True))
 
 
+class TestSummarizeCommit(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(
+            summarize_commit("feat(api)!: x"), ("feat", "api", True, "major")
+        )
+
+    def test_no_bump(self):
+        self.assertEqual(summarize_commit("chore: x"), ("chore", None, False, None))
+
+    def test_invalid(self):
+        self.assertIsNone(summarize_commit("junk"))
+
+
+class TestParsedCommitCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ParsedCommitCache.open(self.dir, logging.getLogger(__name__))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_put_and_get(self):
+        self.cache.put({"a" * 40: ("fix", None, False, "patch"), "b" * 40: None})
+
+        self.assertEqual(
+            self.cache.get(["a" * 40, "b" * 40, "c" * 40]),
+            {"a" * 40: ("fix", None, False, "patch"), "b" * 40: None},
+        )
+
+    def test_persists_across_instances(self):
+        self.cache.put({"a" * 40: ("feat", "x", True, "major")})
+
+        cache = ParsedCommitCache.open(self.dir, logging.getLogger(__name__))
+        self.assertEqual(
+            cache.get(["a" * 40]), {"a" * 40: ("feat", "x", True, "major")}
+        )
+        cache.close()
+
+    def test_prune_keeps_only_given_shas(self):
+        self.cache.put({"a" * 40: None, "b" * 40: None})
+        self.cache.prune_if_due(lambda: ["a" * 40], now=1000)
+
+        self.assertEqual(self.cache.get(["a" * 40, "b" * 40]), {"a" * 40: None})
+
+    def test_prune_runs_once_per_interval(self):
+        self.cache.prune_if_due(lambda: [], now=1000)
+
+        keep = Mock(return_value=[])
+        self.cache.prune_if_due(keep, now=1001)
+        keep.assert_not_called()
+
+        self.cache.prune_if_due(keep, now=1000 + ParsedCommitCache.PRUNE_INTERVAL)
+        keep.assert_called_once()
+
+
+class TestBumpFromCommits(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ParsedCommitCache.open(self.dir, logging.getLogger(__name__))
+        self.messages = {
+            "a" * 40: "fix: a\n\nBREAKING CHANGE: drops x\n",
+            "b" * 40: "feat: b\n",
+            "c" * 40: "junk\n",
+        }
+        self.load_message = Mock(side_effect=self.messages.get)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _subjects(self, *shas):
+        return [(sha, self.messages[sha].partition("\n")[0]) for sha in shas]
+
+    def test_full_messages_without_loader(self):
+        commits = [("a" * 40, "fix: a"), (None, "feat: b")]
+        self.assertEqual(bump_from_commits(commits), ("minor", True))
+
+    def test_body_loaded_only_for_valid_subjects(self):
+        commits = self._subjects("c" * 40, "b" * 40)
+
+        self.assertEqual(bump_from_commits(commits, self.load_message), ("minor", True))
+        self.load_message.assert_called_once_with("b" * 40)
+
+    def test_breaking_footer_is_found_in_body(self):
+        commits = self._subjects("b" * 40, "a" * 40)
+
+        self.assertEqual(bump_from_commits(commits, self.load_message), ("major", True))
+
+    def test_stops_at_first_breaking_change(self):
+        commits = iter([(None, "feat!: x")] + self._subjects("b" * 40))
+
+        self.assertEqual(bump_from_commits(commits, self.load_message), ("major", True))
+        self.load_message.assert_not_called()
+        self.assertEqual(next(commits), self._subjects("b" * 40)[0])
+
+    def test_only_new_commits_are_parsed(self):
+        commits = self._subjects("b" * 40, "c" * 40)
+        bump_from_commits(commits, self.load_message, self.cache)
+
+        self.load_message.reset_mock()
+
+        commits = self._subjects("a" * 40, "b" * 40, "c" * 40)
+
+        self.assertEqual(
+            bump_from_commits(commits, self.load_message, self.cache),
+            ("major", True),
+        )
+        self.load_message.assert_called_once_with("a" * 40)
+
+    def test_in_flight_message_is_not_cached(self):
+        bump_from_commits([(None, "feat: x")], self.load_message, self.cache)
+
+        count = self.cache.db.execute("SELECT COUNT(*) FROM commits").fetchone()
+        self.assertEqual(count, (0,))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,14 @@
 import io
 import os
 import sys
+import tempfile
+import threading
 import unittest
 
 from contextlib import redirect_stdout, redirect_stderr
+from unittest.mock import patch
+
+from tests import _cache_fixture  # noqa: F401
 
 
 class Common:
@@ -446,7 +451,7 @@ class TestDockerImage(MyTestCase):
 
         import hooks.docker_image as di
 
-        def docker_cmd_test(color=False):
+        def docker_cmd_test(color=False, **kwargs):
             return self.___cmd
 
         # Mock function
@@ -477,3 +482,417 @@ class TestDockerImage(MyTestCase):
         for name, test in tests.items():
             with self.subTest(name=name):
                 _run_test(test)
+
+    def test_main_streams_output(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        def docker_cmd_test(color=False, **kwargs):
+            return ("sh",)
+
+        # Mock function
+        di.docker_cmd = docker_cmd_test
+        di.SYS_ARGV = [
+            "",
+            "-c",
+            "head -c 3000 /dev/zero | tr '\\0' x; >&2 printf 'ž'; exit 3",
+        ]
+        di.STREAM_CHUNK_SIZE = 1
+
+        f_out = io.StringIO()
+        f_err = io.StringIO()
+
+        with redirect_stdout(f_out):
+            with redirect_stderr(f_err):
+                actual = di.main()
+
+        # Output is forwarded completely and separately, multibyte characters
+        # split between chunks included
+        self.assertEqual(actual, 3)
+        self.assertEqual(f_out.getvalue(), "x" * 3000)
+        self.assertEqual(f_err.getvalue(), "ž")
+
+    def test_parse_hook_args(self):
+        import hooks.docker_image as di
+
+        # Test cases
+        tests = {
+            "no marker": {
+                "args": ["image", "-c", "cmd", "file"],
+                "expected": (3, False, ("image", "-c", "cmd", "file"), None),
+            },
+            "marker": {
+                "args": ["--jobs=2", "image", "--", "x", "--", "a", "b"],
+                "expected": (2, False, ("image", "--", "x", "--"), ("a", "b")),
+            },
+            "serial": {
+                "args": ["--serial", "--warm", "image", "--"],
+                "expected": (1, True, ("image", "--"), ()),
+            },
+            "mount": {
+                "args": ["--hook-mount=auto", "image"],
+                "expected": (3, False, ("image",), None),
+                "mount": ("auto", None),
+            },
+            "volumes from": {
+                "args": ["--hook-volumes-from=ci-job", "image"],
+                "expected": (3, False, ("image",), None),
+                "mount": ("volumes-from", "ci-job"),
+            },
+            "docker mount options": {
+                "args": ["--mount=type=bind,src=/x,dst=/y", "--volumes-from=data", "i"],
+                "expected": (
+                    3,
+                    False,
+                    ("--mount=type=bind,src=/x,dst=/y", "--volumes-from=data", "i"),
+                    None,
+                ),
+            },
+        }
+
+        for name, test in tests.items():
+            with self.subTest(name=name), patch.object(
+                di.lang_base, "target_concurrency", return_value=3
+            ):
+                options, args, files = di._parse_hook_args(test["args"])
+
+                self.assertEqual(
+                    (options.jobs, options.warm, args, files), test["expected"]
+                )
+                self.assertEqual(
+                    (options.mount, options.container),
+                    test.get("mount", ("bind", None)),
+                )
+
+        with self.assertRaises(ValueError):
+            di._parse_hook_args(["--hook-mount=tmpfs", "image"])
+
+    def test_main_batches_files(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        def docker_cmd_test(color=False, **kwargs):
+            return ("sh",)
+
+        # Mock functions (`sh` is taken as the image)
+        di.docker_cmd = docker_cmd_test
+        di._pull_image = lambda image: (0, b"")
+
+        # Test cases
+        tests = {
+            "concurrent": {
+                "argv": ["", "--jobs=2", "-c", 'echo "$@"; exit $#', "sh", "--"],
+                "expected": 5,
+                "stdout": "-- a b c d\n-- e f g h\n",
+            },
+            "serial": {
+                "argv": ["", "--serial", "-c", 'echo "$@"; exit $#', "sh", "--"],
+                "expected": 9,
+                "stdout": "-- a b c d e f g h\n",
+            },
+        }
+
+        def _run_test(test):
+            di.SYS_ARGV = test["argv"] + list("abcdefgh")
+
+            f_out = io.StringIO()
+
+            with redirect_stdout(f_out):
+                actual = di.main()
+
+            self.assertEqual(actual, test["expected"])
+            self.assertEqual(f_out.getvalue(), test["stdout"])
+
+        for name, test in tests.items():
+            with self.subTest(name=name):
+                _run_test(test)
+
+    def test_split_docker_args(self):
+        import hooks.docker_image as di
+
+        # Test cases
+        tests = {
+            "image only": {
+                "args": ["alpine"],
+                "expected": ((), "alpine", ()),
+            },
+            "options": {
+                "args": ["-it", "-e", "A=1", "--rm", "--network=host", "alpine", "ls"],
+                "expected": (
+                    ("-it", "-e", "A=1", "--rm", "--network=host"),
+                    "alpine",
+                    ("ls",),
+                ),
+            },
+            "no image": {
+                "args": ["-e", "A=1"],
+                "expected": (("-e", "A=1"), None, ()),
+            },
+        }
+
+        for name, test in tests.items():
+            with self.subTest(name=name):
+                self.assertEqual(di._split_docker_args(test["args"]), test["expected"])
+
+    def test_warm_cmd(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        run_cmd = ("docker", "run", "--rm", "-v", "/repo:/src:rw,Z")
+        calls = []
+        running = []
+        state = ["exited"]
+
+        def cmd_output_b_test(*cmd, check=True):
+            calls.append(cmd[:3])
+
+            if cmd[:3] == ("docker", "container", "inspect"):
+                if running:
+                    return 0, b'running [["/lint"], ["--all"]]\n', b""
+
+                return 0, state[0].encode() + b" \n", b""
+
+            if cmd[:3] == ("docker", "image", "inspect"):
+                return 0, b'{"Entrypoint": ["/lint"], "Cmd": ["--all"]}', b""
+
+            if cmd[:3] == ("docker", "run", "--detach"):
+                self.assertIn("--entrypoint", cmd)
+                running.append(cmd)
+
+            return 0, b"", b""
+
+        di.cmd_output_b = cmd_output_b_test
+
+        cmd = di.warm_cmd(run_cmd, ("-e", "A=1", "image"), 60)
+
+        self.assertEqual(cmd[:2], ("docker", "exec"))
+        self.assertEqual(cmd[-2:], ("/lint", "--all"))
+        self.assertEqual(len(running), 1)
+
+        # The stopped container was removed without --force
+        self.assertIn(("docker", "rm", cmd[2]), calls)
+
+        # The running container is reused (the entrypoint is not part of the
+        # container options)
+        calls.clear()
+        cmd = di.warm_cmd(
+            run_cmd, ("-e", "A=1", "--entrypoint", "/custom", "image", "x"), 60
+        )
+
+        self.assertEqual(calls, [("docker", "container", "inspect")])
+        self.assertEqual(cmd[-2:], ("/custom", "x"))
+
+        # A container being started by a concurrent hook run is not removed
+        calls.clear()
+        running.clear()
+        state[0] = "created"
+
+        cmd = di.warm_cmd(run_cmd, ("-e", "A=1", "image"), 60)
+
+        self.assertEqual(cmd[:2], ("docker", "exec"))
+        self.assertNotIn(("docker", "rm", cmd[2]), calls)
+
+    def test_docker_cmd_mount(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        mountinfo = (
+            b"22 1 0:21 / / rw - overlay overlay rw\n"
+            b"23 22 8:1 /data /builds/my\\040repo rw - ext4 /dev/sda1 rw\n"
+        )
+        cwd = "/builds/my repo"
+        bind = ("-v", "/host/path:/src:rw,Z", "--workdir", "/src")
+
+        # Test cases
+        tests = {
+            "auto on a volume": {
+                "mount": "auto",
+                "expected": ("--volumes-from", "abc123", "--workdir", cwd),
+            },
+            "auto on the root filesystem": {
+                "mount": "auto",
+                "cwd": "/app",
+                "expected": bind,
+            },
+            "auto with remote daemon": {
+                "mount": "auto",
+                "env": {"DOCKER_HOST": "tcp://docker:2375"},
+                "expected": bind,
+            },
+            "auto outside container": {
+                "mount": "auto",
+                "container_id": None,
+                "expected": ("-v", f"{cwd}:/src:rw,Z", "--workdir", "/src"),
+            },
+            "bind": {
+                "mount": "bind",
+                "expected": bind,
+            },
+            "volumes-from given container": {
+                "mount": "volumes-from",
+                "container": "ci-job",
+                "cwd": "/app",
+                "expected": ("--volumes-from", "ci-job", "--workdir", "/app"),
+            },
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            di.PROC_MOUNTINFO = os.path.join(tmp, "mountinfo")
+
+            with open(di.PROC_MOUNTINFO, "wb") as f:
+                f.write(mountinfo)
+
+            # Run individual test
+            def _run_test(test):
+                env = {"DOCKER_HOST": "", "DOCKER_CONTEXT": ""}
+                env.update(test.get("env", {}))
+
+                with patch.object(
+                    di,
+                    "_get_container_id",
+                    return_value=test.get("container_id", "abc123"),
+                ) as mock_id, patch.object(
+                    di, "_get_docker_path", return_value="/host/path"
+                ) as mock_path, patch.object(
+                    di.os, "getcwd", return_value=test.get("cwd", cwd)
+                ), patch.dict(
+                    os.environ, env
+                ):
+                    actual = di._get_docker_mount(test["mount"], test.get("container"))
+
+                self.assertEqual(actual, test["expected"])
+
+                # No path translation (docker inspect) with --volumes-from
+                if actual[0] == "--volumes-from":
+                    mock_path.assert_not_called()
+
+                # No detection for a given container
+                if "container" in test:
+                    mock_id.assert_not_called()
+
+            # Run individual tests
+            for name, test in tests.items():
+                with self.subTest(name=name):
+                    _run_test(test)
+
+    def test_get_docker_info(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        calls = []
+
+        def cmd_output_b_test(*cmd, check=True):
+            calls.append(cmd)
+
+            return 0, b'{"ServerVersion": "27.0.0", "SecurityOptions": []}', b""
+
+        di.cmd_output_b = cmd_output_b_test
+
+        with tempfile.TemporaryDirectory() as tmp:
+            bin_dir = os.path.join(tmp, "bin")
+            config = os.path.join(tmp, "docker", "config.json")
+
+            os.makedirs(bin_dir)
+            os.makedirs(os.path.dirname(config))
+
+            with open(os.path.join(bin_dir, "docker"), "w") as f:
+                f.write("#!/bin/sh\n")
+
+            os.chmod(os.path.join(bin_dir, "docker"), 0o755)
+
+            with open(config, "w") as f:
+                f.write('{"currentContext": "default"}')
+
+            env = {
+                "PATH": bin_dir,
+                "XDG_CACHE_HOME": os.path.join(tmp, "cache"),
+                "DOCKER_CONFIG": os.path.dirname(config),
+                "DOCKER_HOST": "",
+                "DOCKER_CONTEXT": "",
+            }
+
+            with patch.dict(os.environ, env):
+                expected = {"version": "27.0.0", "rootless": False}
+
+                self.assertEqual(di.get_docker_info(), expected)
+                self.assertEqual(di.get_docker_info(), expected)
+                self.assertEqual(len(calls), 1)
+
+                # A switched context is probed again
+                with open(config, "w") as f:
+                    f.write('{"currentContext": "rootless"}')
+
+                di.get_docker_info()
+                self.assertEqual(len(calls), 2)
+
+                # So is a changed daemon address
+                with patch.dict(os.environ, {"DOCKER_HOST": "tcp://docker:2375"}):
+                    di.get_docker_info()
+
+                self.assertEqual(len(calls), 3)
+
+    def test_main_pulls_image(self):
+        # Force module reload
+        if "hooks.docker_image" in sys.modules:
+            del sys.modules["hooks.docker_image"]
+
+        import hooks.docker_image as di
+
+        pulling = threading.Event()
+        calls = []
+
+        def docker_cmd_test(color=False, **kwargs):
+            # The pull runs while the container is being detected
+            self.assertTrue(pulling.wait(5))
+
+            return ("docker", "run", "--rm")
+
+        def cmd_output_b_test(*cmd, check=True):
+            calls.append(cmd)
+
+            if cmd[:3] == ("docker", "image", "inspect"):
+                pulling.set()
+
+                return 1, b"", b"No such image"
+
+            return 125, b"", b"manifest unknown\n"
+
+        di.docker_cmd = docker_cmd_test
+        di.cmd_output_b = cmd_output_b_test
+        di.SYS_ARGV = ["", "-e", "A=1", "my/image:1.0", "lint"]
+
+        f_err = io.StringIO()
+
+        with patch.object(
+            di, "_run_streamed", return_value=0
+        ) as mock_run, redirect_stderr(f_err):
+            actual = di.main()
+
+        # The pull failure is not fatal, docker run pulls and reports itself
+        self.assertEqual(actual, 0)
+        self.assertEqual(
+            f_err.getvalue(),
+            "Failed to pre-pull image my/image:1.0, continuing:\nmanifest unknown\n",
+        )
+        self.assertEqual(calls[-1], ("docker", "pull", "--quiet", "my/image:1.0"))
+        mock_run.assert_called_once_with(
+            "docker", "run", "--rm", "-e", "A=1", "my/image:1.0", "lint"
+        )
+
+        # The pull policy given in the docker args is respected
+        self.assertIsNone(di._get_pull_image(("--pull=always", "my/image:1.0")))
@@ -1,10 +1,15 @@
+import os
 import re
+import shutil
 import subprocess
 import tempfile
 import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
+import hooks.common.chart_graph as chart_graph
+from hooks.common.history import DurationHistory
+from hooks.common.suite_index import SuiteIndex
 from hooks.helm_unittest import (
     find_chart_directories,
     check_helm_unittest_available,
@@ -12,9 +17,23 @@ from hooks.helm_unittest import (
     apply_path_substitution,
     main,
     parse_args,
+    get_helm_plugin_version,
     get_logger,
+    get_chart_roots,
+    parse_helm_unittest_help,
 )
 
+from tests import _cache_fixture  # noqa: F401
+
+HELM_UNITTEST_HELP = """\
+Running chart unittest written in YAML.
+
+Flags:
+      --failfast             direct call with exit on first test failure
+  -t, --output-type string   the file-format where testing report will be \
+saved to (default "XUnit"), accept: XUnit, NUnit, JUnit, Sonar
+"""
+
 
 class TestCheckHelmUnittest(unittest.TestCase):
     def setUp(self):
@@ -279,6 +298,75 @@ tests:
 
         self.assertFalse(result)
 
+    @patch("subprocess.run")
+    def test_run_helm_unittest_selected_suites(self, mock_run):
+        """Test running only the test suites covering the changed templates."""
+        logger = get_logger(debug=False)
+        mock_run.return_value = MagicMock(stdout="All tests passed", stderr="")
+
+        (self.chart_dir / "tests" / "unittest" / "service_test.yaml").write_text(
+            "templates:\n  - service.yaml\n"
+        )
+
+        result = run_helm_unittest(
+            self.chart_dir,
+            "tests/unittest",
+            "*.yaml",
+            False,
+            None,  # No path substitution
+            logger,
+            [str(self.chart_dir / "templates" / "service.yaml")],
+            SuiteIndex(self.test_dir, logger),
+        )
+
+        self.assertTrue(result)
+        cmd = mock_run.call_args[0][0]
+        self.assertEqual(
+            cmd[2:], ["-f", "tests/unittest/service_test.yaml", str(self.chart_dir)]
+        )
+
+    @patch("subprocess.run")
+    def test_run_helm_unittest_history(self, mock_run):
+        """Test that only the durations of the full runs are recorded."""
+        logger = get_logger(debug=False)
+        history = DurationHistory("helm-unittest", self.test_dir, logger)
+        args = (self.chart_dir, "tests/unittest", "*.yaml")
+        mock_run.return_value = MagicMock(stdout="All tests passed", stderr="")
+
+        (self.chart_dir / "tests" / "unittest" / "service_test.yaml").write_text(
+            "templates:\n  - service.yaml\n"
+        )
+
+        run_helm_unittest(*args, False, None, logger, history=history)
+        self.assertIsNotNone(history.durations[self.chart_dir])
+
+        # Only the suites covering the changes ran
+        run_helm_unittest(
+            *args,
+            False,
+            None,
+            logger,
+            [str(self.chart_dir / "templates" / "service.yaml")],
+            SuiteIndex(self.test_dir, logger),
+            history,
+        )
+        self.assertIsNone(history.durations[self.chart_dir])
+
+        # The failfast run stopped at the first failure
+        mock_run.side_effect = subprocess.CalledProcessError(1, "helm", "", "")
+
+        run_helm_unittest(*args, True, None, logger, history=history)
+        self.assertIsNone(history.durations[self.chart_dir])
+        self.assertEqual(history.get(self.chart_dir)[1], True)
+
+        # Skipped charts are not recorded at all
+        history = DurationHistory("helm-unittest", self.test_dir, logger)
+
+        run_helm_unittest(
+            self.chart_dir, "missing", "*.yaml", False, None, logger, history=history
+        )
+        self.assertEqual(history.durations, {})
+
     def test_run_helm_unittest_no_tests_dir(self):
         """Test running helm unittest when tests directory doesn't exist."""
         logger = get_logger(debug=False)
@@ -375,10 +463,18 @@ tests:
     @patch("hooks.helm_unittest.parse_args")
     def test_main_no_helm_unittest(self, mock_parse_args, mock_available):
         """Test main function when helm unittest is not available."""
-        mock_parse_args.return_value = MagicMock(files=[], path_sub_pattern=None)
-        mock_available.return_value = False
+        mock_parse_args.return_value = MagicMock(
+            files=[],
+            path_sub_pattern=None,
+            profile=False,
+            profile_output=None,
+            metrics_file=None,
+        )
+        mock_available.return_value = None
 
-        result = main()
+        # Don't use the user's probe cache
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.test_dir}):
+            result = main()
 
         self.assertEqual(result, 1)
 
@@ -386,13 +482,110 @@ tests:
     @patch("hooks.helm_unittest.parse_args")
     def test_main_no_files(self, mock_parse_args, mock_available):
         """Test main function when no files are provided."""
-        mock_parse_args.return_value = MagicMock(files=[], path_sub_pattern=None)
-        mock_available.return_value = True
+        mock_parse_args.return_value = MagicMock(
+            files=[],
+            watch=False,
+            path_sub_pattern=None,
+            profile=False,
+            profile_output=None,
+            metrics_file=None,
+        )
+        mock_available.return_value = HELM_UNITTEST_HELP
 
-        result = main()
+        # Don't use the user's probe cache
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.test_dir}):
+            result = main()
 
         self.assertEqual(result, 0)
 
+    def test_get_chart_roots(self):
+        cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        pattern = "^charts/(libchart),helper-charts/\\1"
+
+        self.assertEqual(get_chart_roots("charts", pattern), ["charts"])
+
+        os.mkdir("helper-charts")
+
+        self.assertEqual(
+            get_chart_roots("charts", pattern), ["charts", "helper-charts"]
+        )
+        self.assertEqual(get_chart_roots("charts", None), ["charts"])
+
+    @patch(
+        "hooks.helm_unittest.check_helm_unittest_available",
+        return_value=HELM_UNITTEST_HELP,
+    )
+    @patch("hooks.helm_unittest.run_helm_unittest", return_value=True)
+    def test_main_watch(self, mock_run, mock_available):
+        """Test that the watch mode runs the tests of the changed charts."""
+        cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        changes = [
+            {"charts/test-chart/templates/deployment.yaml"},
+            {"README.md"},
+            {"charts/test-chart/values.yaml"},
+        ]
+
+        def _iter_changes(watcher):
+            yield from changes
+
+            raise KeyboardInterrupt
+
+        argv = ["helm_unittest.py", "--watch", "--no-history"]
+
+        with patch("sys.argv", argv), patch(
+            "hooks.helm_unittest.iter_changes", _iter_changes
+        ), patch.dict(os.environ, {"XDG_CACHE_HOME": self.test_dir}), patch(
+            "hooks.common.chart_graph.find_charts",
+            wraps=chart_graph.find_charts,
+        ) as mock_find:
+            self.assertEqual(main(), 0)
+
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertEqual(mock_run.call_args_list[0].args[0], Path("charts/test-chart"))
+        self.assertEqual(
+            mock_run.call_args_list[0].args[6],
+            ["charts/test-chart/templates/deployment.yaml"],
+        )
+
+        # The charts are searched for only once
+        self.assertEqual(
+            mock_find.call_count,
+            len(get_chart_roots("charts", "^charts/(libchart),helper-charts/\\1")),
+        )
+
+
+class TestHelmUnittestProbe(unittest.TestCase):
+    def test_parse_help(self):
+        self.assertEqual(
+            parse_helm_unittest_help(HELM_UNITTEST_HELP),
+            {"output_types": ["XUnit", "NUnit", "JUnit", "Sonar"], "failfast": True},
+        )
+        self.assertEqual(
+            parse_helm_unittest_help("Usage: helm unittest"),
+            {"output_types": [], "failfast": False},
+        )
+
+    def test_plugin_version(self):
+        plugins_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, plugins_dir, ignore_errors=True)
+
+        for name, version in (("diff", "3.9.0"), ("unittest", "0.5.1")):
+            os.mkdir(os.path.join(plugins_dir, f"helm-{name}"))
+
+            with open(
+                os.path.join(plugins_dir, f"helm-{name}", "plugin.yaml"), "w"
+            ) as f:
+                f.write(f'name: "{name}"\nversion: "{version}"\n')
+
+        self.assertEqual(get_helm_plugin_version("unittest", plugins_dir), "0.5.1")
+        self.assertIsNone(get_helm_plugin_version("missing", plugins_dir))
+
 
 if __name__ == "__main__":
     unittest.main()
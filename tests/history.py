@@ -0,0 +1,97 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import hooks.common.history as history_module
+from hooks.common.history import DurationHistory
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestDurationHistory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.dir, ".git")
+        self.log = logging.getLogger(__name__)
+
+        os.makedirs(self.git_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _history(self, hook="helm-unittest"):
+        return DurationHistory(hook, self.dir, self.log, self.git_dir)
+
+    def _record(self, items, hook="helm-unittest"):
+        history = self._history(hook)
+
+        for item, duration, success in items:
+            history.record(os.path.join(self.dir, item), duration, success)
+
+        history.save()
+
+    def _order(self, items, hook="helm-unittest"):
+        paths = [os.path.join(self.dir, item) for item in items]
+
+        return [os.path.relpath(p, self.dir) for p in self._history(hook).order(paths)]
+
+    def test_failed_first(self):
+        self._record(
+            [
+                ("charts/fast", 1, True),
+                ("charts/slow", 90, True),
+                ("charts/broken", 5, False),
+            ]
+        )
+
+        self.assertEqual(
+            self._order(["charts/fast", "charts/new", "charts/broken", "charts/slow"]),
+            ["charts/broken", "charts/fast", "charts/new", "charts/slow"],
+        )
+
+    def test_hooks_are_separated(self):
+        self._record([("a", 1, True), ("b", 2, False)], hook="bats-run")
+
+        self.assertEqual(self._order(["a", "b"]), ["a", "b"])
+        self.assertEqual(self._order(["a", "b"], hook="bats-run"), ["b", "a"])
+
+    def test_partial_run_keeps_duration(self):
+        self._record([("a", 30, True)])
+        self._record([("a", None, False), ("b", None, True)])
+
+        history = self._history()
+
+        self.assertEqual(history.get(os.path.join(self.dir, "a")), (30, True))
+        self.assertEqual(history.get(os.path.join(self.dir, "b")), (None, False))
+
+    def test_duration_is_smoothed(self):
+        self._record([("a", 10, True)])
+        self._record([("a", 20, True)])
+
+        self.assertEqual(self._history().get(os.path.join(self.dir, "a")), (15, False))
+
+    def test_history_is_bounded(self):
+        with patch.object(history_module, "MAX_ENTRIES", 2), patch(
+            "time.time", side_effect=[1, 2, 3]
+        ):
+            self._record([("a", 1, True), ("b", 1, True), ("c", 1, True)])
+
+        history = self._history()
+
+        self.assertIsNone(history.get(os.path.join(self.dir, "a")))
+        self.assertIsNotNone(history.get(os.path.join(self.dir, "c")))
+
+    def test_disabled_without_git_dir(self):
+        history = DurationHistory("helm-unittest", self.dir, self.log)
+        history.record("a", 1, True)
+        history.save()
+
+        self.assertEqual(history.order(["b", "a"]), ["b", "a"])
+        self.assertFalse(os.listdir(self.git_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
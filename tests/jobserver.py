@@ -0,0 +1,250 @@
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from hooks.common.jobserver import JobLimiter, parse_jobserver_auth
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestParseJobserverAuth(unittest.TestCase):
+    def test_parse(self):
+        # Test cases
+        tests = {
+            "none": ("-j4", None),
+            "pipe": ("-j4 --jobserver-auth=3,4", ("pipe", (3, 4))),
+            "old make": (" --jobserver-fds=5,6 -j", ("pipe", (5, 6))),
+            "fifo": ("-j --jobserver-auth=fifo:/tmp/GMfifo1", ("fifo", "/tmp/GMfifo1")),
+            "last wins": (
+                "--jobserver-auth=3,4 --jobserver-auth=fifo:/tmp/f",
+                ("fifo", "/tmp/f"),
+            ),
+            "invalid": ("--jobserver-auth=x", None),
+        }
+
+        for name, (makeflags, expected) in tests.items():
+            with self.subTest(name=name):
+                self.assertEqual(parse_jobserver_auth(makeflags), expected)
+
+
+class TestJobLimiter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _assert_blocks(self, limiter, release):
+        """Assert that acquiring a slot in a thread waits until ``release`` is
+        called."""
+        acquired = threading.Event()
+
+        def _acquire():
+            with limiter.slot():
+                acquired.set()
+
+        thread = threading.Thread(target=_acquire)
+        thread.start()
+
+        self.assertFalse(acquired.wait(0.2))
+
+        release()
+
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_jobserver_pipe(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        # One token in the jobserver plus the implicit one
+        os.write(write_fd, b"+")
+
+        limiter = JobLimiter(
+            makeflags="-j2 --jobserver-auth=%d,%d" % (read_fd, write_fd),
+            slots_dir=self.dir,
+        )
+        implicit = limiter.slot()
+        extra = limiter.slot()
+
+        implicit.__enter__()
+        extra.__enter__()
+
+        self._assert_blocks(limiter, lambda: extra.__exit__(None, None, None))
+        implicit.__exit__(None, None, None)
+
+        # The token was returned to the jobserver
+        self.assertEqual(os.read(read_fd, 1), b"+")
+
+    def test_implicit_token_shared_by_siblings(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        makeflags = "-j2 --jobserver-auth=%d,%d" % (read_fd, write_fd)
+        limiter = JobLimiter(makeflags=makeflags, slots_dir=self.dir)
+
+        # A sibling process (the same parent) runs on the implicit token
+        sibling = JobLimiter(makeflags=makeflags, slots_dir=self.dir)
+        sibling_slot = sibling.slot()
+        sibling_slot.__enter__()
+
+        self._assert_blocks(limiter, lambda: os.write(write_fd, b"+"))
+
+        sibling_slot.__exit__(None, None, None)
+
+        # The jobserver token was returned
+        self.assertEqual(os.read(read_fd, 1), b"+")
+
+    def test_jobserver_closed(self):
+        read_fd, write_fd = os.pipe()
+        other_read_fd, other_write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, other_read_fd)
+        self.addCleanup(os.close, other_write_fd)
+
+        limiter = JobLimiter(
+            makeflags="-j2 --jobserver-auth=%d,%d" % (read_fd, other_write_fd),
+            slots_dir=self.dir,
+        )
+
+        # make has exited
+        os.close(write_fd)
+
+        with limiter.slot(), limiter.slot():
+            pass
+
+        self.assertIsNone(limiter.read_fd)
+
+    def test_jobserver_fifo(self):
+        path = os.path.join(self.dir, "fifo")
+        os.mkfifo(path)
+
+        limiter = JobLimiter(
+            makeflags="-j1 --jobserver-auth=fifo:%s" % path, slots_dir=self.dir
+        )
+
+        with limiter.slot():
+            self._assert_blocks(limiter, lambda: os.write(limiter.write_fd, b"+"))
+
+    def test_slot_pool(self):
+        limiter = JobLimiter(makeflags="", slots=1, slots_dir=self.dir)
+        slot = limiter.slot()
+
+        slot.__enter__()
+
+        self._assert_blocks(limiter, lambda: slot.__exit__(None, None, None))
+
+    def test_stale_implicit_locks_removed(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        # A finished process
+        proc = subprocess.Popen([sys.executable, "-c", ""])
+        proc.wait()
+
+        stale = os.path.join(self.dir, "implicit-%d.lock" % proc.pid)
+        alive = os.path.join(self.dir, "implicit-%d.lock" % os.getpid())
+
+        for path in (stale, alive):
+            open(path, "w").close()
+
+        JobLimiter(
+            makeflags="-j2 --jobserver-auth=%d,%d" % (read_fd, write_fd),
+            slots_dir=self.dir,
+        )
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(alive))
+
+    def test_held_stale_implicit_lock_kept(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        proc = subprocess.Popen([sys.executable, "-c", ""])
+        proc.wait()
+
+        # Still held by an orphaned job
+        stale = os.path.join(self.dir, "implicit-%d.lock" % proc.pid)
+        f = open(stale, "w")
+        self.addCleanup(f.close)
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        JobLimiter(
+            makeflags="-j2 --jobserver-auth=%d,%d" % (read_fd, write_fd),
+            slots_dir=self.dir,
+        )
+
+        self.assertTrue(os.path.exists(stale))
+
+    def test_jobserver_without_slots_dir(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        # A file in the way of the slots directory
+        slots_dir = os.path.join(self.dir, "file", "jobs")
+        open(os.path.join(self.dir, "file"), "w").close()
+
+        with self.assertLogs("hooks.common.jobserver", "WARNING"):
+            limiter = JobLimiter(
+                makeflags="-j1 --jobserver-auth=%d,%d" % (read_fd, write_fd),
+                slots_dir=slots_dir,
+            )
+
+        # No token in the jobserver, the slots run without a limit
+        with limiter.slot(), limiter.slot():
+            pass
+
+        self.assertIsNone(limiter.read_fd)
+        self.assertIsNone(limiter.slots_dir)
+
+    def test_unusable_implicit_lock(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        limiter = JobLimiter(
+            makeflags="-j1 --jobserver-auth=%d,%d" % (read_fd, write_fd),
+            slots_dir=self.dir,
+        )
+
+        # The lock file can't be opened
+        os.makedirs(limiter.implicit_path)
+
+        with self.assertLogs("hooks.common.jobserver", "WARNING"):
+            with limiter.slot(), limiter.slot():
+                pass
+
+        self.assertIsNone(limiter.read_fd)
+
+    def test_unusable_slot_pool(self):
+        limiter = JobLimiter(makeflags="", slots=1, slots_dir=self.dir)
+
+        os.makedirs(os.path.join(self.dir, "slot-0.lock"))
+
+        with self.assertLogs("hooks.common.jobserver", "WARNING"):
+            with limiter.slot(), limiter.slot():
+                pass
+
+        self.assertIsNone(limiter.slots_dir)
+
+    def test_inherited_fds_missing(self):
+        limiter = JobLimiter(
+            makeflags="--jobserver-auth=1000,1001", slots=2, slots_dir=self.dir
+        )
+
+        self.assertIsNone(limiter.read_fd)
+        self.assertEqual(limiter.slots_dir, self.dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
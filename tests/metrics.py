@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import hooks.common.metrics as metrics
+from hooks.common.jobserver import job_slot
+from hooks.common.profiling import phase, profiled
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "hooks.prom")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _run(self, func, path=None):
+        @metrics.metered("test-hook")
+        @profiled
+        def main():
+            metrics.enable_metrics(path)
+
+            return func()
+
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop(metrics.METRICS_ENV, None)
+
+            try:
+                return main()
+            except SystemExit as e:
+                return e
+
+    def _read(self, path=None):
+        with open(path or self.path) as f:
+            return f.read()
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self._run(lambda: 0), 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_run_is_recorded(self):
+        def func():
+            with job_slot(), phase("subprocess"):
+                pass
+
+            metrics.inc("items_total", 3, kind="chart")
+
+            return 0
+
+        self._run(func, self.path)
+
+        samples = metrics.parse_samples(self._read())
+
+        self.assertEqual(
+            samples['pre_commit_hook_runs_total{hook="test-hook",status="0"}'], 1
+        )
+        self.assertEqual(
+            samples['pre_commit_hook_items_total{hook="test-hook",kind="chart"}'], 3
+        )
+        self.assertEqual(samples['pre_commit_hook_jobs_total{hook="test-hook"}'], 1)
+        self.assertIn(
+            'pre_commit_hook_phase_duration_seconds_total{hook="test-hook",'
+            'phase="subprocess"}',
+            samples,
+        )
+        self.assertIn("# TYPE pre_commit_hook_runs_total counter", self._read())
+
+    def test_counters_are_summed(self):
+        self._run(lambda: 0, self.path)
+        self._run(lambda: 0, self.path)
+        self._run(lambda: 1, self.path)
+
+        samples = metrics.parse_samples(self._read())
+
+        self.assertEqual(
+            samples['pre_commit_hook_runs_total{hook="test-hook",status="0"}'], 2
+        )
+        self.assertEqual(
+            samples['pre_commit_hook_runs_total{hook="test-hook",status="1"}'], 1
+        )
+
+    def test_gauges_are_replaced(self):
+        with open(self.path, "w") as f:
+            f.write(
+                'pre_commit_hook_last_run_timestamp_seconds{hook="test-hook"} 1\n'
+                'other_metric{a="b"} 5\n'
+            )
+
+        self._run(lambda: 0, self.path)
+
+        samples = metrics.parse_samples(self._read())
+
+        self.assertGreater(
+            samples['pre_commit_hook_last_run_timestamp_seconds{hook="test-hook"}'],
+            1,
+        )
+        self.assertEqual(samples['other_metric{a="b"}'], 5)
+
+    def test_exit_status_is_captured(self):
+        def func():
+            raise SystemExit(2)
+
+        result = self._run(func, self.path)
+
+        self.assertEqual(result.code, 2)
+        self.assertIn('status="2"', self._read())
+
+    def test_openmetrics(self):
+        path = os.path.join(self.dir, "hooks.om")
+
+        self._run(lambda: 0, path)
+
+        content = self._read(path)
+
+        self.assertTrue(content.endswith("# EOF\n"))
+        self.assertIn("# TYPE pre_commit_hook_runs counter", content)
+
+    def test_env_variable(self):
+        with patch.dict(os.environ, {metrics.METRICS_ENV: self.path}):
+            metrics.enable_metrics()
+
+        self.assertEqual(metrics.registry.path, self.path)
+
+        metrics.enable_metrics(None)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(
+            metrics.format_sample_key("m", {"a": 'x"y\\z'}), 'm{a="x\\"y\\\\z"}'
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from hooks.common.probes import probe
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestProbe(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bin_dir = os.path.join(self.dir, "bin")
+        self.tool = os.path.join(self.bin_dir, "tool")
+        self.plugin = os.path.join(self.dir, "plugin.yaml")
+
+        os.makedirs(self.bin_dir)
+        self._write(self.tool, "#!/bin/sh\n")
+        os.chmod(self.tool, stat.S_IRWXU)
+        self._write(self.plugin, "version: 1\n")
+
+        self.env = patch.dict(
+            os.environ,
+            {"PATH": self.bin_dir, "XDG_CACHE_HOME": os.path.join(self.dir, "cache")},
+        )
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _probe(self, run, **kwargs):
+        return probe("tool", "tool", run, extra_paths=[self.plugin], **kwargs)
+
+    def test_result_is_cached(self):
+        run = Mock(return_value={"version": "1.0"})
+
+        self.assertEqual(self._probe(run), {"version": "1.0"})
+        self.assertEqual(self._probe(run), {"version": "1.0"})
+        run.assert_called_once()
+
+    def test_changed_install_is_probed_again(self):
+        run = Mock(return_value={"version": "1.0"})
+
+        self._probe(run)
+        self._write(self.plugin, "version: 22\n")
+        self._probe(run)
+
+        self.assertEqual(run.call_count, 2)
+
+    def test_changed_environment_is_probed_again(self):
+        run = Mock(return_value={"version": "1.0"})
+
+        self._probe(run, env_keys=["TOOL_HOST"])
+
+        with patch.dict(os.environ, {"TOOL_HOST": "remote"}):
+            self._probe(run, env_keys=["TOOL_HOST"])
+
+        self.assertEqual(run.call_count, 2)
+
+    def test_expired_result_is_probed_again(self):
+        run = Mock(return_value={"version": "1.0"})
+
+        self._probe(run)
+        self._probe(run, max_age=0)
+
+        self.assertEqual(run.call_count, 2)
+
+    def test_failure_is_not_cached(self):
+        run = Mock(return_value=None)
+
+        self.assertIsNone(self._probe(run))
+        self.assertIsNone(self._probe(run))
+        self.assertEqual(run.call_count, 2)
+
+    def test_missing_binary_is_not_cached(self):
+        run = Mock(return_value={"version": "1.0"})
+
+        probe("missing", "missing-tool", run)
+        probe("missing", "missing-tool", run)
+
+        self.assertEqual(run.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
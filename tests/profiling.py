@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+import hooks.common.profiling as profiling
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _run(self, func, env=None):
+        stderr = io.StringIO()
+
+        with patch.dict(os.environ, env or {}, clear=False), redirect_stderr(stderr):
+            result = profiling.profiled(func)()
+
+        return result, stderr.getvalue()
+
+    def test_phases_are_accumulated(self):
+        def func():
+            for _ in range(3):
+                with profiling.phase("work"):
+                    pass
+
+            return profiling.profiler.phases
+
+        phases, stderr = self._run(func)
+
+        self.assertEqual(phases["work"][0], 3)
+        self.assertEqual(stderr, "")
+
+    def test_table_is_printed(self):
+        def func():
+            profiling.enable_profiling(True)
+
+            with profiling.phase("work"):
+                pass
+
+            return 0
+
+        result, stderr = self._run(func)
+
+        self.assertEqual(result, 0)
+        self.assertIn("startup", stderr)
+        self.assertIn("work", stderr)
+        self.assertIn("total", stderr)
+
+    def test_startup_excludes_recorded_phases(self):
+        def func():
+            profiling.profiler.start_wall -= 2.0
+
+            with patch.object(profiling, "get_process_age", return_value=5.0):
+                profiling.enable_profiling(True)
+
+            return profiling.profiler.phases
+
+        phases, _ = self._run(func)
+
+        self.assertAlmostEqual(phases["startup"][1], 3.0, places=1)
+
+    def test_json_output(self):
+        output = os.path.join(self.dir, "profile.json")
+
+        def func():
+            profiling.enable_profiling(output=output)
+
+            with profiling.phase("work"):
+                pass
+
+        self._run(func)
+
+        with open(output) as f:
+            data = json.load(f)
+
+        self.assertEqual(data["phases"]["work"]["calls"], 1)
+        self.assertIn("wall", data["total"])
+
+    def test_cprofile_output(self):
+        output = os.path.join(self.dir, "profile.prof")
+
+        def func():
+            profiling.enable_profiling(output=output)
+
+        self._run(func)
+
+        self.assertTrue(os.path.isfile(output))
+
+    def test_enabled_via_env(self):
+        output = os.path.join(self.dir, "profile.json")
+
+        self._run(profiling.enable_profiling, env={profiling.PROFILE_ENV: output})
+
+        self.assertTrue(os.path.isfile(output))
+
+    def test_report_when_function_raises(self):
+        def func():
+            profiling.enable_profiling(True)
+
+            raise SystemExit(1)
+
+        stderr = io.StringIO()
+
+        with redirect_stderr(stderr), self.assertRaises(SystemExit):
+            profiling.profiled(func)()
+
+        self.assertIn("total", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import logging
+import os
+import unittest
+from unittest.mock import patch
+
+from hooks.common.session_cache import SESSION_FILE, SessionCache
+from hooks.common.cache import CACHE_DIR_NAME
+
+from tests._git_fixture import GitRepoFixture
+
+log = logging.getLogger(__name__)
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.fixture = GitRepoFixture()
+        self.fixture.write(".version", "1.0.0\n")
+        self.fixture.add(".version")
+        self.fixture.commit("seed version")
+        self.fixture.create_branch("feature")
+        self.fixture.write("a.txt", "x\n")
+        self.fixture.add("a.txt")
+        self.fixture.commit("feat: add a")
+
+    def tearDown(self):
+        self.fixture.cleanup()
+
+    def _session(self, enabled=True):
+        repo = self.fixture.repo
+
+        return SessionCache(repo, self.fixture.main, repo.head, log, enabled=enabled)
+
+    def _cache_file(self):
+        return os.path.join(self.fixture.repo.git_dir, CACHE_DIR_NAME, SESSION_FILE)
+
+    def test_values_are_computed(self):
+        session = self._session()
+
+        self.assertEqual(
+            session.changed_paths(), {os.path.join(self.fixture.dir, "a.txt")}
+        )
+        self.assertEqual(
+            [subject for _, subject in session.commit_subjects()], ["feat: add a"]
+        )
+        self.assertEqual(session.file_content(".version"), "1.0.0\n")
+        self.assertIsNone(session.file_content("missing"))
+
+    def test_second_session_reads_from_file(self):
+        session = self._session()
+        session.changed_paths()
+        commits = list(session.commit_subjects())
+        session.file_content(".version")
+        session.save()
+
+        self.assertTrue(os.path.isfile(self._cache_file()))
+
+        with patch(
+            "hooks.common.session_cache.changed_paths_since_main"
+        ) as mock_changed, patch(
+            "hooks.common.session_cache.iter_commit_subjects"
+        ) as mock_iter, patch(
+            "hooks.common.session_cache.get_file_content"
+        ) as mock_content:
+            session = self._session()
+
+            self.assertEqual(list(session.commit_subjects()), commits)
+            self.assertEqual(session.file_content(".version"), "1.0.0\n")
+
+            # The changed paths depend on the working tree so they are not
+            # stored in the file
+            session.changed_paths()
+
+            mock_changed.assert_called_once()
+            mock_iter.assert_not_called()
+            mock_content.assert_not_called()
+
+    def test_index_change_invalidates(self):
+        session = self._session()
+        session.changed_paths()
+        session.save()
+
+        self.fixture.write("b.txt", "y\n")
+        self.fixture.add("b.txt")
+
+        session = self._session()
+
+        self.assertIn(os.path.join(self.fixture.dir, "b.txt"), session.changed_paths())
+
+    def test_unstaged_change_is_seen(self):
+        session = self._session()
+        session.changed_paths()
+        session.save()
+
+        # Unstaged change of a tracked file
+        self.fixture.write(".version", "1.0.1\n")
+
+        session = self._session()
+
+        self.assertIn(
+            os.path.join(self.fixture.dir, ".version"), session.changed_paths()
+        )
+
+    def test_head_change_invalidates(self):
+        session = self._session()
+        list(session.commit_subjects())
+        session.save()
+
+        self.fixture.write("b.txt", "y\n")
+        self.fixture.add("b.txt")
+        self.fixture.commit("fix: add b")
+
+        session = self._session()
+
+        self.assertEqual(
+            [subject for _, subject in session.commit_subjects()],
+            ["fix: add b", "feat: add a"],
+        )
+
+    def test_partial_walk_is_not_cached(self):
+        session = self._session()
+        next(session.commit_subjects())
+
+        self.assertNotIn("commit_subjects", session.data)
+
+    def test_disabled_does_not_write(self):
+        session = self._session(enabled=False)
+        session.changed_paths()
+        session.save()
+
+        self.assertFalse(os.path.exists(self._cache_file()))
+
+    def test_unwritable_cache_dir(self):
+        # The lock file can't be opened (also as root)
+        os.makedirs(self._cache_file() + ".lock")
+
+        session = self._session()
+
+        self.assertFalse(session.enabled)
+        self.assertEqual(session.file_content(".version"), "1.0.0\n")
+
+        session.save()
+
+    def test_cache_dir_unwritable_on_save(self):
+        session = self._session()
+        session.file_content(".version")
+
+        os.remove(self._cache_file() + ".lock")
+        os.makedirs(self._cache_file() + ".lock")
+
+        session.save()
+
+        self.assertTrue(session.dirty)
+        self.assertFalse(os.path.exists(self._cache_file()))
+
+
+if __name__ == "__main__":
+    unittest.main()
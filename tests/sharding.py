@@ -0,0 +1,81 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from hooks.common.sharding import (
+    load_durations,
+    parse_shard,
+    partition,
+    select_shard,
+    write_shard_report,
+)
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = logging.getLogger(__name__)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/3"), (2, 3))
+
+        for value in ("0/3", "4/3", "1", "a/b", "1/0"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(value)
+
+    def test_partition_covers_all_items_once(self):
+        keys = ["item-%02d" % i for i in range(17)]
+        shards = partition(keys, 4)
+
+        self.assertEqual(sorted(sum(shards, [])), keys)
+        self.assertEqual([len(s) for s in shards], [5, 4, 4, 4])
+
+    def test_partition_is_deterministic(self):
+        keys = ["c", "a", "b", "d"]
+
+        self.assertEqual(partition(keys, 2), partition(list(reversed(keys)), 2))
+
+    def test_partition_is_balanced_by_durations(self):
+        durations = {"slow": 90, "a": 10, "b": 10, "c": 10}
+
+        self.assertEqual(
+            partition(["a", "b", "c", "slow"], 2, durations),
+            [["slow"], ["a", "b", "c"]],
+        )
+
+    def test_select_shard(self):
+        items = ["charts/b", "charts/a", "charts/c"]
+        selected = [select_shard(items, (i, 2), self.dir, {}, self.log) for i in (1, 2)]
+
+        self.assertEqual(sorted(selected[0] + selected[1]), sorted(items))
+        # The original order is kept
+        self.assertEqual(selected[0], [i for i in items if i in selected[0]])
+
+    def test_report_round_trip(self):
+        report = os.path.join(self.dir, "report.json")
+        item = os.path.join(self.dir, "charts", "a")
+
+        write_shard_report(report, (1, 2), {item: 1.5, "other": None}, self.dir)
+
+        with open(report) as f:
+            self.assertEqual(json.load(f)["shard"], "1/2")
+
+        invalid = os.path.join(self.dir, "invalid.json")
+
+        with self.assertLogs(self.log, level="WARNING"):
+            durations = load_durations([report, invalid], self.log)
+
+        self.assertEqual(durations, {os.path.join("charts", "a"): 1.5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import hooks.common.shell_graph as shell_graph
+from hooks.common.shell_graph import find_affected_files, parse_references
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestParseReferences(unittest.TestCase):
+    def test_references(self):
+        content = (
+            "#!/bin/bash\n"
+            "# source commented.sh\n"
+            "source lib/common.sh\n"
+            '  . "$(dirname "$0")/env.sh"\n'
+            "[ -f x ] && source ./x.sh\n"
+            "if true; then . 'quoted.sh'; fi\n"
+            "./not-sourced.sh\n"
+            "load test_helper\n"
+        )
+
+        self.assertEqual(
+            parse_references(content),
+            [
+                ["source", "lib/common.sh"],
+                [".", "$(dirname $0)/env.sh"],
+                ["source", "./x.sh"],
+                [".", "quoted.sh"],
+                ["load", "test_helper"],
+            ],
+        )
+
+
+class TestFindAffectedFiles(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.dir, ".git")
+        self.log = logging.getLogger(__name__)
+
+        os.makedirs(self.git_dir)
+
+        self._write("lib/common.sh", "log() { :; }\n")
+        self._write("lib/net.sh", 'source "${BASH_SOURCE%/*}/common.sh"\n')
+        self._write("scripts/a.sh", '. "$(dirname "$0")/../lib/net.sh"\n')
+        self._write("scripts/b.sh", 'source "$LIB_DIR/common.sh"\n')
+        self._write("scripts/c.sh", "echo standalone\n")
+        self._write("tests/test_helper.bash", "source lib/common.sh\n")
+        self._write("tests/c.bats", "load test_helper\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, rel_path, content):
+        path = os.path.join(self.dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _affected(self, changed):
+        affected = find_affected_files(changed, self.dir, self.log, self.git_dir)
+
+        return sorted(os.path.relpath(p, self.dir) for p in affected)
+
+    def test_transitive_dependents(self):
+        self.assertEqual(
+            self._affected(["lib/common.sh"]),
+            [
+                "lib/common.sh",
+                "lib/net.sh",
+                "scripts/a.sh",
+                "scripts/b.sh",
+                "tests/c.bats",
+                "tests/test_helper.bash",
+            ],
+        )
+
+    def test_leaf_change(self):
+        self.assertEqual(self._affected(["scripts/c.sh"]), ["scripts/c.sh"])
+
+    def test_index_is_incremental(self):
+        self._affected(["lib/common.sh"])
+
+        with patch.object(
+            shell_graph, "parse_references", wraps=shell_graph.parse_references
+        ) as mock_parse:
+            self.assertEqual(
+                self._affected(["lib/net.sh"]), ["lib/net.sh", "scripts/a.sh"]
+            )
+            mock_parse.assert_not_called()
+
+            self._write("scripts/c.sh", "source lib/net.sh\n")
+
+            self.assertEqual(
+                self._affected(["lib/net.sh"]),
+                ["lib/net.sh", "scripts/a.sh", "scripts/c.sh"],
+            )
+            mock_parse.assert_called_once()
+
+    def test_without_cache(self):
+        affected = find_affected_files(["lib/net.sh"], self.dir, self.log)
+
+        self.assertIn(os.path.join(self.dir, "scripts/a.sh"), affected)
+        self.assertFalse(os.listdir(self.git_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ruamel.yaml import YAML
+
+import hooks.common.suite_index as suite_index
+from hooks.common.suite_index import SuiteIndex, parse_suite, select_suites
+
+from tests import _cache_fixture  # noqa: F401
+
+
+class TestParseSuite(unittest.TestCase):
+    def test_parse(self):
+        yaml = YAML(typ="safe")
+
+        # Test cases
+        tests = {
+            "templates": (
+                "templates:\n"
+                "  - templates/deployment.yaml\n"
+                "  - config/*.yaml\n"
+                "values:\n"
+                "  - ../values/prod.yaml\n"
+                "tests:\n"
+                "  - it: works\n"
+                "    values:\n"
+                "      - extra.yaml\n",
+                [
+                    ["config/*.yaml", "deployment.yaml"],
+                    ["../values/prod.yaml", "extra.yaml"],
+                ],
+            ),
+            "all templates": ("suite: all\ntests: []\n", [None, []]),
+            "one document without templates": (
+                "templates: [a.yaml]\n---\nsuite: all\n",
+                [None, []],
+            ),
+            "invalid": ("templates: [\n", [None, []]),
+        }
+
+        for name, (content, expected) in tests.items():
+            with self.subTest(name=name):
+                self.assertEqual(parse_suite(content, yaml), expected)
+
+
+class TestSelectSuites(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.dir, ".git")
+        self.chart_dir = os.path.join(self.dir, "charts", "app")
+        self.log = logging.getLogger(__name__)
+
+        os.makedirs(self.git_dir)
+
+        for name in ("Chart.yaml", "values.yaml"):
+            self._write(name, "")
+
+        for name in ("deployment.yaml", "service.yaml", "_helpers.tpl"):
+            self._write("templates/" + name, "")
+
+        self._write(
+            "tests/unittest/deployment_test.yaml",
+            "templates:\n  - templates/deployment.yaml\n"
+            "values:\n  - ../values/prod.yaml\n",
+        )
+        self._write("tests/unittest/service_test.yaml", "templates: [service.yaml]\n")
+        self._write("tests/unittest/all_test.yaml", "suite: all templates\n")
+        self._write("tests/unittest/__snapshot__/service_test.yaml.snap", "")
+        self._write("tests/values/prod.yaml", "")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, rel_path, content):
+        path = os.path.join(self.chart_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _select(self, changed):
+        index = SuiteIndex(self.dir, self.log, self.git_dir)
+        selected = select_suites(
+            self.chart_dir,
+            [os.path.join(self.chart_dir, f) for f in changed],
+            "tests/unittest",
+            "*.yaml",
+            index,
+            self.log,
+        )
+        index.save()
+
+        return selected
+
+    def test_select(self):
+        # Test cases
+        tests = {
+            "template": (
+                ["templates/service.yaml"],
+                ["tests/unittest/all_test.yaml", "tests/unittest/service_test.yaml"],
+            ),
+            "suite": (
+                ["tests/unittest/deployment_test.yaml"],
+                ["tests/unittest/deployment_test.yaml"],
+            ),
+            "values": (
+                ["tests/values/prod.yaml"],
+                ["tests/unittest/deployment_test.yaml"],
+            ),
+            "snapshot": (
+                ["tests/unittest/__snapshot__/service_test.yaml.snap"],
+                ["tests/unittest/service_test.yaml"],
+            ),
+            "helper": (["templates/_helpers.tpl"], None),
+            "chart values": (["templates/service.yaml", "values.yaml"], None),
+            "chart metadata": (["Chart.yaml"], None),
+            "no chart file": ([], None),
+        }
+
+        for name, (changed, expected) in tests.items():
+            with self.subTest(name=name):
+                self.assertEqual(self._select(changed), expected)
+
+    def test_index_is_cached(self):
+        self._select(["templates/service.yaml"])
+
+        with patch.object(
+            suite_index, "parse_suite", wraps=suite_index.parse_suite
+        ) as mock_parse:
+            self._select(["templates/service.yaml"])
+            mock_parse.assert_not_called()
+
+            self._write("tests/unittest/all_test.yaml", "templates: [other.yaml]\n")
+
+            self.assertEqual(
+                self._select(["templates/service.yaml"]),
+                ["tests/unittest/service_test.yaml"],
+            )
+            mock_parse.assert_called_once()
+
+    def test_checked_suites_until_invalidated(self):
+        index = SuiteIndex(self.dir, self.log)
+        suite = os.path.join(self.chart_dir, "tests/unittest/all_test.yaml")
+
+        self.assertEqual(index.get(suite), [None, []])
+
+        self._write("tests/unittest/all_test.yaml", "templates: [other.yaml]\n")
+
+        # The suite isn't checked again until it's reported as changed
+        self.assertEqual(index.get(suite), [None, []])
+
+        index.invalidate([suite])
+
+        self.assertEqual(index.get(suite), [["other.yaml"], []])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from hooks.common.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    iter_changes,
+    open_watcher,
+)
+
+from tests import _cache_fixture  # noqa: F401
+
+log = logging.getLogger(__name__)
+
+
+class WatcherTests:
+    """Tests shared by all watchers."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.dir, "charts")
+
+        self._write("charts/foo/Chart.yaml", "version: 1.0.0\n")
+        self._write(".git/HEAD", "ref: refs/heads/main\n")
+
+        self.watcher = self._watcher([self.dir])
+        self.addCleanup(self.watcher.close)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, rel_path, content):
+        path = os.path.join(self.dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as f:
+            f.write(content)
+
+        return path
+
+    def _changes(self):
+        self.assertTrue(self.watcher.wait(5))
+
+        return next(iter_changes(self.watcher, debounce=0.1))
+
+    def test_no_change(self):
+        # Changes in the hidden directories are ignored
+        self._write(".git/HEAD", "ref: refs/heads/feature\n")
+
+        self.assertFalse(self.watcher.wait(0.2))
+
+    def test_changed_files(self):
+        changed = self._write("charts/foo/Chart.yaml", "version: 1.0.1\n")
+        created = self._write("charts/foo/templates/new/x.yaml", "x: 1\n")
+
+        self.assertEqual(self._changes(), {changed, created})
+
+    def test_removed_file(self):
+        path = os.path.join(self.root, "foo", "Chart.yaml")
+        os.remove(path)
+
+        self.assertEqual(self._changes(), {path})
+
+    def test_shallow_roots(self):
+        self.watcher = self._watcher([], [self.dir])
+        self.addCleanup(self.watcher.close)
+
+        self._write("charts/foo/Chart.yaml", "version: 1.0.1\n")
+        self.assertFalse(self.watcher.wait(0.2))
+
+        path = self._write("install.sh", "")
+        self.assertEqual(self._changes(), {path})
+
+
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    def _watcher(self, roots, shallow_roots=()):
+        try:
+            return InotifyWatcher(roots, shallow_roots)
+        except OSError as e:
+            self.skipTest("inotify is not available: %s" % e)
+
+    def test_only_non_hidden_dirs_are_watched(self):
+        self.assertEqual(
+            sorted(self.watcher.dirs.values()),
+            [self.dir, self.root, os.path.join(self.root, "foo")],
+        )
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    def _watcher(self, roots, shallow_roots=()):
+        return PollingWatcher(roots, shallow_roots, interval=0.05, max_interval=0.2)
+
+    def test_backoff(self):
+        self.assertFalse(self.watcher.wait(0.3))
+        self.assertEqual(self.watcher.interval, 0.2)
+
+        self._write("charts/foo/Chart.yaml", "version: 1.0.1\n")
+        self.assertTrue(self.watcher.wait(1))
+
+        # Polling is fast again after a change
+        self.assertEqual(self.watcher.interval, 0.05)
+
+
+class TestOpenWatcher(unittest.TestCase):
+    def test_fallback(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+        with patch("hooks.common.watch.InotifyWatcher", side_effect=OSError("ENOSPC")):
+            watcher = open_watcher([root], log)
+
+        self.assertIsInstance(watcher, PollingWatcher)
+
+
+if __name__ == "__main__":
+    unittest.main()